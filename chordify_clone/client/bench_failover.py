@@ -0,0 +1,130 @@
+# bench_failover.py
+#
+# Kill-a-node benchmark: starts a local ring, loads it with keys, keeps
+# querying it and SIGKILLs one server half way through. Reports how long
+# lookups kept failing and how slow they got while the ring routed around
+# the dead node.
+#
+# Example:
+#   python bench_failover.py --nodes 10 --replication-factor 3 --consistency l
+
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from cli import send_request
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server")
+
+def start_ring(args, workdir):
+    procs = {}
+    for i in range(args.nodes):
+        port = args.base_port + i
+        cmd = [sys.executable, os.path.join(SERVER_DIR, "main.py"),
+               "--port", str(port),
+               "--replication-factor", str(args.replication_factor),
+               "--replication-consistency", args.consistency,
+               "--connect-timeout", str(args.connect_timeout),
+               "--read-timeout", str(args.read_timeout),
+               "--stabilize-interval", str(args.stabilize_interval)]
+        if i > 0:
+            cmd += ["--bootstrap-host", "127.0.0.1", "--bootstrap-port", str(args.base_port)]
+        log = open(os.path.join(workdir, f"{port}.log"), "w")
+        procs[port] = subprocess.Popen(cmd, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+        time.sleep(1 if i == 0 else 0.3)
+    return procs
+
+def wait_for_ring(args, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        overlay = send_request("127.0.0.1", args.base_port, {"cmd": "GET_OVERLAY"}).get("overlay", [])
+        if len(overlay) == args.nodes:
+            return True
+        time.sleep(0.5)
+    return False
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+def summarize(samples):
+    latencies = [lat for _, lat, _ in samples]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, _, ok in samples if not ok),
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies) if latencies else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure lookups while a node is killed")
+    parser.add_argument("--nodes", type=int, default=10)
+    parser.add_argument("--base-port", dest="base_port", type=int, default=7000)
+    parser.add_argument("--replication-factor", dest="replication_factor", type=int, default=3)
+    parser.add_argument("--consistency", type=str, default="l")
+    parser.add_argument("--keys", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of querying")
+    parser.add_argument("--kill-after", dest="kill_after", type=float, default=5.0, help="Seconds of querying before the kill")
+    parser.add_argument("--victim", type=int, default=None, help="Index of the node to kill (default: random, never the bootstrap)")
+    parser.add_argument("--connect-timeout", dest="connect_timeout", type=float, default=1.0)
+    parser.add_argument("--read-timeout", dest="read_timeout", type=float, default=5.0)
+    parser.add_argument("--stabilize-interval", dest="stabilize_interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    victim_port = args.base_port + (args.victim if args.victim is not None else rng.randrange(1, args.nodes))
+    workdir = tempfile.mkdtemp(prefix="chord-failover-")
+    procs = start_ring(args, workdir)
+    try:
+        if not wait_for_ring(args):
+            print(json.dumps({"error": "ring did not form", "logs": workdir}))
+            return
+
+        keys = [f"song-{i}" for i in range(args.keys)]
+        live_ports = [p for p in procs if p != victim_port]
+        for key in keys:
+            send_request("127.0.0.1", rng.choice(live_ports), {"cmd": "PUT", "key": key, "value": "v"})
+
+        samples = []  # (seconds since start, latency ms, ok)
+        start = time.time()
+        killed_at = None
+        while time.time() - start < args.duration:
+            if killed_at is None and time.time() - start >= args.kill_after:
+                procs[victim_port].send_signal(signal.SIGKILL)
+                killed_at = time.time() - start
+            t0 = time.perf_counter()
+            resp = send_request("127.0.0.1", rng.choice(live_ports), {"cmd": "GET", "key": rng.choice(keys)})
+            latency = (time.perf_counter() - t0) * 1000
+            samples.append((time.time() - start, latency, bool(resp.get("value"))))
+
+        before = [s for s in samples if s[0] < killed_at]
+        after = [s for s in samples if s[0] >= killed_at]
+        failures_after = [t for t, _, ok in after if not ok]
+        print(json.dumps({
+            "nodes": args.nodes,
+            "replication_factor": args.replication_factor,
+            "consistency": args.consistency,
+            "victim_port": victim_port,
+            "killed_at_s": round(killed_at, 3),
+            # Time from the kill until the last failed lookup
+            "recovery_s": round(failures_after[-1] - killed_at, 3) if failures_after else 0.0,
+            "before_kill": summarize(before),
+            "after_kill": summarize(after),
+            "logs": workdir,
+        }, indent=2))
+    finally:
+        for proc in procs.values():
+            if proc.poll() is None:
+                proc.kill()
+
+if __name__ == "__main__":
+    main()
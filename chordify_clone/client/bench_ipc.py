@@ -0,0 +1,132 @@
+# bench_ipc.py
+#
+# Node-to-node traffic over Unix sockets versus TCP. Starts a local ring
+# twice, once as usual (nodes on this host reach each other through their
+# Unix sockets, see server/transport.py) and once with --no-ipc (loopback
+# TCP, a handshake per message), and drives each in closed loop with pooled
+# connections (see loadgen.py). The load generator itself talks TCP in both
+# cases, so the difference is the hops inside the ring: lookups, forwards
+# and the replication chain. Reports throughput, latency percentiles and
+# how many peer requests went over a Unix socket.
+#
+# Example:
+#   python bench_ipc.py --nodes 5 --replication-factor 3 --concurrency 16 --duration 15
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from cli import send_request
+from loadgen import ConnectionPool, Recorder, run_closed, percentile
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server")
+
+def start_ring(args, workdir, extra):
+    procs = {}
+    for i in range(args.nodes):
+        port = args.base_port + i
+        cmd = [sys.executable, os.path.join(SERVER_DIR, "main.py"),
+               "--port", str(port),
+               "--ipc-dir", workdir,
+               "--replication-factor", str(args.replication_factor),
+               "--replication-consistency", args.consistency] + extra
+        if i > 0:
+            cmd += ["--bootstrap-host", "127.0.0.1", "--bootstrap-port", str(args.base_port)]
+        log = open(os.path.join(workdir, f"{port}.log"), "w")
+        procs[port] = subprocess.Popen(cmd, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+        time.sleep(1 if i == 0 else 0.3)
+    return procs
+
+def wait_for_ring(args, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        overlay = send_request("127.0.0.1", args.base_port, {"cmd": "GET_OVERLAY"}).get("overlay", [])
+        if len(overlay) == args.nodes:
+            return True
+        time.sleep(0.5)
+    return False
+
+def workload(args, rng, keys, count):
+    ports = [args.base_port + i for i in range(args.nodes)]
+    ops = []
+    for _ in range(count):
+        key = rng.choice(keys)
+        if rng.random() < args.write_ratio:
+            ops.append((rng.choice(ports), {"cmd": "PUT", "key": key, "value": f"v{rng.randrange(1000)}"}))
+        else:
+            ops.append((rng.choice(ports), {"cmd": "GET", "key": key}))
+    return ops
+
+def peer_requests(args):
+    """Requests the nodes sent to each other, and how many of them over a Unix socket."""
+    totals = {"sent": 0, "ipc": 0}
+    for i in range(args.nodes):
+        stats = send_request("127.0.0.1", args.base_port + i, {"cmd": "STATS", "reset": True}).get("stats", {})
+        totals["sent"] += sum(h["count"] for name, h in stats.get("histograms", {}).items() if name.startswith("send."))
+        totals["ipc"] += stats.get("counters", {}).get("peer_ipc_requests", 0)
+    return totals
+
+def run_mode(args, mode):
+    workdir = tempfile.mkdtemp(prefix=f"chord-ipc-{mode}-")
+    procs = start_ring(args, workdir, ["--no-ipc"] if mode == "tcp" else [])
+    try:
+        if not wait_for_ring(args):
+            return {"mode": mode, "error": "ring did not form", "logs": workdir}
+        rng = random.Random(args.seed)
+        keys = [f"song-{i}" for i in range(args.keys)]
+        for key in keys:
+            send_request("127.0.0.1", args.base_port + rng.randrange(args.nodes), {"cmd": "PUT", "key": key, "value": "v"})
+        peer_requests(args)
+
+        # Enough operations that the duration, not the list, ends the run
+        ops = workload(args, rng, keys, args.concurrency * 20000)
+        pool = ConnectionPool("127.0.0.1", args.timeout)
+        recorder = Recorder()
+        start = time.perf_counter()
+        run_closed(ops, pool, recorder, args.concurrency, args.duration)
+        elapsed = time.perf_counter() - start
+        pool.close()
+        latencies = sorted(recorder.latencies)
+        return {
+            "mode": mode,
+            "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            "latency_ms": {p: round(percentile(latencies, q), 2) if latencies else None
+                           for p, q in (("p50", 50), ("p99", 99), ("max", 100))},
+            "errors": recorder.errors,
+            "peer_requests": peer_requests(args),
+            "logs": workdir,
+        }
+    finally:
+        for proc in procs.values():
+            if proc.poll() is None:
+                proc.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of a local ring with node-to-node traffic over Unix sockets and over TCP")
+    parser.add_argument("--nodes", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=["tcp", "ipc"], choices=["tcp", "ipc"])
+    parser.add_argument("--base-port", dest="base_port", type=int, default=7400)
+    parser.add_argument("--replication-factor", dest="replication_factor", type=int, default=3)
+    parser.add_argument("--consistency", type=str, default="l")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--keys", type=int, default=500)
+    parser.add_argument("--write-ratio", dest="write_ratio", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    report = [run_mode(args, mode) for mode in args.modes]
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    print(out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# bench_overload.py
+#
+# Overload benchmark: starts a local ring, then offers it open-loop load at
+# increasing rates, with admission control (see server/admission.py) and
+# without it. Reports per rate the goodput, the latency of the requests
+# that succeeded, how many were shed with BUSY, timed out or failed, and
+# what the servers' admission counters saw.
+#
+# Example:
+#   python bench_overload.py --nodes 5 --rates 200 500 1000 2000 --duration 10
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from cli import send_request
+from loadgen import ConnectionPool, Recorder, run_open, percentile
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server")
+
+def start_ring(args, workdir, extra):
+    procs = {}
+    for i in range(args.nodes):
+        port = args.base_port + i
+        cmd = [sys.executable, os.path.join(SERVER_DIR, "main.py"),
+               "--port", str(port),
+               "--replication-factor", str(args.replication_factor),
+               "--replication-consistency", args.consistency] + extra
+        if i > 0:
+            cmd += ["--bootstrap-host", "127.0.0.1", "--bootstrap-port", str(args.base_port)]
+        log = open(os.path.join(workdir, f"{port}.log"), "w")
+        procs[port] = subprocess.Popen(cmd, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+        time.sleep(1 if i == 0 else 0.3)
+    return procs
+
+def wait_for_ring(args, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        overlay = send_request("127.0.0.1", args.base_port, {"cmd": "GET_OVERLAY"}).get("overlay", [])
+        if len(overlay) == args.nodes:
+            return True
+        time.sleep(0.5)
+    return False
+
+def workload(args, rng, keys, count):
+    """(port, request) pairs: reads and writes of random keys on random nodes."""
+    ports = [args.base_port + i for i in range(args.nodes)]
+    ops = []
+    for _ in range(count):
+        key = rng.choice(keys)
+        if rng.random() < args.write_ratio:
+            ops.append((rng.choice(ports), {"cmd": "PUT", "key": key, "value": f"v{rng.randrange(1000)}"}))
+        else:
+            ops.append((rng.choice(ports), {"cmd": "GET", "key": key}))
+    return ops
+
+def admission_totals(args):
+    totals = {"rejected": {}, "busy_retries": 0}
+    for i in range(args.nodes):
+        resp = send_request("127.0.0.1", args.base_port + i, {"cmd": "STATS", "reset": True}, busy_retries=0)
+        for cls, n in resp.get("admission", {}).get("rejected", {}).items():
+            totals["rejected"][cls] = totals["rejected"].get(cls, 0) + n
+        totals["busy_retries"] += sum(n for name, n in resp.get("stats", {}).get("counters", {}).items()
+                                      if name.startswith("busy_retries"))
+    return totals
+
+def run_rate(args, rng, keys, rate):
+    ops = workload(args, rng, keys, int(rate * args.duration))
+    pool = ConnectionPool("127.0.0.1", args.timeout)
+    recorder = Recorder()
+    start = time.perf_counter()
+    run_open(ops, pool, recorder, rate, args.duration, args.max_inflight, args.seed, args.busy_retries)
+    elapsed = time.perf_counter() - start
+    pool.close()
+    latencies = sorted(recorder.latencies)
+    return {
+        "offered_rps": rate,
+        "goodput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {p: round(percentile(latencies, q), 2) if latencies else None
+                       for p, q in (("p50", 50), ("p99", 99), ("max", 100))},
+        "errors": recorder.errors,
+        "busy_retries": recorder.busy_retries,
+        "elapsed_s": round(elapsed, 2),
+    }
+
+def run_mode(args, mode):
+    extra = ["--max-requests", str(args.max_requests if mode == "admission" else 0)]
+    if mode == "admission":
+        # Without a ring secret the nodes turn admission control off
+        extra += ["--client-queue", str(args.client_queue), "--ring-secret", "bench-overload"]
+    workdir = tempfile.mkdtemp(prefix=f"chord-overload-{mode}-")
+    procs = start_ring(args, workdir, extra)
+    try:
+        if not wait_for_ring(args):
+            return {"mode": mode, "error": "ring did not form", "logs": workdir}
+        rng = random.Random(args.seed)
+        keys = [f"song-{i}" for i in range(args.keys)]
+        for key in keys:
+            send_request("127.0.0.1", args.base_port + rng.randrange(args.nodes), {"cmd": "PUT", "key": key, "value": "v"})
+        admission_totals(args)
+        rates = []
+        for rate in args.rates:
+            result = run_rate(args, rng, keys, rate)
+            result["servers"] = admission_totals(args)
+            rates.append(result)
+            # Let queues drain before the next rate
+            time.sleep(args.pause)
+        return {"mode": mode, "rates": rates, "logs": workdir}
+    finally:
+        for proc in procs.values():
+            if proc.poll() is None:
+                proc.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description="Goodput and latency of a ring pushed past its capacity")
+    parser.add_argument("--nodes", type=int, default=5)
+    parser.add_argument("--base-port", dest="base_port", type=int, default=7100)
+    parser.add_argument("--replication-factor", dest="replication_factor", type=int, default=3)
+    parser.add_argument("--consistency", type=str, default="l")
+    parser.add_argument("--modes", nargs="+", default=["admission", "unlimited"], choices=["admission", "unlimited"])
+    parser.add_argument("--rates", type=float, nargs="+", default=[200, 500, 1000, 2000], help="Offered requests per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per rate")
+    parser.add_argument("--pause", type=float, default=3.0, help="Seconds between two rates")
+    parser.add_argument("--keys", type=int, default=200)
+    parser.add_argument("--write-ratio", dest="write_ratio", type=float, default=0.2)
+    parser.add_argument("--max-requests", dest="max_requests", type=int, default=64, help="Server --max-requests in admission mode")
+    parser.add_argument("--client-queue", dest="client_queue", type=int, default=128, help="Server --client-queue in admission mode")
+    parser.add_argument("--busy-retries", dest="busy_retries", type=int, default=0, help="Client retries of BUSY answers")
+    parser.add_argument("--max-inflight", dest="max_inflight", type=int, default=512)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    report = [run_mode(args, mode) for mode in args.modes]
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    print(out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# bench_workers.py
+#
+# Throughput of a local ring as every node runs more worker processes
+# (server/main.py --workers). For each worker count, starts --nodes nodes,
+# stores --keys keys, then drives the ring in closed loop with pooled
+# connections (see loadgen.py) and reports requests per second and latency
+# percentiles. A worker hosts --vnodes positions of its own, so the ring
+# has nodes * workers * vnodes positions; use --vnodes-total to keep that
+# constant and only change how many processes serve them.
+#
+# The gain is bounded by the cores of the machine: with one core, more
+# workers only add the cost of relaying between them.
+#
+# Example:
+#   python bench_workers.py --nodes 2 --workers 1 2 4 --concurrency 32 --duration 15
+
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from cli import send_request
+from loadgen import ConnectionPool, Recorder, run_closed, percentile
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server")
+
+def start_ring(args, workers, vnodes, workdir):
+    procs = {}
+    for i in range(args.nodes):
+        port = args.base_port + i
+        cmd = [sys.executable, os.path.join(SERVER_DIR, "main.py"),
+               "--port", str(port),
+               "--workers", str(workers),
+               "--vnodes", str(vnodes),
+               "--ipc-dir", workdir,
+               "--replication-factor", str(args.replication_factor),
+               "--replication-consistency", args.consistency]
+        if i > 0:
+            cmd += ["--bootstrap-host", "127.0.0.1", "--bootstrap-port", str(args.base_port)]
+        log = open(os.path.join(workdir, f"{port}.log"), "w")
+        procs[port] = subprocess.Popen(cmd, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+        time.sleep(1 if i == 0 else 0.3)
+    return procs
+
+def stop_ring(procs):
+    # SIGINT so that worker 0 takes its workers down with it
+    for proc in procs.values():
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGINT)
+    for proc in procs.values():
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def wait_for_ring(args, positions, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        overlay = send_request("127.0.0.1", args.base_port, {"cmd": "GET_OVERLAY"}).get("overlay", [])
+        if len(overlay) == positions:
+            return True
+        time.sleep(0.5)
+    return False
+
+def workload(args, rng, keys, count):
+    ports = [args.base_port + i for i in range(args.nodes)]
+    ops = []
+    for _ in range(count):
+        key = rng.choice(keys)
+        if rng.random() < args.write_ratio:
+            ops.append((rng.choice(ports), {"cmd": "PUT", "key": key, "value": f"v{rng.randrange(1000)}"}))
+        else:
+            ops.append((rng.choice(ports), {"cmd": "GET", "key": key}))
+    return ops
+
+def run_workers(args, workers):
+    if args.vnodes_total:
+        vnodes = max(1, args.vnodes_total // workers)
+    else:
+        vnodes = args.vnodes
+    positions = args.nodes * workers * vnodes
+    workdir = tempfile.mkdtemp(prefix=f"chord-workers-{workers}-")
+    procs = start_ring(args, workers, vnodes, workdir)
+    try:
+        if not wait_for_ring(args, positions):
+            return {"workers": workers, "error": "ring did not form", "logs": workdir}
+        rng = random.Random(args.seed)
+        keys = [f"song-{i}" for i in range(args.keys)]
+        for key in keys:
+            send_request("127.0.0.1", args.base_port + rng.randrange(args.nodes), {"cmd": "PUT", "key": key, "value": "v"})
+
+        # Enough operations that the duration, not the list, ends the run
+        ops = workload(args, rng, keys, args.concurrency * 20000)
+        pool = ConnectionPool("127.0.0.1", args.timeout)
+        recorder = Recorder()
+        start = time.perf_counter()
+        run_closed(ops, pool, recorder, args.concurrency, args.duration)
+        elapsed = time.perf_counter() - start
+        pool.close()
+        latencies = sorted(recorder.latencies)
+        return {
+            "workers": workers,
+            "vnodes_per_worker": vnodes,
+            "positions": positions,
+            "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            "latency_ms": {p: round(percentile(latencies, q), 2) if latencies else None
+                           for p, q in (("p50", 50), ("p99", 99), ("max", 100))},
+            "errors": recorder.errors,
+            "cpus": os.cpu_count(),
+            "logs": workdir,
+        }
+    finally:
+        stop_ring(procs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of a ring as the worker processes per node grow")
+    parser.add_argument("--nodes", type=int, default=2)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to compare")
+    parser.add_argument("--vnodes", type=int, default=1, help="Vnodes per worker")
+    parser.add_argument("--vnodes-total", dest="vnodes_total", type=int, default=0,
+                        help="Vnodes per node, split over its workers (overrides --vnodes)")
+    parser.add_argument("--base-port", dest="base_port", type=int, default=7300)
+    parser.add_argument("--replication-factor", dest="replication_factor", type=int, default=1)
+    parser.add_argument("--consistency", type=str, default="l")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--keys", type=int, default=500)
+    parser.add_argument("--write-ratio", dest="write_ratio", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    report = [run_workers(args, workers) for workers in args.workers]
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    print(out)
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,60 @@
 import argparse
 import json
+import os
 import socket
+import tempfile
+import time
+import zlib
 from pprint import pprint
 
 BUFF_SIZE = 1024
+# Times a request the node answered BUSY is sent again, after the retry_after_ms it suggests
+BUSY_RETRIES = 3
+# Top bits of a frame's length prefix, see server/compression.py: we read
+# compressed responses, and this response is compressed
+FLAG_ACCEPTS = 1 << 62
+FLAG_COMPRESSED = 1 << 63
+# Bytes a compressed response may decompress to, as MAX_FRAME on the nodes
+MAX_FRAME = 256 * 1024 * 1024
+# Shared by the nodes of the ring; admin commands (info, depart, profile,
+# record) need it unless the node runs without one
+RING_SECRET = os.environ.get("CHORDIFY_RING_SECRET")
+# A node on this machine is reached over its Unix socket, in the directory
+# only our user can enter (see server/transport.py): that needs no secret
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+IPC_DIR = os.path.join(tempfile.gettempdir(), f"chordify-{os.getuid()}")
 
-def send_request(host, port, message_dict):
+def _connect(host, port):
+    path = os.path.join(IPC_DIR, f"chordify-{host}-{port}-0.sock")
+    if host in LOCAL_HOSTS and os.path.exists(path):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.connect(path)
+            return s
+        except OSError:
+            s.close()
+    return socket.create_connection((host, port))
+
+def send_request(host, port, message_dict, busy_retries=BUSY_RETRIES):
+    for _ in range(busy_retries):
+        response = _send_request(host, port, message_dict)
+        if response.get("status") != "BUSY":
+            return response
+        time.sleep(response.get("retry_after_ms", 100) / 1000)
+    return _send_request(host, port, message_dict)
+
+def _send_request(host, port, message_dict):
     try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.connect((host, port))
+        s = _connect(host, port)
 
         # 1) Convert message_dict to bytes
+        if RING_SECRET is not None:
+            message_dict = dict(message_dict, ring_key=RING_SECRET)
         data_bytes = json.dumps(message_dict).encode('utf-8')
 
         # 2) Send the length of the data (8 bytes, big-endian)
         data_length = len(data_bytes)
-        s.sendall(data_length.to_bytes(8, byteorder='big'))
+        s.sendall((data_length | FLAG_ACCEPTS).to_bytes(8, byteorder='big'))
 
         # 3) Send the data in chunks
         bytes_sent = 0
@@ -31,15 +70,22 @@ def send_request(host, port, message_dict):
             return {}
         
         response_length = int.from_bytes(response_length_bytes, byteorder='big')
+        compressed = response_length & FLAG_COMPRESSED
+        response_length &= FLAG_ACCEPTS - 1
         # Read the entire response
-        response_data = b''
+        response_data = bytearray()
         while len(response_data) < response_length:
-            chunk = s.recv(BUFF_SIZE)
+            chunk = s.recv(max(BUFF_SIZE, response_length - len(response_data)))
             if not chunk:
                 break
             response_data += chunk
 
         s.close()
+        if compressed:
+            decompressor = zlib.decompressobj()
+            response_data = decompressor.decompress(response_data, MAX_FRAME)
+            if decompressor.unconsumed_tail:
+                raise ValueError(f"compressed response exceeds {MAX_FRAME} bytes")
 
         # 5) Deserialize the response and return
         return json.loads(response_data.decode('utf-8'))
@@ -48,14 +94,52 @@ def send_request(host, port, message_dict):
         print(f"[_send] Exception: {e}")
         return {}
 
+def _recv_exact(s, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = s.recv(n - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return bytes(data)
+
+def watch(host, port, message_dict):
+    """
+    Send a WATCH and yield the frames the node streams back: the
+    acknowledgement first, then {"events": [...]} or {"heartbeat": true}.
+    Stops when the node closes the connection.
+    """
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.connect((host, port))
+        data_bytes = json.dumps(message_dict).encode('utf-8')
+        s.sendall(len(data_bytes).to_bytes(8, byteorder='big') + data_bytes)
+        while True:
+            length_bytes = _recv_exact(s, 8)
+            if len(length_bytes) < 8:
+                return
+            length = int.from_bytes(length_bytes, byteorder='big') & (FLAG_ACCEPTS - 1)
+            frame = _recv_exact(s, length)
+            if len(frame) < length:
+                return
+            yield json.loads(frame.decode('utf-8'))
+    finally:
+        s.close()
+
 def main():
     parser = argparse.ArgumentParser(description="CLI to interact with a Chord DHT node.")
-    parser.add_argument("command", type=str, help="Command to run: insert, delete, query, depart, overlay, info, help")
+    parser.add_argument("command", type=str, help="Command to run: insert, delete, query, scan, watch, depart, overlay, info, stats, trace, profile, record, help")
     parser.add_argument("key_or_value", type=str, nargs="?", help="Key (for query, insert or delete), or unused for INFO")
     parser.add_argument("value", type=str, nargs="?", help="Value (for insert)")
     parser.add_argument("--host", type=str, default="127.0.0.1", help="Node host")
     parser.add_argument("--port", type=int, default=5000, help="Node port")
     parser.add_argument("--show-output", dest="show_output", action="store_false", help="Remove output (for speadup)")
+    parser.add_argument("--contains", type=str, default=None, help="Scan: titles containing this text")
+    parser.add_argument("--key-range", dest="key_range", type=int, nargs=2, default=None, metavar=("START", "END"),
+                        help="Scan or watch: key ids in (START, END]")
+    parser.add_argument("--limit", type=int, default=100, help="Scan: items per page")
+    parser.add_argument("--token", type=str, default=None, help="Scan: continue from the token of a previous page")
+    parser.add_argument("--all", action="store_true", help="Scan: follow the tokens to the last page")
 
     args = parser.parse_args()
     
@@ -89,6 +173,47 @@ def main():
         if not args.show_output:
             print(f"GET response:")
             pprint(response)
+    elif cmd == "SCAN":
+        # Titles starting with key_or_value (if given), a page at a time
+        request = {
+            "cmd": "SCAN",
+            "prefix": args.key_or_value,
+            "contains": args.contains,
+            "range": args.key_range,
+            "limit": args.limit,
+            "token": args.token
+        }
+        while True:
+            response = send_request(args.host, args.port, request)
+            if not args.show_output:
+                for key_id, title, values in response.get("items", []):
+                    print(f"{key_id} {title} -> {', '.join(values)}")
+            if not args.all or not response.get("token"):
+                break
+            request["token"] = response["token"]
+        if not args.show_output and response.get("token"):
+            print(f"More: --token '{response['token']}'")
+    elif cmd == "WATCH":
+        # Changes of a key, of a key id range or (neither) of every key, as
+        # the owners make them, until Ctrl-C
+        request = {"cmd": "WATCH", "key": args.key_or_value, "range": args.key_range}
+        try:
+            for frame in watch(args.host, args.port, request):
+                if "watch" in frame:
+                    if not args.show_output:
+                        print(f"Watching {frame['watch']['key'] or frame['watch']['range'] or 'every key'} "
+                              f"via {frame['owners']} owner(s)")
+                    continue
+                if frame.get("status") not in (None, "OK"):
+                    pprint(frame)
+                    return
+                if not args.show_output:
+                    for event in frame.get("events", []):
+                        print(f"{event['op']} {event['key']} {event['value']} -> {', '.join(event['values'])}")
+        except KeyboardInterrupt:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"[watch] Exception: {e}")
     elif cmd == "INFO":
         # Show node info: ID, predecessor, successor, finger table
         request = {
@@ -98,6 +223,61 @@ def main():
         if not args.show_output:
             pprint(f"INFO response:")
             pprint(response)
+    elif cmd == "STATS":
+        # Latency histograms, counters and gauges of the node's server
+        request = {
+            "cmd": "STATS"
+        }
+        response = send_request(args.host, args.port, request)
+        if not args.show_output:
+            pprint(f"STATS response:")
+            pprint(response)
+    elif cmd == "TRACE":
+        # Spans of a trace id (printed in every response) from the whole ring,
+        # or the latest client requests of the node without one
+        if args.key_or_value:
+            request = {"cmd": "TRACE", "trace_id": args.key_or_value, "ring": True}
+        else:
+            request = {"cmd": "TRACE"}
+        response = send_request(args.host, args.port, request)
+        if not args.show_output:
+            pprint(f"TRACE response:")
+            pprint(response.get("summary", response.get("recent")))
+            for span in response.get("spans", []):
+                arrow = "->" if span["span"] == "send" else "  "
+                print(f"{'  ' * span['hop']}{arrow} hop {span['hop']} {span['cmd']} @ {span['addr']}"
+                      f"{' to ' + span['peer'] if span['peer'] else ''} {span['us']}us{'' if span['ok'] else ' FAILED'}")
+    elif cmd == "PROFILE":
+        # profile start [interval_ms]: sample the node's threads until profile stop,
+        # which prints CPU and wait time per thread group and saves the
+        # collapsed stacks to profile-<port>.folded for a flamegraph
+        action = (args.key_or_value or "").upper()
+        if action == "START":
+            request = {"cmd": "PROFILE_START"}
+            if args.value.isdigit():
+                request["interval_ms"] = int(args.value)
+        elif action == "STOP":
+            request = {"cmd": "PROFILE_STOP", "inline": True}
+        else:
+            pprint(f"Usage: cli.py profile start [interval_ms] | stop [--host] [--port]")
+            return
+        response = send_request(args.host, args.port, request)
+        if action == "STOP" and "collapsed" in response:
+            with open(f"profile-{args.port}.folded", "w") as f:
+                f.write(response.pop("collapsed"))
+        if not args.show_output:
+            pprint(f"PROFILE {action} response:")
+            pprint(response)
+    elif cmd == "RECORD":
+        # record start | stop: record the client requests of the node for replay.py
+        action = (args.key_or_value or "").upper()
+        if action not in ("START", "STOP"):
+            pprint(f"Usage: cli.py record start | stop [--host] [--port]")
+            return
+        response = send_request(args.host, args.port, {"cmd": f"RECORD_{action}"})
+        if not args.show_output:
+            pprint(f"RECORD {action} response:")
+            pprint(response)
     elif cmd == "DELETE":
         if not args.key_or_value:
             pprint(f"Usage: cli.py DELETE <key> [--host] [--port]")
@@ -131,9 +311,15 @@ def main():
         pprint("Commands:")
         pprint("  insert <key> <value> [--host <host>] [--port <port>] where value by default is <host>:<port>")
         pprint("  query <key> [--host <host>] [--port <port>]")
+        pprint("  scan [<prefix>] [--contains <text>] [--key-range <start> <end>] [--limit <n>] [--token <token>] [--all] [--host <host>] [--port <port>]")
+        pprint("  watch [<key>] [--key-range <start> <end>] [--host <host>] [--port <port>]")
         pprint("  delete <key> [--host <host>] [--port <port>]")
         pprint("  overlay [--host <host>] [--port <port>]")
         pprint("  info [--host <host>] [--port <port>]")
+        pprint("  stats [--host <host>] [--port <port>]")
+        pprint("  trace [<trace_id>] [--host <host>] [--port <port>]")
+        pprint("  profile start [<interval_ms>] | stop [--host <host>] [--port <port>]")
+        pprint("  record start | stop [--host <host>] [--port <port>]")
         pprint("  depart [--host <host>] [--port <port>]")
         
     else:
@@ -0,0 +1,263 @@
+# loadgen.py
+#
+# Load generator for a running ring. Unlike run_inserts.sh / run_queries.sh /
+# run_requests.sh it does not start a python process per operation: it reads
+# the same workload files, keeps pooled connections to every node and
+# reports throughput, latency percentiles and errors as JSON.
+#
+# Examples:
+#   python loadgen.py --workload insert --mode closed --concurrency 10
+#   python loadgen.py --workload query --mode open --rate 2000 --duration 30
+#   python loadgen.py --workload requests --output results.json
+
+import argparse
+import json
+import os
+import queue
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+class ConnectionPool:
+    """
+    Persistent connections to the nodes of the ring, one pool per node.
+    The server keeps a connection open for as long as we send requests on it.
+    """
+    def __init__(self, host, timeout):
+        self.host = host
+        self.timeout = timeout
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, port):
+        with self._lock:
+            return self._pools.setdefault(port, queue.LifoQueue())
+
+    def request(self, port, message_dict):
+        pool = self._pool(port)
+        try:
+            s = pool.get_nowait()
+        except queue.Empty:
+            s = socket.create_connection((self.host, port), timeout=self.timeout)
+        try:
+            response = self._roundtrip(s, message_dict)
+        except Exception:
+            s.close()
+            raise
+        pool.put(s)
+        return response
+
+    def _roundtrip(self, s, message_dict):
+        data_bytes = json.dumps(message_dict).encode('utf-8')
+        s.sendall(len(data_bytes).to_bytes(8, byteorder='big') + data_bytes)
+        length_bytes = self._recv_exact(s, 8)
+        response_data = self._recv_exact(s, int.from_bytes(length_bytes, byteorder='big'))
+        return json.loads(response_data.decode('utf-8'))
+
+    @staticmethod
+    def _recv_exact(s, n):
+        data = b''
+        while len(data) < n:
+            chunk = s.recv(min(n - len(data), 65536))
+            if not chunk:
+                raise ConnectionError("connection closed by node")
+            data += chunk
+        return data
+
+    def close(self):
+        for pool in self._pools.values():
+            while not pool.empty():
+                pool.get_nowait().close()
+
+def load_workload(workload, workload_dir, nodes, base_port, value_host):
+    """
+    (port, request) pairs from the experiment files: file i goes to node i,
+    like the shell scripts do. Streams are interleaved round-robin.
+    """
+    streams = []
+    for i in range(nodes):
+        port = base_port + i
+        if workload == "insert":
+            path = os.path.join(workload_dir, "insert", f"insert_0{i}_part.txt")
+        elif workload == "query":
+            path = os.path.join(workload_dir, "queries", f"query_0{i}.txt")
+        else:
+            path = os.path.join(workload_dir, "requests", f"requests_0{i}.txt")
+        if not os.path.exists(path):
+            continue
+        ops = []
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if workload == "insert":
+                    ops.append((port, {"cmd": "PUT", "key": line, "value": f"{value_host}:{port}"}))
+                elif workload == "query":
+                    ops.append((port, {"cmd": "GET", "key": line}))
+                else:
+                    command, value, rest = (part.strip() for part in (line.split(",", 2) + ["", ""])[:3])
+                    if command == "insert":
+                        ops.append((port, {"cmd": "PUT", "key": value, "value": rest or f"{value_host}:{port}"}))
+                    elif command == "query":
+                        ops.append((port, {"cmd": "GET", "key": value}))
+        streams.append(ops)
+
+    interleaved = []
+    for j in range(max((len(ops) for ops in streams), default=0)):
+        interleaved.extend(ops[j] for ops in streams if j < len(ops))
+    return interleaved
+
+class Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.errors = {}
+        self.ops = {}
+        self.busy_retries = 0
+        self._lock = threading.Lock()
+
+    def record(self, cmd, latency, error=None):
+        with self._lock:
+            self.ops[cmd] = self.ops.get(cmd, 0) + 1
+            if error:
+                self.errors[error] = self.errors.get(error, 0) + 1
+            else:
+                self.latencies.append(latency)
+
+def execute(pool, recorder, port, request, scheduled=None, busy_retries=0):
+    # In open loop, latency counts from the scheduled start so that queueing
+    # inside the generator is not hidden (no coordinated omission)
+    start = scheduled if scheduled is not None else time.perf_counter()
+    try:
+        response = pool.request(port, request)
+        # A node shedding load says when to come back
+        for _ in range(busy_retries):
+            if response.get("status") != "BUSY":
+                break
+            with recorder._lock:
+                recorder.busy_retries += 1
+            time.sleep(response.get("retry_after_ms", 100) / 1000)
+            response = pool.request(port, request)
+        if "error" in response:
+            error = "error_response"
+        elif response.get("status") == "BUSY":
+            error = "busy"
+        else:
+            error = None
+    except socket.timeout:
+        error = "timeout"
+    except (ConnectionError, OSError):
+        error = "connection"
+    except ValueError:
+        error = "bad_response"
+    recorder.record(request["cmd"], (time.perf_counter() - start) * 1000, error)
+
+def run_closed(ops, pool, recorder, concurrency, duration, busy_retries=0):
+    """Fixed concurrency: every worker sends its next request as soon as the previous one returns."""
+    next_op = iter(ops)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration if duration else None
+
+    def worker():
+        while deadline is None or time.perf_counter() < deadline:
+            with lock:
+                op = next(next_op, None)
+            if op is None:
+                return
+            execute(pool, recorder, *op, busy_retries=busy_retries)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+def run_open(ops, pool, recorder, rate, duration, max_inflight, seed, busy_retries=0):
+    """Fixed arrival rate with exponential inter-arrival times, whatever the latency is."""
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    scheduled = start
+    with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+        for op in ops:
+            scheduled += rng.expovariate(rate)
+            if duration and scheduled - start > duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(execute, pool, recorder, op[0], op[1], scheduled, busy_retries)
+
+def percentile(values, p):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Pooled-connection load generator for a Chordify ring")
+    parser.add_argument("--workload", choices=["insert", "query", "requests"], default="insert")
+    parser.add_argument("--workload-dir", dest="workload_dir", type=str, default=HERE, help="Directory with insert/, queries/ and requests/")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--concurrency", type=int, default=10, help="Closed loop: requests in flight")
+    parser.add_argument("--rate", type=float, default=1000.0, help="Open loop: requests per second")
+    parser.add_argument("--max-inflight", dest="max_inflight", type=int, default=256, help="Open loop: worker threads")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the workload this many times")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--base-port", dest="base_port", type=int, default=5000)
+    parser.add_argument("--nodes", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--busy-retries", dest="busy_retries", type=int, default=0, help="Resend a request answered BUSY after its retry_after_ms, up to this many times")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    ops = load_workload(args.workload, args.workload_dir, args.nodes, args.base_port, args.host) * args.repeat
+    if not ops:
+        print(f"No {args.workload} workload files found under {args.workload_dir}")
+        return
+
+    pool = ConnectionPool(args.host, args.timeout)
+    recorder = Recorder()
+    start = time.perf_counter()
+    if args.mode == "closed":
+        run_closed(ops, pool, recorder, args.concurrency, args.duration, args.busy_retries)
+    else:
+        run_open(ops, pool, recorder, args.rate, args.duration, args.max_inflight, args.seed, args.busy_retries)
+    elapsed = time.perf_counter() - start
+    pool.close()
+
+    latencies = sorted(recorder.latencies)
+    completed = len(latencies)
+    report = {
+        "workload": args.workload,
+        "mode": args.mode,
+        "concurrency": args.concurrency if args.mode == "closed" else None,
+        "target_rate": args.rate if args.mode == "open" else None,
+        "nodes": args.nodes,
+        "elapsed_s": round(elapsed, 3),
+        "requests": completed + sum(recorder.errors.values()),
+        "ops": recorder.ops,
+        "throughput_rps": round(completed / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / completed, 3) if completed else None,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "p999": percentile(latencies, 99.9),
+            "max": latencies[-1] if latencies else None,
+        },
+        "errors": recorder.errors,
+        "busy_retries": recorder.busy_retries,
+    }
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    print(out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# replay.py
+#
+# Replays workloads recorded by the servers (main.py --record, or the
+# RECORD_START / RECORD_STOP commands, see server/recorder.py) against a
+# running ring, with the original timing or a scaled one, and diffs results.
+#
+# Examples:
+#   python replay.py run records/ --speed 2 --output eventual.jsonl
+#   python replay.py run records/ --base-port 6000 --output linear.jsonl
+#   python replay.py diff linear.jsonl eventual.jsonl
+#   python replay.py diff records/ linear.jsonl
+
+import argparse
+import gzip
+import heapq
+import json
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from loadgen import ConnectionPool, percentile
+
+# Same format as server/recorder.py
+MAGIC = b"CHORDREC1\n"
+HEADER = struct.Struct(">QHIII")
+
+# Response fields that differ between two runs of the same request
+IGNORED_FIELDS = ("trace_id", "id")
+
+def read_trace(path):
+    """Yields (start_us, port, latency_us, request, response) from a recorded file."""
+    with (gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")) as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a recorded workload")
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            start_us, port, latency_us, req_len, resp_len = HEADER.unpack(header)
+            request = json.loads(f.read(req_len))
+            response = json.loads(f.read(resp_len))
+            yield start_us, port, latency_us, request, response
+
+def load_traces(paths):
+    """The records of every file (one per node), merged by start time."""
+    return list(heapq.merge(*(read_trace(path) for path in paths), key=lambda record: record[0]))
+
+def trace_files(path):
+    """A recorded file, or every recorded file in a directory."""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith((".chrec", ".chrec.gz")))
+    return [path]
+
+def read_results(path):
+    """
+    (request, response) pairs in order: from a results file of `run`, or the
+    responses recorded in a file or directory of recorded files.
+    """
+    if os.path.isdir(path) or path.endswith((".chrec", ".chrec.gz")):
+        return [(request, response) for _, _, _, request, response in load_traces(trace_files(path))]
+    with open(path) as f:
+        return [(entry["request"], entry["response"]) for entry in map(json.loads, f)]
+
+def normalize(response, ignored):
+    response = {k: v for k, v in response.items() if k not in ignored}
+    # A GET returns the values of a key in no particular order
+    if isinstance(response.get("value"), list):
+        response["value"] = sorted(response["value"], key=json.dumps)
+    return response
+
+def replay(records, pool, speed, port_offset, max_inflight):
+    """
+    Send every record at its original offset from the first one, divided by
+    speed (0: as fast as possible, in order, one at a time). Returns
+    (results, errors) with results in record order.
+    """
+    results = [None] * len(records)
+    errors = {}
+    lock = threading.Lock()
+
+    def send(i, port, request, scheduled):
+        start = scheduled if scheduled is not None else time.perf_counter()
+        try:
+            response = pool.request(port + port_offset, request)
+        except (OSError, ValueError) as e:
+            response = {"error": type(e).__name__}
+            with lock:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+        results[i] = (request, response, (time.perf_counter() - start) * 1000)
+
+    if not records:
+        return results, errors
+    if not speed:
+        for i, (_, port, _, request, _) in enumerate(records):
+            send(i, port, request, None)
+        return results, errors
+
+    first = records[0][0]
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+        for i, (start_us, port, _, request, _) in enumerate(records):
+            # Latency counts from the scheduled time, as in loadgen.py open loop
+            scheduled = begin + (start_us - first) / 1e6 / speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, i, port, request, scheduled)
+    return results, errors
+
+def run(args):
+    records = load_traces([f for path in args.traces for f in trace_files(path)])
+    if not records:
+        print("No records found")
+        return
+    ports = [record[1] for record in records]
+    port_offset = args.base_port - min(ports) if args.base_port is not None else 0
+
+    pool = ConnectionPool(args.host, args.timeout)
+    start = time.perf_counter()
+    results, errors = replay(records, pool, args.speed, port_offset, args.max_inflight)
+    elapsed = time.perf_counter() - start
+    pool.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            for i, (request, response, latency) in enumerate(results):
+                f.write(json.dumps({"i": i, "request": request, "response": response, "latency_ms": round(latency, 3)}) + "\n")
+
+    latencies = sorted(latency for _, _, latency in results)
+    recorded = sorted(record[2] / 1000 for record in records)
+    span = (records[-1][0] - records[0][0]) / 1e6
+    print(json.dumps({
+        "records": len(records),
+        "recorded_span_s": round(span, 3),
+        "speed": args.speed,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(records) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {p: round(percentile(latencies, q), 3) for p, q in (("p50", 50), ("p99", 99), ("max", 100))},
+        "recorded_latency_ms": {p: round(percentile(recorded, q), 3) for p, q in (("p50", 50), ("p99", 99), ("max", 100))},
+        "errors": errors,
+        "output": args.output,
+    }, indent=2))
+
+def diff(args):
+    a, b = read_results(args.a), read_results(args.b)
+    ignored = set(args.ignore)
+    differences = []
+    for i, ((request, response_a), (_, response_b)) in enumerate(zip(a, b)):
+        if normalize(response_a, ignored) != normalize(response_b, ignored):
+            differences.append({"i": i, "request": request, "a": response_a, "b": response_b})
+    by_cmd = {}
+    for d in differences:
+        by_cmd[d["request"].get("cmd")] = by_cmd.get(d["request"].get("cmd"), 0) + 1
+    print(json.dumps({
+        "a": args.a,
+        "b": args.b,
+        "compared": min(len(a), len(b)),
+        "only_in_a": max(len(a) - len(b), 0),
+        "only_in_b": max(len(b) - len(a), 0),
+        "different": len(differences),
+        "different_by_cmd": by_cmd,
+        "first": differences[:args.show],
+    }, indent=2))
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded client requests against a Chordify ring and diff the results")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("run", help="Replay recorded files, one per node, merged by time")
+    p.add_argument("traces", nargs="+", help="Recorded files, or directories of them")
+    p.add_argument("--speed", type=float, default=1.0, help="Timing scale: 2 is twice as fast, 0 sends one at a time as fast as possible")
+    p.add_argument("--host", type=str, default="127.0.0.1")
+    p.add_argument("--base-port", dest="base_port", type=int, default=None, help="Port of the first node of the target ring, if it differs from the recorded one")
+    p.add_argument("--max-inflight", dest="max_inflight", type=int, default=256)
+    p.add_argument("--timeout", type=float, default=10.0)
+    p.add_argument("--output", type=str, default=None, help="Write every request and its response as JSON lines, for diff")
+    p.set_defaults(func=run)
+
+    p = commands.add_parser("diff", help="Compare two results files, or the recorded responses (file or directory) with a results file, request by request")
+    p.add_argument("a")
+    p.add_argument("b")
+    p.add_argument("--ignore", nargs="*", default=list(IGNORED_FIELDS), help="Response fields left out of the comparison")
+    p.add_argument("--show", type=int, default=10, help="Differences to print")
+    p.set_defaults(func=diff)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
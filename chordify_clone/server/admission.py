@@ -0,0 +1,190 @@
+# admission.py
+#
+# Admission control and backpressure of a server.
+#
+# Requests fall into three classes:
+#   control   ring maintenance and admin commands (heartbeats, pointer
+#             updates, joins, STATS...): never limited, or an overloaded
+#             ring could not repair itself or be looked at
+#   internal  messages from other nodes, which carry a hop counter: chain
+#             replication, forwarded operations, lookups. Only over a Unix
+#             socket (ipc_dir is private to our user) or with the ring
+#             secret: any client can send a hop counter
+#   client    everything else, requests from clients
+# Load is shed where it enters the ring. At most max_requests client
+# requests run at once, the next client_queue wait up to client_timeout for
+# a slot, and the rest get {"status": "BUSY", "retry_after_ms": N} right
+# away. Internal requests never wait: a node handling one is often itself
+# waiting on the next node of a chain, and queueing them would let a ring
+# of busy nodes wait on each other. They get priority instead: while more
+# than half of max_internal are running, clients wait, and only past
+# max_internal is an internal request turned away (its sender retries
+# after the hint, see ChordNode._request).
+#
+# Admin commands (DEPART, profiling, recording, the full GET_NODE_INFO with
+# the data store) are control commands too, but only nodes of the ring and
+# whoever holds the ring secret may send them (needs_ring).
+#
+# BoundedExecutor replaces a thread per asynchronous send: a fixed set of
+# workers and a bounded queue. When the queue is full the caller sends
+# itself, which slows down whoever produces the work.
+
+import log_config
+import queue
+import threading
+import time
+
+transport_log = log_config.category("chordify.transport")
+
+CONTROL_CMDS = frozenset((
+    "PING", "GET_NODE_INFO", "NOTIFY", "UPDATE_SUCCESSOR", "UPDATE_PREDECESSOR",
+    "JOIN", "JOIN_RANGE", "TRIM_RANGE", "LOAD_REPORT", "DEPART", "GET_OVERLAY", "STATS", "TRACE",
+    "PROFILE_START", "PROFILE_STOP", "RECORD_START", "RECORD_STOP", "WORKER_NODES",
+))
+
+# Control commands a client without the ring secret may not send
+ADMIN_CMDS = frozenset(("DEPART", "PROFILE_START", "PROFILE_STOP", "RECORD_START", "RECORD_STOP"))
+
+# Bounds of the retry hint
+MIN_RETRY_AFTER_MS = 1
+MAX_RETRY_AFTER_MS = 5000
+# Weight of the latest request in the average service time
+EWMA_ALPHA = 0.1
+
+def request_class(request, from_ring: bool = False) -> str:
+    """from_ring: the connection or the ring secret show the sender is a node."""
+    if request.get("cmd") in CONTROL_CMDS:
+        return "control"
+    if from_ring and "hop" in request:
+        return "internal"
+    return "client"
+
+def needs_ring(request) -> bool:
+    """True if only a node of the ring, or a client with the ring secret, may send request."""
+    cmd = request.get("cmd")
+    return (cmd in ADMIN_CMDS or (cmd == "GET_NODE_INFO" and not request.get("summary"))
+            or request.get("status") == "departing")
+
+class AdmissionController:
+    def __init__(self, max_requests: int = 64, max_internal: int = 256,
+                 client_queue: int = 128, client_timeout: float = 1.0):
+        # max_requests 0 turns admission control off
+        self.max_requests = max_requests
+        self.max_internal = max_internal
+        self.client_queue = client_queue
+        self.client_timeout = client_timeout
+        self.running = {"client": 0, "internal": 0}
+        self.waiting = 0
+        self.admitted = {"client": 0, "internal": 0}
+        self.rejected = {"client": 0, "internal": 0}
+        self.service_time = 0.001
+        self._cond = threading.Condition()
+
+    def _client_can_run(self) -> bool:
+        return self.running["client"] < self.max_requests and self.running["internal"] <= self.max_internal // 2
+
+    def admit(self, cls):
+        """
+        Take an execution slot for a request of class cls, waiting for one
+        if it is a client request. Returns None when admitted (call release
+        afterwards), or the retry hint in milliseconds when it is rejected.
+        """
+        if cls == "control" or not self.max_requests:
+            return None
+        with self._cond:
+            if cls == "internal":
+                if self.running["internal"] >= self.max_internal:
+                    return self._reject(cls)
+            elif not self._client_can_run():
+                if self.waiting >= self.client_queue:
+                    return self._reject(cls)
+                self.waiting += 1
+                deadline = time.monotonic() + self.client_timeout
+                try:
+                    while not self._client_can_run():
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return self._reject(cls)
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.running[cls] += 1
+            self.admitted[cls] += 1
+            return None
+
+    def _reject(self, cls) -> int:
+        self.rejected[cls] += 1
+        return self.retry_after_ms()
+
+    def retry_after_ms(self) -> int:
+        """Time for the client requests running and waiting now to drain, at the average service time."""
+        backlog = self.running["client"] + self.waiting
+        ms = self.service_time * 1000 * (backlog + 1) / max(self.max_requests, 1)
+        return int(min(max(ms, MIN_RETRY_AFTER_MS), MAX_RETRY_AFTER_MS))
+
+    def release(self, cls, elapsed: float):
+        if cls == "control" or not self.max_requests:
+            return
+        with self._cond:
+            self.running[cls] -= 1
+            if cls == "client":
+                self.service_time += EWMA_ALPHA * (elapsed - self.service_time)
+            if self.waiting:
+                self._cond.notify()
+
+    def reset(self):
+        with self._cond:
+            self.admitted = {"client": 0, "internal": 0}
+            self.rejected = {"client": 0, "internal": 0}
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "max_requests": self.max_requests,
+                "max_internal": self.max_internal,
+                "running": dict(self.running),
+                "waiting": self.waiting,
+                "admitted": dict(self.admitted),
+                "rejected": dict(self.rejected),
+                "service_time_ms": round(self.service_time * 1000, 3),
+                "retry_after_ms": self.retry_after_ms(),
+            }
+
+class BoundedExecutor:
+    """Up to `workers` threads, started on demand, behind a queue of `max_queue` tasks."""
+    def __init__(self, workers: int = 16, max_queue: int = 1024, name: str = "async-send"):
+        self.workers = workers
+        self.name = name
+        self.inline = 0
+        self._tasks = queue.Queue(maxsize=max_queue)
+        self._threads = 0
+        self._idle = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """Run fn(*args) on a worker, or right here if the queue is full."""
+        with self._lock:
+            # Every idle worker may already have a task queued for it
+            if self._threads < self.workers and self._tasks.qsize() >= self._idle:
+                self._threads += 1
+                threading.Thread(target=self._work, name=self.name, daemon=True).start()
+        try:
+            self._tasks.put_nowait((fn, args))
+        except queue.Full:
+            self.inline += 1
+            fn(*args)
+
+    def _work(self):
+        while True:
+            with self._lock:
+                self._idle += 1
+            fn, args = self._tasks.get()
+            with self._lock:
+                self._idle -= 1
+            try:
+                fn(*args)
+            except Exception as e:
+                transport_log.error("[%s] Task failed: %s", self.name, e)
+
+    def pending(self) -> int:
+        return self._tasks.qsize()
@@ -0,0 +1,101 @@
+# bench_compression.py
+#
+# What compressing a handoff frame (compression.py) costs and saves. For
+# each store size, builds the data store of a node (song titles made of
+# common words, values host:port of ten nodes), frames it the way a
+# departing node sends it (MOVE_ALL_KEYS) and measures on this machine:
+#
+#   serialize    _serialize_for_json + json.dumps + encode
+#   compress     zlib at --level
+#   decompress   zlib on the receiving side
+#   parse        json.loads + _deserialize_from_json
+#
+# The handoff time is these CPU times plus the frame's bytes on a link of
+# each --link-mbps, with and without compression, and with what
+# CompressionPolicy picks for that link after seeing one frame.
+#
+# Example:
+#   python bench_compression.py --keys 10000 100000 1000000 --link-mbps 100 1000 10000
+
+import argparse
+import json
+import random
+import time
+import zlib
+from compression import CompressionPolicy
+from utils import chord_hash, _serialize_for_json, _deserialize_from_json
+
+WORDS = ("love", "night", "heart", "dance", "blue", "fire", "girl", "baby", "rain", "summer",
+         "dream", "home", "road", "light", "time", "world", "song", "wild", "city", "moon")
+
+def build_store(n, rng):
+    """key id -> {title: {host:port}}, like ChordNode.data_store."""
+    nodes = [f"127.0.0.1:{5000 + i}" for i in range(10)]
+    store = {}
+    for i in range(n):
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title() + f" {i}"
+        store.setdefault(chord_hash(title), {})[title] = set(rng.sample(nodes, rng.randint(1, 2)))
+    return store
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+def measure(n, args):
+    store = build_store(n, random.Random(args.seed))
+    message = {"cmd": "MOVE_ALL_KEYS", "ttl": 1}
+    data, serialize_s = timed(lambda: json.dumps(dict(message, data_store=_serialize_for_json(store))).encode("utf-8"))
+    packed, compress_s = timed(zlib.compress, data, args.level)
+    _, decompress_s = timed(zlib.decompress, packed)
+    _, parse_s = timed(lambda: _deserialize_from_json(json.loads(data)["data_store"]))
+    cpu = serialize_s + parse_s
+
+    links = []
+    for mbps in args.link_mbps:
+        bps = mbps * 1e6 / 8
+        plain = cpu + len(data) / bps
+        compressed = cpu + compress_s + len(packed) / bps + decompress_s
+        # One frame to learn ratio and speed from, then the decision for the next one
+        policy = CompressionPolicy(link_mbps=mbps, level=args.level)
+        policy.encode(data)
+        chosen = policy.worth_it(len(data))
+        links.append({
+            "link_mbps": mbps,
+            "handoff_s": round(plain, 3),
+            "handoff_compressed_s": round(compressed, 3),
+            "speedup": round(plain / compressed, 2),
+            "policy_compresses": chosen,
+        })
+    return {
+        "keys": n,
+        "bytes": len(data),
+        "compressed_bytes": len(packed),
+        "ratio": round(len(packed) / len(data), 3),
+        "cpu_s": {
+            "serialize": round(serialize_s, 3),
+            "compress": round(compress_s, 3),
+            "decompress": round(decompress_s, 3),
+            "parse": round(parse_s, 3),
+        },
+        "links": links,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Handoff time of a node's store with and without frame compression")
+    parser.add_argument("--keys", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--link-mbps", dest="link_mbps", type=float, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--level", type=int, default=1, help="zlib level")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    report = [measure(n, args) for n in args.keys]
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    print(out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# bench_fingers.py
+#
+# Finger maintenance on the in-process network of simulator.py. Per ring
+# size and mode, counts the background messages finger upkeep costs per
+# node per simulated minute, and the lookup hops of GETs afterwards:
+#
+#   successors   no finger table, lookups walk the ring
+#   full         every finger looked up every two rounds (fix_fingers, as
+#                chord_node.py did)
+#   incremental  one finger per tick, ticks adapting to churn, plus the
+#                hints found in responses (_finger_tick, _learn_fingers)
+#
+# A round stands for one second: every node stabilizes, then does its
+# finger upkeep. With --churn, that many nodes join and as many leave
+# during each minute.
+#
+# Example:
+#   python bench_fingers.py --nodes 10 50 200 --minutes 2 --churn 4
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import random
+import sys
+import threading
+import utils
+from chord_node_simple import ChordNode
+from server import ChordServer
+from simulator import Cluster, quiesce, summarize, RECURSION_LIMIT, STACK_SIZE
+from transport import InMemoryNetwork
+
+ROUNDS_PER_MINUTE = 60
+
+class FingerCluster(Cluster):
+    def __init__(self, network, replication_factor, seed, fingers):
+        super().__init__(network, replication_factor, "l", seed)
+        self.fingers = fingers
+
+    def add_node(self, i):
+        host, port = self.address(i)
+        node = ChordNode(host, port, None, None, self.replication_factor, self.consistency,
+                         stabilize_interval=0.0, transport=self.network.transport(), fingers=self.fingers)
+        self.network.register(host, port, ChordServer(node, listen=False))
+        if self.nodes:
+            bootstrap = self.rng.choice(self.nodes)
+            node.join(bootstrap.host, bootstrap.port)
+        self.nodes.append(node)
+        return node
+
+def upkeep(node, mode, r):
+    if mode == "full":
+        if r % 2 == 0:
+            node.fix_fingers()
+    elif mode == "incremental":
+        node._finger_tick()
+
+def run_round(cluster, mode, r):
+    """One second: stabilize every node, then the finger upkeep. Returns the upkeep messages."""
+    messages = 0
+    for node in list(cluster.nodes):
+        node.stabilize()
+        node.check_predecessor()
+        before = cluster.network.stats()["messages"]
+        upkeep(node, mode, r)
+        messages += cluster.network.stats()["messages"] - before
+    return messages
+
+def lookups(cluster, baseline, keys, queries, rng):
+    hops = []
+    misses = 0
+    for _ in range(queries):
+        before = cluster.network.stats()["by_cmd"].get("FIND_SUCCESSOR", 0)
+        misses += not cluster.client({"cmd": "GET", "key": rng.choice(keys)}).get("value")
+        quiesce(baseline)
+        hops.append(cluster.network.stats()["by_cmd"].get("FIND_SUCCESSOR", 0) - before)
+    return summarize(hops), misses
+
+def simulate(n, mode, args):
+    network = InMemoryNetwork(latency=0.0, seed=args.seed)
+    cluster = FingerCluster(network, args.replication_factor, args.seed, mode != "successors")
+    for i in range(n):
+        cluster.add_node(i)
+    cluster_rng = random.Random(args.seed)
+    baseline = threading.active_count()
+    keys = [f"song-{i}" for i in range(args.keys)]
+    for key in keys:
+        cluster.client({"cmd": "PUT", "key": key, "value": "v"})
+
+    # Warm up for a minute without counting
+    for r in range(ROUNDS_PER_MINUTE):
+        run_round(cluster, mode, r)
+
+    messages = 0
+    next_id = n
+    rounds = args.minutes * ROUNDS_PER_MINUTE
+    churn_every = ROUNDS_PER_MINUTE // args.churn if args.churn else 0
+    for r in range(rounds):
+        if churn_every and r % churn_every == 0:
+            cluster.add_node(next_id)
+            next_id += 1
+            cluster.remove_node(cluster_rng.choice(cluster.nodes[1:]))
+        messages += run_round(cluster, mode, r)
+    quiesce(baseline)
+
+    hops, misses = lookups(cluster, baseline, keys, args.queries, random.Random(args.seed))
+    filled = [sum(f is not None for _, f in node.finger_table) for node in cluster.nodes]
+    return {
+        "nodes": n,
+        "mode": mode,
+        "churn_per_minute": args.churn,
+        "upkeep_messages_per_node_minute": round(messages / len(cluster.nodes) / args.minutes, 1),
+        "lookup_hops": hops,
+        "get_misses": misses,
+        "fingers_known_mean": round(sum(filled) / len(filled), 1),
+        "hints_per_node": round(sum(node.finger_stats["hints"] for node in cluster.nodes) / len(cluster.nodes), 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Background cost of finger maintenance and the lookup hops it buys")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--modes", nargs="+", default=["successors", "full", "incremental"],
+                        choices=["successors", "full", "incremental"])
+    parser.add_argument("--minutes", type=int, default=2, help="Simulated minutes measured, after one of warm-up")
+    parser.add_argument("--churn", type=int, default=0, help="Nodes that join and nodes that leave per minute")
+    parser.add_argument("--keys", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--replication-factor", dest="replication_factor", type=int, default=1)
+    parser.add_argument("--id-bits", dest="id_bits", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    utils.set_id_bits(args.id_bits)
+    logging.basicConfig(level=logging.CRITICAL)
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    threading.stack_size(STACK_SIZE)
+
+    reports = []
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for n in args.nodes:
+                for mode in args.modes:
+                    reports.append(simulate(n, mode, args))
+
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+
+    out = json.dumps(reports, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    print(out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# bench_hotkeys.py
+#
+# Hot keys on the in-process network of simulator.py: reads follow a Zipf
+# distribution over the keys, so a few songs get most of them. Compares
+# the busiest node with and without hot-key replicas (--hot-key-rate),
+# then lets the traffic cool down and checks that the extra copies go away.
+#
+# A round stands for one second: --reads-per-round reads, then every node
+# runs its once-per-stabilize hot key refresh.
+#
+# Example:
+#   python bench_hotkeys.py --nodes 20 --keys 500 --zipf 1.1 --hot-key-rate 100
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import random
+import sys
+import threading
+import utils
+from chord_node_simple import ChordNode
+from server import ChordServer
+from simulator import Cluster, quiesce, RECURSION_LIMIT, STACK_SIZE
+from transport import InMemoryNetwork
+
+class HotCluster(Cluster):
+    def __init__(self, network, replication_factor, seed, hot_key_rate, hot_key_replicas):
+        super().__init__(network, replication_factor, "e", seed)
+        self.hot_key_rate = hot_key_rate
+        self.hot_key_replicas = hot_key_replicas
+
+    def add_node(self, i):
+        host, port = self.address(i)
+        node = ChordNode(host, port, None, None, self.replication_factor, self.consistency,
+                         stabilize_interval=0.0, transport=self.network.transport(),
+                         hot_key_rate=self.hot_key_rate, hot_key_replicas=self.hot_key_replicas)
+        self.network.register(host, port, ChordServer(node, listen=False))
+        if self.nodes:
+            node.join(self.nodes[0].host, self.nodes[0].port)
+        self.nodes.append(node)
+        return node
+
+def zipf_weights(n, s):
+    return [1 / (rank ** s) for rank in range(1, n + 1)]
+
+def get_load(nodes):
+    """GET requests each node handled (client, forwarded and replica reads)."""
+    return [node.metrics.snapshot()["histograms"].get("dispatch.GET", {}).get("count", 0) for node in nodes]
+
+def run_rounds(cluster, baseline, keys, weights, rounds, reads, rng):
+    misses = 0
+    for _ in range(rounds):
+        for key in rng.choices(keys, weights, k=reads):
+            misses += not cluster.client({"cmd": "GET", "key": key}).get("value")
+        quiesce(baseline)
+        for node in cluster.nodes:
+            node._refresh_hot_keys(elapsed=1.0)
+        quiesce(baseline)
+    return misses
+
+def reset_metrics(cluster):
+    for node in cluster.nodes:
+        node.metrics.reset()
+
+def load_summary(load):
+    total = sum(load) or 1
+    return {
+        "max_node_gets": max(load),
+        "mean_node_gets": round(total / len(load), 1),
+        "max_over_mean": round(max(load) / (total / len(load)), 2),
+    }
+
+def build(args, hot_key_rate):
+    network = InMemoryNetwork(latency=0.0, seed=args.seed)
+    cluster = HotCluster(network, args.replication_factor, args.seed, hot_key_rate, args.hot_key_replicas)
+    for i in range(args.nodes):
+        cluster.add_node(i)
+    cluster.stabilize(2)
+    baseline = threading.active_count()
+    rng = random.Random(args.seed)
+    keys = [f"song-{i}" for i in range(args.keys)]
+    for key in keys:
+        cluster.client({"cmd": "PUT", "key": key, "value": "v1"})
+    quiesce(baseline)
+
+    weights = zipf_weights(len(keys), args.zipf)
+    # Warm up: the owners notice their hot keys and copy them
+    run_rounds(cluster, baseline, keys, weights, args.warmup_rounds, args.reads_per_round, rng)
+    reset_metrics(cluster)
+    misses = run_rounds(cluster, baseline, keys, weights, args.rounds, args.reads_per_round, rng)
+    report = {
+        "hot_key_rate": hot_key_rate,
+        "reads": args.rounds * args.reads_per_round,
+        **load_summary(get_load(cluster.nodes)),
+        "get_misses": misses,
+        "hot_keys": sorted({key for node in cluster.nodes for key in node._hot_owned}),
+        "extra_copies": sum(len(node.hot_replicas) for node in cluster.nodes),
+    }
+
+    # A write to the hottest key reaches its extra copies
+    cluster.client({"cmd": "PUT", "key": keys[0], "value": "v2"})
+    quiesce(baseline)
+    copies = [node.hot_replicas[keys[0]][0] for node in cluster.nodes if keys[0] in node.hot_replicas]
+    report["stale_copies_after_write"] = sum("v2" not in values for values in copies)
+
+    # Traffic cools down: uniform reads until the owners retire the copies
+    uniform = [1] * len(keys)
+    run_rounds(cluster, baseline, keys, uniform, args.cool_rounds, args.reads_per_round, rng)
+    report["extra_copies_after_cooldown"] = sum(len(node.hot_replicas) for node in cluster.nodes)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Busiest node under Zipf reads, with and without hot-key replicas")
+    parser.add_argument("--nodes", type=int, default=20)
+    parser.add_argument("--keys", type=int, default=500)
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of the reads")
+    parser.add_argument("--replication-factor", dest="replication_factor", type=int, default=3)
+    parser.add_argument("--hot-key-rate", dest="hot_key_rate", type=float, default=100.0, help="Reads per round that make a key hot")
+    parser.add_argument("--hot-key-replicas", dest="hot_key_replicas", type=int, default=2)
+    parser.add_argument("--reads-per-round", dest="reads_per_round", type=int, default=1000)
+    parser.add_argument("--warmup-rounds", dest="warmup_rounds", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--cool-rounds", dest="cool_rounds", type=int, default=5)
+    parser.add_argument("--id-bits", dest="id_bits", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    utils.set_id_bits(args.id_bits)
+    logging.basicConfig(level=logging.CRITICAL)
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    threading.stack_size(STACK_SIZE)
+
+    reports = []
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for rate in (None, args.hot_key_rate):
+                reports.append(build(args, rate))
+
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+
+    out = json.dumps(reports, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    print(out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# bench_join.py
+#
+# Time-to-ready of a ring built on the in-process network of simulator.py:
+# how long until n nodes are joined, every successor and predecessor
+# pointer is right and every key sits on its k replicas. Compares the
+# original one-at-a-time join with JOIN_RANGE joins, one at a time and
+# many at once. A client keeps writing new keys (--writes) while the nodes
+# join; the JOIN_RANGE modes must end with every key of both kinds on
+# exactly its k replicas, or the bench exits with status 1.
+#
+# Join time is simulated: each worker thread adds the latency of its
+# requests to its own clock, joins run back to back on a worker, and the
+# ring is joined when the busiest worker is done. Lock waits inside the
+# nodes are not simulated. Stabilize rounds needed afterwards count
+# --stabilize-interval each.
+#
+# Example:
+#   python bench_join.py --nodes 10 100 500 --parallel 16
+
+import argparse
+import bisect
+import contextlib
+import io
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import utils
+from simulator import Cluster, quiesce, handoff_bytes, RECURSION_LIMIT
+from transport import InMemoryNetwork
+
+STACK_SIZE = 64 * 1024 * 1024
+
+def wrong_pointers(nodes):
+    """Successor and predecessor pointers that do not match the sorted ring."""
+    ids = sorted(node.node_id for node in nodes)
+    wrong = 0
+    for node in nodes:
+        i = ids.index(node.node_id)
+        wrong += node.successor[0] != ids[(i + 1) % len(ids)]
+        wrong += node.predecessor[0] != ids[i - 1]
+    return wrong
+
+def placement(nodes, keys, k):
+    """(missing, extra): replica copies absent from, or present outside, the k nodes owning each key."""
+    ids = sorted(node.node_id for node in nodes)
+    by_id = {node.node_id: node for node in nodes}
+    missing = extra = 0
+    replicas = {}
+    for key in keys:
+        key_id = utils.chord_hash(key)
+        first = bisect.bisect_left(ids, key_id) % len(ids)
+        owners = {ids[(first + j) % len(ids)] for j in range(min(k, len(ids)))}
+        replicas[key_id] = owners
+        missing += sum(1 for o in owners if key not in by_id[o].data_store.get(key_id, {}))
+    for node in nodes:
+        for key_id in node.data_store:
+            if key_id in replicas and node.node_id not in replicas[key_id]:
+                extra += 1
+    return missing, extra
+
+def build(n, mode, args):
+    network = InMemoryNetwork(latency=args.latency_ms / 1000, seed=args.seed)
+    cluster = Cluster(network, args.replication_factor, args.consistency, args.seed, bulk_join=mode != "legacy")
+    baseline = threading.active_count()
+    keys = [f"song-{i}" for i in range(args.keys)]
+    cluster.add_node(0)
+    for key in keys:
+        cluster.client({"cmd": "PUT", "key": key, "value": "v"})
+
+    before = network.stats()
+    clocks = {}
+    lock = threading.Lock()
+
+    # Written while the nodes join, through the nodes already in
+    written = []
+    joined = threading.Event()
+    def write():
+        rng = random.Random(args.seed)
+        for i in range(args.writes):
+            if joined.is_set():
+                break
+            node = rng.choice(list(cluster.nodes))
+            key = f"live-{i}"
+            network.deliver(node.host, node.port, {"cmd": "PUT", "key": key, "value": "v"})
+            written.append(key)
+    writer = threading.Thread(target=write)
+    writer.start()
+
+    def join(i):
+        start = network.virtual_time()
+        cluster.add_node(i)
+        with lock:
+            ident = threading.get_ident()
+            clocks[ident] = clocks.get(ident, 0.0) + network.virtual_time() - start
+
+    wall = time.perf_counter()
+    workers = args.parallel if mode == "bulk-parallel" else 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(join, i) for i in range(1, n)]:
+            future.result()
+    joined.set()
+    writer.join()
+    quiesce(baseline)
+    join_wall = time.perf_counter() - wall
+    after = network.stats()
+    join_s = max(clocks.values(), default=0.0)
+
+    rounds = 0
+    while wrong_pointers(cluster.nodes) and rounds < args.max_rounds:
+        cluster.stabilize(1)
+        quiesce(baseline)
+        rounds += 1
+    wrong = wrong_pointers(cluster.nodes)
+
+    keys += written
+    missing, extra = placement(cluster.nodes, keys, args.replication_factor or 1)
+    misses = sum(not cluster.client({"cmd": "GET", "key": key}).get("value") for key in keys)
+    return {
+        "nodes": n,
+        "mode": mode,
+        "workers": workers,
+        "join_simulated_s": round(join_s, 3),
+        "stabilize_rounds": rounds,
+        "time_to_ready_s": round(join_s + rounds * args.stabilize_interval, 3) if not wrong else None,
+        "wrong_pointers": wrong,
+        "written_during_joins": len(written),
+        "join_messages": after["messages"] - before["messages"],
+        "handoff_bytes": handoff_bytes(before, after),
+        "missing_replicas": missing,
+        "extra_replicas": extra,
+        "get_misses": misses,
+        "wall_s": round(join_wall, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Time-to-ready of a Chordify ring, original vs bulk join")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--modes", nargs="+", default=["legacy", "bulk", "bulk-parallel"], choices=["legacy", "bulk", "bulk-parallel"])
+    parser.add_argument("--parallel", type=int, default=16, help="Nodes joining at once in bulk-parallel")
+    parser.add_argument("--keys", type=int, default=500, help="Keys stored before the other nodes join")
+    parser.add_argument("--writes", type=int, default=2000, help="Most keys written while the nodes join")
+    parser.add_argument("--replication-factor", dest="replication_factor", type=int, default=3)
+    parser.add_argument("--consistency", type=str, default="l", choices=["l", "e"])
+    parser.add_argument("--latency-ms", dest="latency_ms", type=float, default=1.0, help="One-way message latency")
+    parser.add_argument("--stabilize-interval", dest="stabilize_interval", type=float, default=1.0, help="Seconds per stabilize round, as main.py")
+    parser.add_argument("--max-rounds", dest="max_rounds", type=int, default=30)
+    parser.add_argument("--id-bits", dest="id_bits", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    utils.set_id_bits(args.id_bits)
+    logging.basicConfig(level=logging.CRITICAL)
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    threading.stack_size(STACK_SIZE)
+
+    reports = []
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for n in args.nodes:
+                for mode in args.modes:
+                    reports.append(build(n, mode, args))
+
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+
+    out = json.dumps(reports, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    print(out)
+    # The original join is kept for comparison: it is only safe one node at a time, with no writes
+    broken = [r for r in reports if r["mode"] != "legacy"
+              and (r["wrong_pointers"] or r["missing_replicas"] or r["extra_replicas"] or r["get_misses"])]
+    if broken:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
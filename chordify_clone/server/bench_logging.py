@@ -0,0 +1,106 @@
+# bench_logging.py
+#
+# Throughput of an in-process ring (see simulator.py) under different
+# logging setups, to see what logging costs the request path.
+#
+# Example:
+#   python bench_logging.py --nodes 10 --ops 5000
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import log_config
+import utils
+from simulator import Cluster
+from transport import InMemoryNetwork
+
+HOT_CATEGORIES = ("chordify.request", "chordify.replication")
+
+def sync_text(path):
+    """What main.py used to do: a FileHandler written by the calling thread."""
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+    class Undo:
+        def stop(self):
+            root.removeHandler(handler)
+            handler.close()
+    return Undo()
+
+SETUPS = {
+    "off": lambda path: None,
+    "sync-text": sync_text,
+    "async-json": lambda path: log_config.configure(path, "INFO", default_rate_limit=0),
+    "async-json-sampled": lambda path: log_config.configure(
+        path, "INFO", sample={c: 0.01 for c in HOT_CATEGORIES}, default_rate_limit=0),
+    "async-json-rate-limited": lambda path: log_config.configure(path, "INFO"),
+    "async-json-debug": lambda path: log_config.configure(path, "DEBUG", default_rate_limit=0),
+}
+
+def run(cluster, ops, keys):
+    start = time.perf_counter()
+    for i in range(ops):
+        key = keys[i % len(keys)]
+        if i % 2 == 0:
+            cluster.client({"cmd": "PUT", "key": key, "value": "v"})
+        else:
+            cluster.client({"cmd": "GET", "key": key})
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure what logging costs an in-process ring")
+    parser.add_argument("--nodes", type=int, default=10)
+    parser.add_argument("--ops", type=int, default=5000, help="Client operations per setup, half PUT half GET")
+    parser.add_argument("--replication-factor", dest="replication_factor", type=int, default=3)
+    parser.add_argument("--setups", nargs="+", default=list(SETUPS), choices=list(SETUPS))
+    parser.add_argument("--rounds", type=int, default=3, help="Runs per setup, interleaved; the best one counts")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    utils.set_id_bits(32)
+    sys.setrecursionlimit(20000)
+    logging.getLogger().setLevel(logging.CRITICAL)
+    cluster = Cluster(InMemoryNetwork(seed=args.seed), args.replication_factor, "l", args.seed)
+    for i in range(args.nodes):
+        cluster.add_node(i)
+    cluster.stabilize(2)
+    keys = [f"song-{i}" for i in range(500)]
+    workdir = tempfile.mkdtemp(prefix="chord-logbench-")
+
+    best = {}
+    written = {}
+    dropped = {}
+    for r in range(args.rounds):
+        for name in args.setups:
+            path = os.path.join(workdir, f"{name}-{r}.log")
+            logging.getLogger().setLevel(logging.CRITICAL)
+            pipeline = SETUPS[name](path)
+            elapsed = run(cluster, args.ops, keys)
+            if isinstance(pipeline, log_config.LogPipeline):
+                dropped[name] = pipeline.stats()
+            if pipeline is not None:
+                pipeline.stop()
+            written[name] = sum(1 for _ in open(path)) if os.path.exists(path) else 0
+            best[name] = max(best.get(name, 0.0), args.ops / elapsed)
+
+    baseline = best[args.setups[0]]
+    results = {
+        name: {
+            "ops_per_s": round(best[name], 1),
+            f"vs_{args.setups[0]}": f"{(best[name] / baseline - 1) * 100:+.1f}%",
+            "records_written": written[name],
+            "dropped": dropped.get(name),
+        }
+        for name in args.setups
+    }
+    print(json.dumps({"nodes": args.nodes, "ops": args.ops, "logs": workdir, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
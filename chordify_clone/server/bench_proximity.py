@@ -0,0 +1,151 @@
+# bench_proximity.py
+#
+# Proximity-aware fingers and replica choice on the in-process network of
+# simulator.py, with racks: hosts in the same rack are --local-ms apart,
+# racks sit at random points of a unit square and add --spread-ms per unit
+# of distance. Compares a ring whose fingers are the first node of their
+# interval with one (--proximity) whose fingers are the closest of the
+# first few, and whose eventual reads go to the closest replica.
+#
+# Reports lookup hops and simulated lookup latency (FIND_SUCCESSOR from a
+# random node), GET latency from a random node, and the probes spent.
+#
+# Example:
+#   python bench_proximity.py --nodes 200 --racks 10 --spread-ms 20
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import math
+import random
+import sys
+import threading
+import utils
+from chord_node_simple import ChordNode
+from server import ChordServer
+from simulator import Cluster, quiesce, summarize, RECURSION_LIMIT, STACK_SIZE
+from transport import InMemoryNetwork
+
+class RackCluster(Cluster):
+    def __init__(self, network, replication_factor, seed, proximity):
+        super().__init__(network, replication_factor, "e", seed)
+        self.proximity = proximity
+
+    def add_node(self, i):
+        host, port = self.address(i)
+        # stabilize_interval only sets how long replica lists stay cached here
+        node = ChordNode(host, port, None, None, self.replication_factor, self.consistency,
+                         stabilize_interval=1.0, transport=self.network.transport(host),
+                         proximity=self.proximity)
+        self.network.register(host, port, ChordServer(node, listen=False))
+        if self.nodes:
+            node.join(self.nodes[0].host, self.nodes[0].port)
+        self.nodes.append(node)
+        return node
+
+def rack_latency(args):
+    """link_latency for InMemoryNetwork: node i sits in rack i % racks."""
+    rng = random.Random(args.seed)
+    points = [(rng.random(), rng.random()) for _ in range(args.racks)]
+    rack = {Cluster.address(i)[0]: i % args.racks for i in range(args.nodes)}
+
+    def latency(src, dst):
+        if src == dst:
+            return 0.0
+        a, b = points[rack[src]], points[rack[dst]]
+        return (args.local_ms + math.dist(a, b) * args.spread_ms) / 1000
+    return latency
+
+def simulate(proximity, args):
+    network = InMemoryNetwork(latency=args.local_ms / 1000, seed=args.seed, link_latency=rack_latency(args))
+    cluster = RackCluster(network, args.replication_factor, args.seed, proximity)
+    for i in range(args.nodes):
+        cluster.add_node(i)
+    cluster.stabilize(2)
+    baseline = threading.active_count()
+    keys = [f"song-{i}" for i in range(args.keys)]
+    for key in keys:
+        cluster.client({"cmd": "PUT", "key": key, "value": "v"})
+    quiesce(baseline)
+
+    # Fill the finger tables: a few full passes of the incremental refresh
+    before = network.stats()
+    for _ in range(args.passes):
+        cluster.stabilize(1)
+        for node in cluster.nodes:
+            for _ in range(utils.M):
+                node.fix_next_finger()
+    quiesce(baseline)
+    probes = network.stats()["by_cmd"].get("PING", 0) - before["by_cmd"].get("PING", 0)
+
+    rng = random.Random(args.seed + 1)
+    lookup = {"hops": [], "latency_ms": []}
+    for _ in range(args.queries):
+        node = rng.choice(cluster.nodes)
+        finds = network.stats()["by_cmd"].get("FIND_SUCCESSOR", 0)
+        network.reset_virtual_time()
+        node.find_successor(rng.randrange(utils.RING_SIZE))
+        lookup["latency_ms"].append(network.virtual_time() * 1000)
+        lookup["hops"].append(network.stats()["by_cmd"].get("FIND_SUCCESSOR", 0) - finds)
+
+    reads = []
+    misses = 0
+    for _ in range(args.queries):
+        node = rng.choice(cluster.nodes)
+        network.reset_virtual_time()
+        # Sent from the node's own host: only the time inside the ring counts
+        resp = network.deliver(node.host, node.port, {"cmd": "GET", "key": rng.choice(keys)}, node.host)
+        reads.append(network.virtual_time() * 1000)
+        misses += not resp.get("value")
+    quiesce(baseline)
+
+    return {
+        "proximity": proximity,
+        "nodes": args.nodes,
+        "racks": args.racks,
+        "lookup": {k: summarize(v) for k, v in lookup.items()},
+        "get_latency_ms": summarize(reads),
+        "get_misses": misses,
+        "probes_per_node": round(probes / args.nodes, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Lookup and read latency with and without proximity-aware fingers")
+    parser.add_argument("--nodes", type=int, default=200)
+    parser.add_argument("--racks", type=int, default=10)
+    parser.add_argument("--local-ms", dest="local_ms", type=float, default=0.2, help="One-way latency inside a rack")
+    parser.add_argument("--spread-ms", dest="spread_ms", type=float, default=20.0, help="One-way latency per unit of distance between racks")
+    parser.add_argument("--keys", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--passes", type=int, default=2, help="Full finger refresh passes before measuring")
+    parser.add_argument("--replication-factor", dest="replication_factor", type=int, default=3)
+    parser.add_argument("--id-bits", dest="id_bits", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    utils.set_id_bits(args.id_bits)
+    logging.basicConfig(level=logging.CRITICAL)
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    threading.stack_size(STACK_SIZE)
+
+    reports = []
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for proximity in (False, True):
+                reports.append(simulate(proximity, args))
+
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+
+    out = json.dumps(reports, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    print(out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# bench_rebalance.py
+#
+# Load-aware rebalancing (ChordNode._rebalance) on the in-process network of
+# simulator.py. Builds a ring whose nodes sit where their hashes put them,
+# stores keys, then runs rounds in which every node compares its load with
+# its successor's and shifts its position, followed by a stabilize round.
+# Reports after each round how uneven the key ids per node are (max/mean),
+# the bytes moved, and at the end whether pointers and replicas are right
+# and every key can still be read.
+#
+# With --reads-per-round, each round also reads random keys, so the owners
+# of the most read keys (--zipf) count as busier (see --ops-weight).
+#
+# Example:
+#   python bench_rebalance.py --nodes 32 --keys 5000 --rounds 10
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import random
+import statistics
+import sys
+import threading
+import utils
+from bench_join import placement, wrong_pointers
+from chord_node_simple import ChordNode
+from server import ChordServer
+from simulator import Cluster, quiesce, handoff_bytes, RECURSION_LIMIT, STACK_SIZE
+from transport import InMemoryNetwork
+
+class RebalanceCluster(Cluster):
+    def __init__(self, network, replication_factor, consistency, seed, ops_weight):
+        super().__init__(network, replication_factor, consistency, seed)
+        self.ops_weight = ops_weight
+
+    def add_node(self, i):
+        host, port = self.address(i)
+        node = ChordNode(host, port, None, None, self.replication_factor, self.consistency,
+                         stabilize_interval=0.0, transport=self.network.transport(),
+                         rebalance_ops_weight=self.ops_weight)
+        self.network.register(host, port, ChordServer(node, listen=False))
+        if self.nodes:
+            node.join(self.nodes[0].host, self.nodes[0].port)
+        self.nodes.append(node)
+        return node
+
+def imbalance(nodes):
+    """max/mean and coefficient of variation of the key ids each node owns."""
+    owned = [len(node._owned_ids()) for node in nodes]
+    mean = statistics.mean(owned) or 1
+    return {
+        "max_over_mean": round(max(owned) / mean, 2),
+        "cv": round(statistics.pstdev(owned) / mean, 3),
+        "max_keys": max(owned),
+        "min_keys": min(owned),
+    }
+
+def simulate(args):
+    network = InMemoryNetwork(latency=0.0, seed=args.seed)
+    cluster = RebalanceCluster(network, args.replication_factor, args.consistency, args.seed, args.ops_weight)
+    for i in range(args.nodes):
+        cluster.add_node(i)
+    cluster.stabilize(2)
+    baseline = threading.active_count()
+    rng = random.Random(args.seed)
+    keys = [f"song-{i}" for i in range(args.keys)]
+    for key in keys:
+        cluster.client({"cmd": "PUT", "key": key, "value": "v"})
+    quiesce(baseline)
+    weights = [1 / (rank ** args.zipf) for rank in range(1, len(keys) + 1)]
+
+    rounds = [{"round": 0, **imbalance(cluster.nodes)}]
+    before = network.stats()
+    for r in range(1, args.rounds + 1):
+        for key in rng.choices(keys, weights, k=args.reads_per_round):
+            cluster.client({"cmd": "GET", "key": key})
+        moved = 0
+        for node in list(cluster.nodes):
+            moved += abs(node._rebalance(elapsed=1.0))
+        quiesce(baseline)
+        cluster.stabilize(1)
+        quiesce(baseline)
+        rounds.append({"round": r, "key_ids_moved": moved, **imbalance(cluster.nodes)})
+    after = network.stats()
+    cluster.stabilize(2)
+    quiesce(baseline)
+
+    missing, extra = placement(cluster.nodes, keys, args.replication_factor or 1)
+    return {
+        "nodes": args.nodes,
+        "keys": args.keys,
+        "replication_factor": args.replication_factor,
+        "rounds": rounds,
+        "moves": sum(node.rebalance_stats["moves"] for node in cluster.nodes),
+        "handoff_bytes": handoff_bytes(before, after),
+        "wrong_pointers": wrong_pointers(cluster.nodes),
+        "missing_replicas": missing,
+        "extra_replicas": extra,
+        "get_misses": sum(not cluster.client({"cmd": "GET", "key": key}).get("value") for key in keys),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Key imbalance of a ring before and after load-aware rebalancing")
+    parser.add_argument("--nodes", type=int, default=32)
+    parser.add_argument("--keys", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--replication-factor", dest="replication_factor", type=int, default=3)
+    parser.add_argument("--consistency", type=str, default="l", choices=["l", "e"])
+    parser.add_argument("--reads-per-round", dest="reads_per_round", type=int, default=0)
+    parser.add_argument("--zipf", type=float, default=0.0, help="Zipf exponent of the reads, 0 for uniform")
+    parser.add_argument("--ops-weight", dest="ops_weight", type=float, default=1.0, help="Keys one read/s as owner weighs")
+    parser.add_argument("--id-bits", dest="id_bits", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    utils.set_id_bits(args.id_bits)
+    logging.basicConfig(level=logging.CRITICAL)
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    threading.stack_size(STACK_SIZE)
+
+    report = {}
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            report.update(simulate(args))
+
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    print(out)
+
+if __name__ == "__main__":
+    main()
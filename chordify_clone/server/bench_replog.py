@@ -0,0 +1,198 @@
+# bench_replog.py
+#
+# How replicas that missed writes get them back, on the in-process network
+# of simulator.py. Builds a ring with k replicas, stores --keys keys, then
+# runs --writes PUTs and DELETEs while the network drops --loss of the
+# messages, so some replicas miss some writes. With the loss gone, runs
+# --rounds stabilize rounds and counts the replica copies that differ from
+# their owner's, before and after, and the bytes spent catching up (log
+# pages, and ranges copied whole). Catch-ups already run during the writes,
+# so "before" is lower with the log too. No node is ever suspected, so the
+# ring stays put and lost messages only cost writes.
+#
+#   off        no replication log (--repl-log-size 0): nothing brings a
+#              missed write back, short of the range moving
+#   log        replicas stream what they missed from the owner's log
+#   truncated  the log keeps only --truncated-size writes, so replicas
+#              far behind copy the owner's range instead
+#   inline     as log, but background work runs on the thread that asks for
+#              it, as admission.BoundedExecutor does once its queue is full;
+#              a write that does not return within --hang-timeout seconds
+#              is reported as hung and the bench exits with status 1
+#
+# Example:
+#   python bench_replog.py --nodes 20 --writes 5000 --loss 0.02
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import random
+import sys
+import threading
+import utils
+from chord_node_simple import ChordNode, CATCHUP_ROUNDS
+from server import ChordServer
+from simulator import Cluster, quiesce, handoff_bytes, RECURSION_LIMIT
+from transport import InMemoryNetwork
+from bench_join import wrong_pointers, STACK_SIZE
+
+MODES = ("off", "log", "truncated", "inline")
+SUSPECT_NEVER = 10 ** 9
+
+class InlineExecutor:
+    """Runs every task right away on the submitting thread: a BoundedExecutor with a full queue."""
+    def submit(self, fn, *args):
+        fn(*args)
+
+class LogCluster(Cluster):
+    def __init__(self, network, replication_factor, consistency, seed, repl_log_size, async_executor=None):
+        super().__init__(network, replication_factor, consistency, seed)
+        self.repl_log_size = repl_log_size
+        self.async_executor = async_executor
+
+    def add_node(self, i):
+        host, port = self.address(i)
+        node = ChordNode(host, port, None, None, self.replication_factor, self.consistency,
+                         stabilize_interval=0.0, transport=self.network.transport(host),
+                         repl_log_size=self.repl_log_size, async_executor=self.async_executor)
+        # Lost messages should cost writes, not members: no node is suspected
+        node.failure_detector.threshold = SUSPECT_NEVER
+        self.network.register(host, port, ChordServer(node, listen=False))
+        if self.nodes:
+            bootstrap = self.rng.choice(self.nodes)
+            node.join(bootstrap.host, bootstrap.port)
+        self.nodes.append(node)
+        return node
+
+def diverged(nodes, k):
+    """Replica copies (of the k-1 nodes after each owner) that differ from the owner's copy of a key."""
+    ordered = sorted(nodes, key=lambda node: node.node_id)
+    ids = [node.node_id for node in ordered]
+    count = 0
+    for i, owner in enumerate(ordered):
+        pred_id = ids[i - 1]
+        replicas = [ordered[(i + j) % len(ordered)] for j in range(1, min(k, len(ordered)))]
+        keys = {key for key_id, kv in owner.data_store.items() if utils.in_interval(key_id, pred_id, owner.node_id, inclusive=True)
+                for key in kv}
+        for replica in replicas:
+            keys_there = {key for key_id, kv in replica.data_store.items() if utils.in_interval(key_id, pred_id, owner.node_id, inclusive=True)
+                          for key in kv}
+            for key in keys | keys_there:
+                key_id = utils.chord_hash(key)
+                if set(owner.data_store.get(key_id, {}).get(key, ())) != set(replica.data_store.get(key_id, {}).get(key, ())):
+                    count += 1
+    return count
+
+def send(cluster, msg):
+    try:
+        cluster.client(msg)
+    except OSError:
+        pass  # The client's own message was lost: the write never happened
+
+def simulate(mode, args):
+    network = InMemoryNetwork(seed=args.seed)
+    size = {"off": 0, "log": args.log_size, "truncated": args.truncated_size, "inline": args.log_size}[mode]
+    cluster = LogCluster(network, args.replication_factor, args.consistency, args.seed, size,
+                         InlineExecutor() if mode == "inline" else None)
+    baseline = threading.active_count()
+    for i in range(args.nodes):
+        cluster.add_node(i)
+    while wrong_pointers(cluster.nodes):
+        cluster.stabilize(1)
+        quiesce(baseline)
+    # Successor lists, and with them the replica chains, settle a few rounds later
+    cluster.stabilize(args.replication_factor)
+    quiesce(baseline)
+
+    rng = random.Random(args.seed)
+    keys = [f"song-{i}" for i in range(args.keys)]
+    for key in keys:
+        cluster.client({"cmd": "PUT", "key": key, "value": "v0"})
+    quiesce(baseline)
+
+    network.loss = args.loss
+    def write():
+        for i in range(args.writes):
+            key = rng.choice(keys)
+            if rng.random() < args.delete_ratio:
+                send(cluster, {"cmd": "DELETE", "key": key, "value": f"v{rng.randrange(4)}"})
+            else:
+                send(cluster, {"cmd": "PUT", "key": key, "value": f"v{rng.randrange(4)}"})
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    writer.join(args.hang_timeout)
+    if writer.is_alive():
+        # A write never returned: a node's write path is stuck
+        return {"mode": mode, "hung": True}
+    quiesce(baseline)
+    network.loss = 0.0
+    dropped = network.stats()["dropped"]
+    before_count = diverged(cluster.nodes, args.replication_factor)
+
+    before = network.stats()
+    for _ in range(args.rounds):
+        cluster.stabilize(1)
+        quiesce(baseline)
+    after = network.stats()
+    stats = {key: sum(node.repl_stats[key] for node in cluster.nodes) for key in ("pages", "entries", "snapshots")}
+    return {
+        "mode": mode,
+        "hung": False,
+        "repl_log_size": size,
+        "dropped_messages": dropped,
+        "diverged_before": before_count,
+        "diverged_after": diverged(cluster.nodes, args.replication_factor),
+        "repl_log_bytes": after["bytes_by_cmd"].get("REPL_LOG", 0) - before["bytes_by_cmd"].get("REPL_LOG", 0),
+        "range_copy_bytes": handoff_bytes(before, after),
+        "log_pages": stats["pages"],
+        "log_entries": stats["entries"],
+        "snapshots": stats["snapshots"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replica divergence after message loss, with and without the replication log")
+    parser.add_argument("--nodes", type=int, default=20)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--keys", type=int, default=500)
+    parser.add_argument("--writes", type=int, default=5000)
+    parser.add_argument("--delete-ratio", dest="delete_ratio", type=float, default=0.3)
+    parser.add_argument("--loss", type=float, default=0.02, help="Probability that a message is dropped while writing")
+    parser.add_argument("--replication-factor", dest="replication_factor", type=int, default=3)
+    parser.add_argument("--consistency", type=str, default="e", choices=["l", "e"])
+    parser.add_argument("--log-size", dest="log_size", type=int, default=10000)
+    parser.add_argument("--truncated-size", dest="truncated_size", type=int, default=20)
+    parser.add_argument("--hang-timeout", dest="hang_timeout", type=float, default=120.0,
+                        help="Seconds the writes may take before they count as hung")
+    parser.add_argument("--rounds", type=int, default=CATCHUP_ROUNDS, help="Stabilize rounds after the writes")
+    parser.add_argument("--id-bits", dest="id_bits", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    utils.set_id_bits(args.id_bits)
+    logging.basicConfig(level=logging.CRITICAL)
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    threading.stack_size(STACK_SIZE)
+
+    reports = []
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for mode in args.modes:
+                reports.append(simulate(mode, args))
+
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+
+    out = json.dumps(reports, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    print(out)
+    if any(report["hung"] for report in reports):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# bench_scan.py
+#
+# What finding songs costs with SCAN compared to pulling the ring with
+# GET *, on the in-process network of simulator.py. Builds a ring of
+# --nodes nodes with k replicas, stores --keys song titles made of common
+# words and runs:
+#
+#   get_all    GET *: every node's whole store to the client
+#   prefix     SCAN of the titles starting with --prefix, all pages
+#   contains   SCAN of the titles containing --contains, all pages
+#   range      SCAN without a filter over a --range-fraction of the ring
+#
+# and reports the messages and bytes each took, the pages, and whether the
+# scan found exactly the titles a scan of every store finds.
+#
+# Example:
+#   python bench_scan.py --nodes 50 --keys 20000 --prefix love --page 100
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import random
+import sys
+import threading
+import utils
+from simulator import Cluster, quiesce, RECURSION_LIMIT
+from transport import InMemoryNetwork
+from bench_join import wrong_pointers, STACK_SIZE
+from bench_compression import WORDS
+
+def expected(cluster, prefix=None, contains=None, key_range=None):
+    """Titles matching the filter, from the stores themselves."""
+    found = set()
+    for node in cluster.nodes:
+        for key_id, kv_dict in node.data_store.items():
+            if key_range and not utils.in_interval(key_id, key_range[0], key_range[1], inclusive=True):
+                continue
+            for title in kv_dict:
+                folded = title.casefold()
+                if folded.startswith((prefix or "").casefold()) and (not contains or contains.casefold() in folded):
+                    found.add(title)
+    return found
+
+def measure(network, op):
+    before = network.stats()
+    out = op()
+    after = network.stats()
+    return out, after["messages"] - before["messages"], after["bytes"] - before["bytes"]
+
+def scan_all(cluster, msg):
+    """Follow the tokens of a SCAN to the end: (titles, pages, failed nodes)."""
+    titles, pages, failed, token = [], 0, 0, None
+    while True:
+        resp = cluster.client(dict(msg, token=token))
+        titles.extend(item[1] for item in resp.get("items", []))
+        failed += resp.get("failed", 0)
+        pages += 1
+        token = resp.get("token")
+        if not token:
+            return titles, pages, failed
+
+def simulate(args):
+    network = InMemoryNetwork(seed=args.seed)
+    cluster = Cluster(network, args.replication_factor, "l", args.seed)
+    baseline = threading.active_count()
+    for i in range(args.nodes):
+        cluster.add_node(i)
+    while wrong_pointers(cluster.nodes):
+        cluster.stabilize(1)
+        quiesce(baseline)
+    for node in cluster.nodes:
+        node.fix_fingers()
+
+    rng = random.Random(args.seed)
+    for i in range(args.keys):
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title() + f" {i}"
+        cluster.client({"cmd": "PUT", "key": title, "value": f"10.0.0.{rng.randrange(256)}:5000"})
+    quiesce(baseline)
+
+    reports = []
+    _, messages, size = measure(network, lambda: cluster.client({"cmd": "GET", "key": "*"}))
+    reports.append({"query": "get_all", "messages": messages, "bytes": size})
+
+    span = int(utils.RING_SIZE * args.range_fraction)
+    start = rng.randrange(utils.RING_SIZE)
+    key_range = [start, (start + span) & utils.ID_MASK]
+    queries = [
+        ("prefix", {"prefix": args.prefix}),
+        ("contains", {"contains": args.contains}),
+        ("range", {"range": key_range}),
+    ]
+    for name, query in queries:
+        msg = dict(query, cmd="SCAN", limit=args.page)
+        (titles, pages, failed), messages, size = measure(network, lambda: scan_all(cluster, msg))
+        truth = expected(cluster, query.get("prefix"), query.get("contains"), query.get("range"))
+        reports.append({
+            "query": name,
+            "matches": len(titles),
+            "pages": pages,
+            "messages": messages,
+            "bytes": size,
+            "exact": sorted(titles) == sorted(truth),
+            "failed_nodes": failed,
+        })
+    return reports
+
+def main():
+    parser = argparse.ArgumentParser(description="Cost of SCAN queries compared to GET *")
+    parser.add_argument("--nodes", type=int, default=50)
+    parser.add_argument("--keys", type=int, default=20000)
+    parser.add_argument("--prefix", type=str, default="love")
+    parser.add_argument("--contains", type=str, default="night fire")
+    parser.add_argument("--range-fraction", dest="range_fraction", type=float, default=0.05,
+                        help="Part of the ring the range scan covers")
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--replication-factor", dest="replication_factor", type=int, default=3)
+    parser.add_argument("--id-bits", dest="id_bits", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    utils.set_id_bits(args.id_bits)
+    logging.basicConfig(level=logging.CRITICAL)
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    threading.stack_size(STACK_SIZE)
+
+    reports = []
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            reports.extend(simulate(args))
+
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+
+    out = json.dumps(reports, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    print(out)
+
+if __name__ == "__main__":
+    main()
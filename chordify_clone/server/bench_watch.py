@@ -0,0 +1,229 @@
+# bench_watch.py
+#
+# What it costs a dashboard to follow --watched songs, polling with GET
+# compared to WATCH, on the in-process network of simulator.py. Builds a
+# ring with k replicas and --keys songs, then for --seconds simulated
+# seconds writes --write-rate PUTs and DELETEs a second to random songs; a
+# node joins a third of the way in and the owner of a watched song departs
+# two thirds in. Same workload, same seed, in both modes:
+#
+#   poll   GET of every watched song each --poll-interval seconds
+#   watch  one WATCH per watched song through one entry node, renewed
+#          every third of the lease; owners push the changes (WATCH_EVENT)
+#
+# and reports the messages and bytes the reads took, the changes of the
+# watched songs, the changes the dashboard saw (a poll sees several as one,
+# or none if they cancel out) and how late it saw them. For WATCH it also
+# checks that every change arrived, in order, across the join and the
+# departure.
+#
+# Example:
+#   python bench_watch.py --nodes 50 --keys 2000 --watched 100 --poll-interval 1
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import random
+import statistics
+import sys
+import threading
+import utils
+from chord_node_simple import ChordNode
+from server import ChordServer
+from simulator import Cluster, quiesce, RECURSION_LIMIT
+from transport import InMemoryNetwork
+from bench_join import wrong_pointers, STACK_SIZE
+from watch import WATCH_LEASE
+
+MODES = ("poll", "watch")
+
+class WatchCluster(Cluster):
+    """A Cluster that keeps its servers, to read the WATCH streams of the entry node."""
+    def __init__(self, network, replication_factor, consistency, seed):
+        super().__init__(network, replication_factor, consistency, seed)
+        self.servers = {}
+
+    def add_node(self, i):
+        host, port = self.address(i)
+        node = ChordNode(host, port, None, None, self.replication_factor, self.consistency,
+                         stabilize_interval=0.0, transport=self.network.transport(host))
+        server = ChordServer(node, listen=False)
+        self.servers[node.node_id] = server
+        self.network.register(host, port, server)
+        if self.nodes:
+            bootstrap = self.rng.choice(self.nodes)
+            node.join(bootstrap.host, bootstrap.port)
+        self.nodes.append(node)
+        return node
+
+def settle(cluster, baseline):
+    while wrong_pointers(cluster.nodes):
+        cluster.stabilize(1)
+        quiesce(baseline)
+    cluster.stabilize(cluster.replication_factor)
+    quiesce(baseline)
+    for node in cluster.nodes:
+        node.fix_fingers()
+
+class Traffic:
+    """Messages and bytes of the requests made inside its with blocks, summed."""
+    def __init__(self, network):
+        self.network = network
+        self.messages = 0
+        self.bytes = 0
+
+    def __enter__(self):
+        self._before = self.network.stats()
+        return self
+
+    def __exit__(self, *exc):
+        after = self.network.stats()
+        self.messages += after["messages"] - self._before["messages"]
+        self.bytes += after["bytes"] - self._before["bytes"]
+
+def simulate(mode, args):
+    network = InMemoryNetwork(seed=args.seed)
+    cluster = WatchCluster(network, args.replication_factor, args.consistency, args.seed)
+    baseline = threading.active_count()
+    for i in range(args.nodes):
+        cluster.add_node(i)
+    settle(cluster, baseline)
+
+    rng = random.Random(args.seed)
+    keys = [f"song-{i}" for i in range(args.keys)]
+    truth = {key: {"v0"} for key in keys}
+    for key in keys:
+        cluster.client({"cmd": "PUT", "key": key, "value": "v0"})
+    quiesce(baseline)
+    watched = rng.sample(keys, args.watched)
+
+    entry = cluster.nodes[0]
+    reads = Traffic(network)
+    # key -> values as the dashboard last saw them, and (time, values) of every change made
+    seen = {key: set(truth[key]) for key in watched}
+    changes = {key: [] for key in watched}
+    lags = []
+    observed = 0
+    streams = {}
+    if mode == "watch":
+        with reads:
+            for key in watched:
+                resp = network.deliver(entry.host, entry.port, {"cmd": "WATCH", "key": key})
+                streams[key] = (resp["watch"], cluster.servers[entry.node_id].watch_streams.open(resp["watch"]["id"]))
+    events = {key: [] for key in watched}
+    before = network.stats()
+
+    renew_every = max(int(WATCH_LEASE / 3), 1)
+    for second in range(args.seconds):
+        if second == args.seconds // 3:
+            cluster.add_node(args.nodes)
+            settle(cluster, baseline)
+        if second == 2 * args.seconds // 3:
+            # The owner of a watched song leaves; its watches move to its successor
+            owner_id = entry.find_successor(utils.chord_hash(watched[0]))[0][0]
+            leaving = next((node for node in cluster.nodes if node.node_id == owner_id and node is not entry), cluster.nodes[-1])
+            cluster.remove_node(leaving)
+            settle(cluster, baseline)
+
+        for j in range(args.write_rate):
+            key = rng.choice(keys)
+            value = f"v{rng.randrange(4)}"
+            if rng.random() < args.delete_ratio:
+                cluster.client({"cmd": "DELETE", "key": key, "value": value})
+                changed = value in truth[key]
+                truth[key].discard(value)
+            else:
+                cluster.client({"cmd": "PUT", "key": key, "value": value})
+                changed = value not in truth[key]
+                truth[key].add(value)
+            if changed and key in changes:
+                changes[key].append((second + (j + 0.5) / args.write_rate, sorted(truth[key])))
+        quiesce(baseline)
+        now = second + 1
+
+        if mode == "poll" and now % args.poll_interval == 0:
+            with reads:
+                for key in watched:
+                    values = set(cluster.client({"cmd": "GET", "key": key}).get("value", []))
+                    if values != seen[key]:
+                        observed += 1
+                        seen[key] = values
+            # Changes made since the last poll were seen now
+            lags.extend(now - t for key in watched for t, _ in changes[key] if now - args.poll_interval < t <= now)
+        elif mode == "watch":
+            for key, (watch, q) in streams.items():
+                while not q.empty():
+                    event = q.get()
+                    events[key].append(event)
+                    observed += 1
+            # Pushed when the owner applied the write, within the same simulated second
+            lags.extend(0.0 for key in watched for t, _ in changes[key] if now - 1 < t <= now)
+            if now % renew_every == 0:
+                with reads:
+                    for watch, _ in streams.values():
+                        entry.chord_watch(watch)
+                quiesce(baseline)
+
+    after = network.stats()
+    report = {
+        "mode": mode,
+        "watched": len(watched),
+        "seconds": args.seconds,
+        "changes_made": sum(len(c) for c in changes.values()),
+        "changes_seen": observed,
+        "lag_s": round(statistics.mean(lags), 3) if lags else None,
+    }
+    if mode == "watch":
+        report["pushed_messages"] = after["by_cmd"].get("WATCH_EVENT", 0) - before["by_cmd"].get("WATCH_EVENT", 0)
+        report["pushed_bytes"] = after["bytes_by_cmd"].get("WATCH_EVENT", 0) - before["bytes_by_cmd"].get("WATCH_EVENT", 0)
+        report["read_messages"] = reads.messages + report["pushed_messages"]
+        report["read_bytes"] = reads.bytes + report["pushed_bytes"]
+        # Every change, in order, with the values it left
+        report["complete"] = all([e["values"] for e in events[key]] == [values for _, values in changes[key]] for key in watched)
+    else:
+        report["read_messages"] = reads.messages
+        report["read_bytes"] = reads.bytes
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Cost of following songs by polling GET compared to WATCH")
+    parser.add_argument("--nodes", type=int, default=50)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--keys", type=int, default=2000)
+    parser.add_argument("--watched", type=int, default=100)
+    parser.add_argument("--seconds", type=int, default=300, help="Simulated seconds")
+    parser.add_argument("--write-rate", dest="write_rate", type=int, default=20, help="Writes per simulated second, to any song")
+    parser.add_argument("--delete-ratio", dest="delete_ratio", type=float, default=0.3)
+    parser.add_argument("--poll-interval", dest="poll_interval", type=int, default=1, help="Seconds between two polls")
+    parser.add_argument("--replication-factor", dest="replication_factor", type=int, default=3)
+    parser.add_argument("--consistency", type=str, default="l", choices=["l", "e"])
+    parser.add_argument("--id-bits", dest="id_bits", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    utils.set_id_bits(args.id_bits)
+    logging.basicConfig(level=logging.CRITICAL)
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    threading.stack_size(STACK_SIZE)
+
+    reports = []
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for mode in args.modes:
+                reports.append(simulate(mode, args))
+
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+
+    out = json.dumps(reports, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    print(out)
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,98 @@
 import socket
 import threading
+import collections
 import json
+import queue
+import random
 from typing import Optional
-from utils import chord_hash, M, in_interval, _serialize_for_json, BUFF_SIZE
-import logging
+import utils
+from utils import chord_hash, vnode_id, in_interval, _serialize_for_json, _deserialize_from_json
+from failure_detector import FailureDetector, PeerUnreachable, DeadlineExceeded
+from replica_selector import ReplicaSelector
+from proximity import RttTable
+from hotkeys import HotKeyTracker
+from rebalance import LoadTracker, TokenBucket, plan_move
+from replog import ReplicationLog, ReplicaProgress
+from scan import TitleIndex
+from watch import WatchTable, WATCH_BATCH
+from transport import TcpTransport
+from metrics import Metrics
+from tracing import Tracer
+import tracing
+import log_config
 import sys
 import signal
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Log categories, sampled and rate limited separately (see log_config.py)
+membership_log = log_config.category("chordify.membership")
+request_log = log_config.category("chordify.request")
+replication_log = log_config.category("chordify.replication")
+transfer_log = log_config.category("chordify.transfer")
+transport_log = log_config.category("chordify.transport")
+
+# Bulk join: lookups before giving up, redirects followed before looking the
+# successor up again, and the base of the randomized backoff (seconds)
+JOIN_ATTEMPTS = 20
+JOIN_REDIRECTS = 3
+JOIN_BACKOFF = 0.05
+# Seconds a node holds back writes to the range of a node that joined before
+# it, and passes on copies of the writes it replicates, at most: the joiner
+# says it is done once it has linked in (see _await_joiners)
+JOIN_HANDOFF_TIMEOUT = 5.0
+
+# Departure cleanup: (key, value) pairs per DELETE_BATCH message, and
+# batches in flight at once
+DELETE_BATCH_SIZE = 1000
+DELETE_BATCH_WORKERS = 8
+
+# A peer that answers BUSY (see admission.py) is asked again after the
+# retry_after_ms it suggests, this many times
+BUSY_RETRIES = 3
+
+# Extra copies of a hot key live this many stabilize rounds (and at least
+# HOT_LEASE_MIN seconds) unless the owner renews them
+HOT_LEASE_ROUNDS = 5
+HOT_LEASE_MIN = 1.0
+
+# Rebalancing: a node and its successor even out their load when one
+# carries more than REBALANCE_RATIO times the other's and at least
+# REBALANCE_MIN_LOAD more. Ranges move REBALANCE_PAGE key ids per message,
+# and a node taking part in a move holds a lease for at most
+# REBALANCE_LEASE seconds
+REBALANCE_RATIO = 1.2
+REBALANCE_MIN_LOAD = 10
+REBALANCE_PAGE = 500
+REBALANCE_LEASE = 30.0
+
+# Fingers are refreshed one per tick, a tick every _finger_wait stabilize
+# rounds: the wait halves when a refresh finds a finger changed (churn) and
+# grows by one round when it does not, within these bounds
+FINGER_MIN_ROUNDS = 1
+FINGER_MAX_ROUNDS = 16
+
+# Proximity: requests whose round trip is mostly network, so their timing
+# feeds the RTT table, and how many nodes of a finger's interval are
+# weighed when picking the closest one
+RTT_CMDS = frozenset(("PING", "NOTIFY", "UPDATE_SUCCESSOR", "UPDATE_PREDECESSOR", "LOAD_REPORT"))
+PNS_CANDIDATES = 8
+# A finger is only replaced by a node this much closer, so noise does not flip it
+PNS_HYSTERESIS = 1.2
+
+# Seconds of a request's deadline kept back for its answer to travel back;
+# each hop a request is passed on has this much less time
+DEADLINE_MARGIN = 0.01
+
+# Replication log: entries per REPL_LOG page, and how many stabilize rounds
+# apart a replica asks each owner whether it missed writes at the end of
+# its log (no later write shows the gap)
+REPL_LOG_PAGE = 500
+CATCHUP_ROUNDS = 5
+
+# Items per SCAN page unless the client asks for another size, and at most
+SCAN_PAGE = 100
+SCAN_MAX_PAGE = 10000
 
 class ChordNode:
     def __init__(
@@ -16,12 +102,38 @@ class ChordNode:
         bootstrap_host: Optional[str] = None,
         bootstrap_port: Optional[int] = None,
         replication_factor: int = 1, # No replication at all,
-        replication_consistency: Optional[int] = None
+        replication_consistency: Optional[int] = None,
+        vnode_index: int = 0,
+        store: Optional[dict] = None,
+        connect_timeout: float = 1.0,
+        read_timeout: float = 5.0,
+        successor_list_size: int = 3,
+        stabilize_interval: float = 1.0,
+        hedge_delay: Optional[float] = None,
+        read_repair_chance: float = 0.0,
+        hot_key_rate: Optional[float] = None,
+        hot_key_replicas: int = 2,
+        rebalance_interval: Optional[float] = None,
+        rebalance_bandwidth: float = 0.0,
+        rebalance_ops_weight: float = 1.0,
+        repl_log_size: int = 10000,
+        transport=None,
+        ipc_dir: Optional[str] = None,
+        compression=None,
+        ring_secret: Optional[str] = None,
+        metrics: Optional[Metrics] = None,
+        tracer: Optional[Tracer] = None,
+        bulk_join: bool = True,
+        fingers: bool = True,
+        proximity: bool = False,
+        async_executor=None
     ):
         # Core state
         self.host = host
         self.port = port
-        self.node_id = chord_hash(f"{host}:{port}")
+        # Virtual node 0 sits at chord_hash(host:port), the others at host:port#index
+        self.vnode_index = vnode_index
+        self.node_id = vnode_id(host, port, vnode_index)
         self.replication_factor = replication_factor
         self.replication_consistency = replication_consistency
         
@@ -30,28 +142,508 @@ class ChordNode:
         # Ring pointers
         self.successor = (self.node_id, self.host, self.port)
         self.predecessor = (self.node_id, self.host, self.port)
+        # Finger i is the first node at or after node_id + 2^i, None until
+        # known. Lookups jump along them (see find_successor); without
+        # fingers they walk the successors. Any node identity in a response
+        # may fix a finger for free, see _learn_fingers.
+        self.fingers = fingers
+        self.finger_table = self._empty_fingers()
+        self.finger_stats = {"refreshes": 0, "changed": 0, "hints": 0}
+        self._next_finger = 0
+        self._finger_wait = FINGER_MIN_ROUNDS
+        self._finger_countdown = FINGER_MIN_ROUNDS
+        # Proximity: every node measures round trip times to its peers. With
+        # proximity on, a finger is the closest of the first nodes of its
+        # interval rather than the first one, and eventual reads go to the
+        # closest replica.
+        self.proximity = proximity
+        self.rtt = RttTable()
 
-        # Data store and tracking
-        self.uploaded_songs = []
-        self.data_store = dict()
+        # Failure handling: socket timeouts, a failure detector fed by every
+        # request and heartbeat, and the next r successors to route around
+        # a dead successor.
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        # Latency of every outbound request per command; shared by the vnodes of a server
+        self.metrics = metrics or Metrics()
+        # Spans of the requests we send, see tracing.py
+        self.tracer = tracer or Tracer()
+        # How requests reach other nodes: TCP (Unix sockets in ipc_dir for
+        # nodes on this host, large frames compressed as compression.py
+        # decides), or an in-memory network in the simulator
+        self.transport = transport or TcpTransport(connect_timeout, read_timeout, self.metrics, ipc_dir, (host,),
+                                                   compression, ring_secret)
+        # Shared by the nodes of the ring; marks their requests over TCP as internal
+        self.ring_secret = ring_secret
+        self._clock = getattr(self.transport, "clock", time.perf_counter)
+        # Runs fire-and-forget sends (see admission.BoundedExecutor); without
+        # one every send gets a thread of its own, as in the simulator
+        self.async_executor = async_executor
+        self.stabilize_interval = stabilize_interval
+        # The list must reach the tail of our replica chain to notice when it loses a member
+        self.successor_list_size = max(successor_list_size, (replication_factor or 1) - 1)
+        self.successor_list = []
+        self.failure_detector = FailureDetector()
+        self._ring_lock = threading.Lock()
+        # Joins into our range are accepted one at a time, see chord_join_range
+        self.bulk_join = bulk_join
+        self._join_lock = threading.Lock()
+        # joiner id -> (joiner, its predecessor, every key, expiry, linked):
+        # nodes we gave keys to lately, see _await_joiners
+        self._handoffs = {}
+        self._handoff_done = threading.Condition()
+        # (low, expiry) of our last TRIM_RANGE: chain writes still on their
+        # way to us for keys it dropped are stale, see _trimmed_away
+        self._trimmed = None
+        # Cleared while we join: writes sent to us wait until we have our range
+        self._joined = threading.Event()
+        self._joined.set()
+
+        # Eventual consistency reads: with a hedge delay set, reads go to the
+        # best of the k replicas and a second one is asked if the first is slow.
+        self.hedge_delay = hedge_delay
+        self.replica_selector = ReplicaSelector(prior=self._peer_rtt if proximity else None)
+        self._replica_cache = {}
+
+        # Read repair. The primary stamps every write with a version
+        # (time_ns, node_id) that travels down the chain; replicas keep the
+        # newest version they applied per key, and per value of a key the
+        # version of its last write and whether it added or deleted the value
+        # (key -> {value: (version, present)}), so diverged copies merge
+        # value by value and a delete is not undone by an older copy.
+        self.read_repair_chance = read_repair_chance
+        self.versions = {}
+        self.value_versions = {}
+        self.read_repair_stats = {"checks": 0, "repairs": 0, "replicas_repaired": 0, "bytes": 0}
+        self._stats_lock = threading.Lock()
+
+        # Hot keys (eventual consistency only). Reads per key go into a
+        # heavy-hitters sketch; the owner of a key read more than
+        # hot_key_rate times a second gives it hot_key_replicas extra
+        # read-only copies after its replica chain, under a lease it renews
+        # while the key stays hot. GET answers advertise all its replicas,
+        # and nodes that forward reads spread them over those.
+        self.hot_keys = HotKeyTracker(hot_key_rate) if hot_key_rate and replication_consistency == "e" else None
+        self.hot_key_replicas = hot_key_replicas
+        self.hot_lease = max(HOT_LEASE_ROUNDS * stabilize_interval, HOT_LEASE_MIN)
+        # Extra copies we hold: key -> (values, version, expiry, owner)
+        self.hot_replicas = {}
+        # Keys we own and copied: key -> (extra nodes, all replicas)
+        self._hot_owned = {}
+        # Replicas advertised to us: key -> (replicas, expiry)
+        self._hot_routes = {}
+        # Reads of other nodes' hot keys we served: key -> [owner, reads]
+        self._hot_served = {}
+        self._hot_lock = threading.Lock()
+
+        # Load-aware rebalancing. Every rebalance_interval seconds we compare
+        # our load (key ids we own plus rebalance_ops_weight times the
+        # requests/s we handle as their owner) with our successor's and shift
+        # our position on the ring to even them out, moving at most
+        # rebalance_bandwidth bytes/s (0: no limit). See _rebalance.
+        self.rebalance_interval = rebalance_interval
+        self.rebalance_bandwidth = rebalance_bandwidth
+        self.rebalance_ops_weight = rebalance_ops_weight
+        self.owner_ops = LoadTracker()
+        self.rebalance_stats = {"rounds": 0, "moves": 0, "key_ids_moved": 0, "bytes": 0}
+        # (holder, expiry) of the node moving a boundary of our range
+        self._rebalance_lease = None
+        self._rebalance_lock = threading.Lock()
+        # Called with (old id, new id) when we move on the ring; the server re-registers us
+        self.on_id_change = None
+
+        # Replication log. As owner we number the writes we apply and keep
+        # the last repl_log_size of them (0: no log); the numbers travel down
+        # the chain with each write. As replica we track, per owner, the last
+        # write applied with none missing before it. A gap, or a periodic
+        # check for writes lost at the end, makes us stream what we missed
+        # with REPL_LOG; only when the owner's log no longer reaches back
+        # that far do we copy its whole range. See _catch_up.
+        self.repl_log = ReplicationLog(repl_log_size) if repl_log_size else None
+        self.replica_progress = ReplicaProgress()
+        self.repl_stats = {"pages": 0, "entries": 0, "snapshots": 0, "bytes": 0}
+        self._catch_up_countdown = CATCHUP_ROUNDS
+        self._catching_up = set()
+        self._catch_up_lock = threading.Lock()
+        # A write is applied and logged (as owner) or noted (as replica) at
+        # once, so log order is the order writes hit the store
+        self._write_lock = threading.Lock()
+
+        # Data store and tracking. Virtual nodes of the same server share one
+        # store, partitioned by the id of the vnode that owns each range.
+        # Keys uploaded through this node -> their key id, deleted when we depart
+        self.uploaded_songs = {}
+        self._store = store
+        self.data_store = store.setdefault(self.node_id, dict()) if store is not None else dict()
+        # Sorted titles of data_store for SCAN filters, see scan.py
+        self.titles = TitleIndex()
+        # Change feeds: watches registered with us as owner of what they
+        # watch, and the changes of our primary range waiting to be pushed to
+        # their subscribers, in order, by one sender at a time. See watch.py.
+        self.watches = WatchTable()
+        self.watch_stats = {"events": 0, "messages": 0, "dropped": 0}
+        self._watch_events = collections.deque()
+        self._watch_pushing = False
+        self._watch_lock = threading.Lock()
 
         # Possibly initialize ring if bootstrap is provided
         if bootstrap_host and bootstrap_port:
             self.join(bootstrap_host, bootstrap_port)
         else:
-            logging.info("[ChordNode] No bootstrap node provided, creating a new ring.")
+            membership_log.info("[ChordNode] No bootstrap node provided, creating a new ring.")
 
     def join(self, bootstrap_host: str, bootstrap_port: int):
         """Join the ring via a known bootstrap node."""
+        if self.bulk_join:
+            self._join_range(bootstrap_host, bootstrap_port)
+        else:
+            self._join_legacy(bootstrap_host, bootstrap_port)
+
+    def _join_range(self, bootstrap_host: str, bootstrap_port: int):
+        """
+        Join by asking our successor for our part of its range (JOIN_RANGE).
+        The successor accepts one joining node at a time and redirects a node
+        that no longer falls in its range to its new predecessor, so any
+        number of nodes can join at once without corrupting pointers. Our
+        keys come back in the same answer; the nodes after us then drop the
+        replicas they no longer hold (TRIM_RANGE).
+        """
+        me = (self.node_id, self.host, self.port)
+        self._joined.clear()
+        with self._join_lock:
+            successor = None
+            redirects = 0
+            for attempt in range(JOIN_ATTEMPTS):
+                if successor is None:
+                    resp = self._send(bootstrap_host, bootstrap_port, {
+                        "cmd": "JOIN",
+                        "host": self.host,
+                        "port": self.port,
+                        "node_id": self.node_id
+                    })
+                    if "successor" not in resp:
+                        time.sleep(random.uniform(0, JOIN_BACKOFF * (attempt + 1)))
+                        continue
+                    successor = tuple(resp["successor"])
+                    redirects = 0
+                resp = self._send_to(successor, {"cmd": "JOIN_RANGE", "node": me})
+                if resp.get("status") == "OK":
+                    break
+                if resp.get("status") == "REDIRECT" and redirects < JOIN_REDIRECTS:
+                    # Someone joined between our predecessor and our successor first
+                    successor = tuple(resp["owner"])
+                    redirects += 1
+                else:
+                    # Unreachable, still joining or too far away: look it up again
+                    successor = None
+                    time.sleep(random.uniform(0, JOIN_BACKOFF * (attempt + 1)))
+            else:
+                membership_log.error("[Node %s] Could not join via %s:%s", self.node_id, bootstrap_host, bootstrap_port)
+                self._joined.set()
+                return
+
+            # Merged, not stored: writes our successor passed on since it
+            # answered may be here already (see _joiners_for)
+            keys = _deserialize_from_json(resp.get("keys", {}))
+            records = resp.get("value_versions", {})
+            for k_int, kv_dict in keys.items():
+                for k, v in kv_dict.items():
+                    self._merge_values(int(k_int), k, v, records.pop(k, None))
+            for key, recs in records.items():
+                self._merge_values(chord_hash(key), key, (), recs)
+            for key, version in resp.get("versions", {}).items():
+                self._set_version(key, version)
+            with self._ring_lock:
+                # A node that joined right after us may have linked to us already (accept_successor)
+                if self.successor[0] == self.node_id or not in_interval(self.successor[0], self.node_id, successor[0]):
+                    self.successor = successor
+                self._update_successor_list([successor] + resp.get("successor_list", []))
+            self.predecessor = tuple(resp["predecessor"])
+            # After the keys, so storing them does not look like changes
+            for watch in resp.get("watches", []):
+                self.watches.add(watch)
+
+            # Our predecessor links to us, and our successor stops passing
+            # our writes on. Still under _join_lock: until then our range is
+            # the one our successor knows, so nobody may join in front of us
+            if self.predecessor[0] != self.node_id:
+                self._send_to(self.predecessor, {
+                    "cmd": "UPDATE_SUCCESSOR",
+                    "new_succ_id": self.node_id,
+                    "new_succ_host": self.host,
+                    "new_succ_port": self.port,
+                    "join": True
+                })
+            self._send_to(successor, {"cmd": "JOIN_RANGE", "node": me, "done": True})
+            self._joined.set()
+        transfer_log.info("[Node %s] Got %s key ids from %s", self.node_id, len(keys), successor[0])
+        self._trim_after_join()
+        membership_log.info("[Node %s] Joined ring via %s:%s & got successor %s & Predecessor: %s",
+                            self.node_id, bootstrap_host, bootstrap_port, self.successor, self.predecessor)
+
+    def chord_join_range(self, new_node, done=False):
+        """
+        A node wants to join between our predecessor and us. Accept it if it
+        still falls in our range: it becomes our predecessor and gets every
+        key we hold except (new node, us], which is exactly its primary range
+        and the replicas it must keep. Otherwise send it to our predecessor.
+        Once it has linked in and trimmed, it tells us it is done.
+        """
+        new_node = tuple(new_node)
+        if done:
+            with self._handoff_done:
+                entry = self._handoffs.get(new_node[0])
+                if entry is not None:
+                    self._handoffs[new_node[0]] = entry[:4] + (True,)
+                self._handoff_done.notify_all()
+            return {"status": "OK"}
+        with self._join_lock:
+            pred = self.predecessor or (self.node_id, self.host, self.port)
+            if new_node[0] == self.node_id:
+                return {"status": "ERROR", "error": "node id taken"}
+            if self._leased():
+                # A boundary of our range is moving, see _rebalance; the joiner backs off
+                return {"status": "RETRY"}
+            if not in_interval(new_node[0], pred[0], self.node_id):
+                return {"status": "REDIRECT", "owner": pred}
+            # With the new node the ring has at most k nodes: each one holds
+            # every key. Only if our successor list wraps around to our
+            # predecessor does it hold every other node
+            small = (len(self.successor_list) + 2 <= (self.replication_factor or 1)
+                     and (pred[0] == self.node_id or pred in self.successor_list))
+            # Under _write_lock: a write we apply as owner either makes it
+            # into the keys or finds the new node owns the key (see _owns)
+            with self._write_lock:
+                if small:
+                    keys = dict(self.data_store)
+                    records = dict(self.value_versions)
+                else:
+                    keys = {k_int: kv_dict for k_int, kv_dict in self.data_store.items()
+                            if not in_interval(int(k_int), new_node[0], self.node_id, inclusive=True)}
+                    # Tombstones of keys deleted altogether included
+                    records = {key: recs for key, recs in list(self.value_versions.items())
+                               if not in_interval(chord_hash(key), new_node[0], self.node_id, inclusive=True)}
+                self.predecessor = new_node
+                with self._handoff_done:
+                    self._handoffs[new_node[0]] = (new_node, pred[0], small, time.monotonic() + JOIN_HANDOFF_TIMEOUT, False)
+            if self.successor[0] == self.node_id:
+                # We were alone
+                self.successor = new_node
+                self.successor_list = [new_node]
+        membership_log.info("[Node %s] %s joins our range (%s, %s]", self.node_id, new_node[0], pred[0], self.node_id)
+        return {
+            "status": "OK",
+            "predecessor": pred,
+            "successor_list": self.successor_list,
+            "keys": _serialize_for_json(keys),
+            "versions": {k: self.versions[k] for kv_dict in keys.values() for k in kv_dict if k in self.versions},
+            "value_versions": {key: self._records_to_json(recs) for key, recs in records.items()},
+            # It pushes the changes of its primary range from now on
+            "watches": self.watches.intersecting(pred[0], new_node[0]),
+        }
+
+    def accept_successor(self, candidate):
+        """A node that just joined after us: link to it if it is closer than our successor."""
+        candidate = tuple(candidate)
+        with self._ring_lock:
+            if self.successor[0] != self.node_id and not in_interval(candidate[0], self.node_id, self.successor[0]):
+                return "STALE"
+            self.successor_list = ([candidate] + [e for e in self.successor_list if e[0] != candidate[0]])[:self.successor_list_size]
+            self.successor = candidate
+        return "OK"
+
+    def _trim_after_join(self):
+        """
+        With us in the ring, we and each of the k nodes after us may hold one
+        range too many. We keep (p_k, us] and the i-th node after us keeps
+        (p_(k-i), itself], where p_j is our j-th predecessor (p_0 is us).
+        A node that joins meanwhile makes these bounds too low, so we walk
+        back again after the trim and trim once more if they moved; a node
+        that finds a new predecessor in front of it works out its own bound.
+        """
+        trimmed = None
+        for attempt in range(JOIN_ATTEMPTS):
+            bounds = self._predecessor_bounds()
+            if bounds is None or bounds == trimmed:
+                # At most k nodes (every node holds every key), or nothing moved
+                return
+            trimmed = bounds
+            self.chord_trim_range(bounds[:1], self.node_id)
+            msg = {"cmd": "TRIM_RANGE", "bounds": bounds[1:], "origin": self.node_id, "sender": self.node_id}
+            if self.replication_consistency == "e":
+                self._send_to_successor_async(msg)
+            else:
+                self._send_to_successor(msg)
+
+    def _predecessor_bounds(self):
+        """
+        [p_k, ..., p_1, us], p_j our j-th predecessor, walking back along the
+        predecessor pointers; None if the ring has at most k nodes. A node
+        that still points to itself is joining and links to its predecessor
+        in a moment, so we ask it again.
+        """
+        k = self.replication_factor or 1
+        bounds = [self.node_id]
+        node = self.predecessor
+        while len(bounds) <= k:
+            if node is None or node[0] in bounds:
+                return None
+            bounds.insert(0, node[0])
+            if len(bounds) <= k:
+                for attempt in range(JOIN_ATTEMPTS):
+                    info = self._send_to(node, {"cmd": "GET_NODE_INFO", "summary": True})
+                    pred = tuple(info["predecessor"]) if info.get("predecessor") else None
+                    if pred is None or pred[0] != node[0]:
+                        break
+                    time.sleep(random.uniform(0, JOIN_BACKOFF))
+                node = pred
+        return bounds
+
+    def chord_trim_range(self, bounds, origin, sender=None):
+        """
+        Drop the key ids outside (bounds[0], us] and pass the rest of the
+        bounds on. If the node before us is not the sender, someone joined
+        in between and the bounds are too low: we walk back ourselves.
+        """
+        if sender is not None and self.predecessor and self.predecessor[0] != sender:
+            fresh = self._predecessor_bounds()
+            if fresh is not None:
+                bounds = fresh[:len(bounds)]
+        low = bounds[0]
+        with self._write_lock:
+            dropped = [k_int for k_int in list(self.data_store)
+                       if not in_interval(int(k_int), low, self.node_id, inclusive=True)]
+            for k_int in dropped:
+                self.data_store.pop(k_int, None)
+            self._forget_writes(lambda key_id: in_interval(key_id, low, self.node_id, inclusive=True))
+            self._trimmed = (low, time.monotonic() + JOIN_HANDOFF_TIMEOUT)
+        if dropped:
+            self.titles.invalidate()
+            transfer_log.info("[Node %s] Trimmed %s key ids outside (%s, %s]", self.node_id, len(dropped), low, self.node_id)
+        if len(bounds) > 1 and self.successor[0] not in (origin, self.node_id):
+            msg = {"cmd": "TRIM_RANGE", "bounds": bounds[1:], "origin": origin, "sender": self.node_id}
+            if self.replication_consistency == "e":
+                self._send_to_successor_async(msg)
+            else:
+                self._send_to_successor(msg)
+        return len(dropped)
+
+    def _write_owner(self, key_id):
+        """
+        The node a write of key_id goes to: the owner a lookup finds, checked
+        against our predecessor. Lookups end at the node after a joiner until
+        every pointer has caught up, so a key of (predecessor, us] is ours,
+        and one found to be ours that lies before a predecessor done joining
+        goes to it. Writes to the range of a joiner that has not linked in
+        yet wait until it has (see _await_joiners), and so do writes that
+        reach us while we join ourselves.
+        """
+        self._joined.wait(JOIN_HANDOFF_TIMEOUT)
+        self._await_joiners(key_id)
+        me = (self.node_id, self.host, self.port)
+        owner, _ = self.find_successor(key_id)
+        pred = self.predecessor
+        if pred is None or pred[0] == self.node_id:
+            return owner
+        if in_interval(key_id, pred[0], self.node_id, inclusive=True):
+            return me
+        if owner[0] == self.node_id:
+            return pred
+        return owner
+
+    def _owns(self, key_id) -> bool:
+        """
+        True if key_id lies in our primary range. Checked again under
+        _write_lock before a write is applied as owner: chord_join_range
+        hands a range over under the same lock.
+        """
+        pred = self.predecessor
+        return pred is None or pred[0] == self.node_id or in_interval(key_id, pred[0], self.node_id, inclusive=True)
+
+    def _await_joiners(self, key_id):
+        """
+        Block while key_id falls in the range of a node we answered
+        JOIN_RANGE that has not told us it is done: it owns the key from
+        the moment it got its keys, but only takes writes once it has
+        linked in. A joiner that never says so is given up on after
+        JOIN_HANDOFF_TIMEOUT.
+        """
+        def joining():
+            now = time.monotonic()
+            for joiner_id, (_, low, _, expiry, linked) in list(self._handoffs.items()):
+                if expiry < now:
+                    self._handoffs.pop(joiner_id, None)
+                elif not linked and in_interval(key_id, low, joiner_id, inclusive=True):
+                    return True
+            return False
+        with self._handoff_done:
+            self._handoff_done.wait_for(lambda: not joining(), timeout=JOIN_HANDOFF_TIMEOUT)
+
+    def _joiners_for(self, key_id, sender=None):
+        """
+        Nodes we answered JOIN_RANGE hold the key ids we gave them from then
+        on, but a replica chain skips them until their predecessor links to
+        them: a write comes down it from `sender` straight to us. Returns the
+        joiners between sender and us that hold key_id, in ring order, for
+        the chain to go through before us, and the joiners holding every key
+        (a ring of at most k nodes) that have not linked in yet, to copy it
+        to. Called under _write_lock, which chord_join_range hands a range
+        over under: a joiner either got the write with its keys or is here.
+        """
+        if not self._handoffs:
+            return [], []
+        now = time.monotonic()
+        skipped = []
+        copies = []
+        for joiner_id, (joiner, _, everything, expiry, linked) in list(self._handoffs.items()):
+            if expiry < now:
+                continue
+            if (sender not in (None, joiner_id) and in_interval(joiner_id, sender, self.node_id)
+                    and not in_interval(key_id, joiner_id, self.node_id, inclusive=True)):
+                skipped.append(joiner)
+            elif everything and not linked:
+                copies.append(joiner)
+        skipped.sort(key=lambda joiner: utils.ring_distance(sender, joiner[0]))
+        return skipped, copies
+
+    def _trimmed_away(self, key_id) -> bool:
+        """
+        True if a TRIM_RANGE dropped key_id from us lately: a write down a
+        replica chain that was one node longer before the join reached us
+        after the trim. Called under _write_lock.
+        """
+        if self._trimmed is None:
+            return False
+        low, expiry = self._trimmed
+        if expiry < time.monotonic():
+            self._trimmed = None
+            return False
+        return not in_interval(key_id, low, self.node_id, inclusive=True)
+
+    def _copy_to_joiners(self, joiners, cmd, key, value, version):
+        for joiner in joiners:
+            msg = {"cmd": cmd, "key": key, "value": value, "start_node_id": self.node_id, "ttl": 1, "version": version}
+            if self.replication_consistency == "e":
+                self._send_to_async(joiner, msg)
+            else:
+                self._send_to(joiner, msg)
+
+    def _join_legacy(self, bootstrap_host: str, bootstrap_port: int):
+        """
+        The original join: blind UPDATE_SUCCESSOR/UPDATE_PREDECESSOR and a
+        TRANSFER_KEYS chain. Only safe when nodes join one at a time.
+        """
         successor_info = self._send(bootstrap_host, bootstrap_port, {
             "cmd": "JOIN",
             "host": self.host,
-            "port": self.port
+            "port": self.port,
+            "node_id": self.node_id
         })
         if "successor" in successor_info and "predecessor" in successor_info:
-            logging.info(f"[Node {self.node_id}] On join the ring, got info: {successor_info}") 
+            membership_log.info("[Node %s] On join the ring, got info: %s", self.node_id, successor_info) 
             self.successor = tuple(successor_info["successor"])
             self.predecessor = tuple(successor_info["predecessor"])
+            self.successor_list = [self.successor]
             
             # If eventual consistency, we can asynchronously notify predecessor & successor
             update_succ_msg = {
@@ -69,29 +661,29 @@ class ChordNode:
             # Notify predecessor and notify successor
             if self.replication_consistency == "e":
                 # asynchronous updates
-                self._send_async(self.predecessor[1], self.predecessor[2], update_succ_msg)
-                self._send_async(self.successor[1], self.successor[2], update_pred_msg)
+                self._send_to_async(self.predecessor, update_succ_msg)
+                self._send_to_async(self.successor, update_pred_msg)
             
                 threading.Thread(
-                    target=self._acquire_keys,
+                    target=tracing.traced(self._acquire_keys),
                     args=(self.node_id, self.node_id, self.replication_factor+1 if self.replication_factor else self.replication_factor),
                     daemon=True
                 ).start()
             else:
-                print(f"[Node {self.node_id}] Notifying predecessor {self.predecessor}")
+                membership_log.info("[Node %s] Notifying predecessor %s", self.node_id, self.predecessor)
                 # linearizable => synchronous
-                status = self._send(self.predecessor[1], self.predecessor[2], update_succ_msg)
-                logging.info(f"[Node {self.node_id}] Notified predecessor {self.predecessor} => {status}")
-                status = self._send(self.successor[1], self.successor[2], update_pred_msg)
-                logging.info(f"[Node {self.node_id}] Notified successor {self.successor} => {status}")
+                status = self._send_to(self.predecessor, update_succ_msg)
+                membership_log.info("[Node %s] Notified predecessor %s => %s", self.node_id, self.predecessor, status)
+                status = self._send_to(self.successor, update_pred_msg)
+                membership_log.info("[Node %s] Notified successor %s => %s", self.node_id, self.successor, status)
                 self._acquire_keys(self.node_id, self.node_id, self.replication_factor+1 if self.replication_factor else self.replication_factor)
         else:
             # fallback
             self.successor = (self.node_id, self.host, self.port)
             self.predecessor = (self.node_id, self.host, self.port)
 
-        logging.info(f"[Node {self.node_id}] Joined ring via {bootstrap_host}:{bootstrap_port} "
-              f"& got successor {self.successor} & Predecessor: {self.predecessor}")
+        membership_log.info("[Node %s] Joined ring via %s:%s & got successor %s & Predecessor: %s",
+                            self.node_id, bootstrap_host, bootstrap_port, self.successor, self.predecessor)
 
     def depart(self):
         """
@@ -101,15 +693,16 @@ class ChordNode:
         3. Notify predecessor and successor to link each other.
         4. Close server socket.
         """
-        ret = [self.chord_delete(song, f"{self.host}:{self.port}", self.node_id, self.replication_factor - 1 if self.replication_factor else self.replication_factor) for song in self.uploaded_songs]
-        logging.info(f"Deleted songs' status: {list(zip(self.uploaded_songs, ret))}")
+        # 1) Our uploads are deleted in batches per owner, in the background
+        # while the handoff below runs
+        deletes = self._delete_uploads()
 
         # 3) Notify predecessor & successor to link each other
         succ_id, succ_host, succ_port = self.successor
         pred_id, pred_host, pred_port = self.predecessor if self.predecessor else (None, None, None)
 
         if pred_id is not None and (pred_id != self.node_id):
-            logging.info(f"[Node {self.node_id}] Notifying predecessor {pred_id} to link successor {succ_id}")
+            membership_log.info("[Node %s] Notifying predecessor %s to link successor %s", self.node_id, pred_id, succ_id)
             update_succ_msg = {
                 "cmd": "UPDATE_SUCCESSOR",
                 "new_succ_id": succ_id,
@@ -117,13 +710,13 @@ class ChordNode:
                 "new_succ_port": succ_port
             }
             if self.replication_consistency == "e":
-                self._send_async(pred_host, pred_port, update_succ_msg)
+                self._send_to_async(self.predecessor, update_succ_msg)
             else:
-                self._send(pred_host, pred_port, update_succ_msg)
+                self._send_to(self.predecessor, update_succ_msg)
 
 
         if succ_id != self.node_id:
-            logging.info(f"[Node {self.node_id}] Notifying successor {succ_id} to link predecessor {pred_id}")
+            membership_log.info("[Node %s] Notifying successor %s to link predecessor %s", self.node_id, succ_id, pred_id)
             update_pred_msg = {
                 "cmd": "UPDATE_PREDECESSOR",
                 "new_pred_id": pred_id,
@@ -131,90 +724,829 @@ class ChordNode:
                 "new_pred_port": pred_port
             }
             if self.replication_consistency == "e":
-                self._send_async(succ_host, succ_port, update_pred_msg)
+                self._send_to_async(self.successor, update_pred_msg)
             else:
-                self._send(succ_host, succ_port, update_pred_msg)       
+                self._send_to(self.successor, update_pred_msg)
         
         move_all_keys = {
             "cmd": "MOVE_ALL_KEYS",
             "ttl": self.replication_factor if self.replication_factor else 1,
-            "data_store": _serialize_for_json(self.data_store)
+            "data_store": _serialize_for_json(self.data_store),
+            # The nodes after us drop our uploads before passing their
+            # replicas on, or a copy could outrun its DELETE_BATCH
+            "deleted": {"value": f"{self.host}:{self.port}", "keys": list(self.uploaded_songs)},
+            # The watches of our range, which our successor owns from now on
+            "watches": self.watches.intersecting(pred_id if pred_id is not None else self.node_id, self.node_id)
         }
         if self.replication_consistency == "e":
-            self._send_async(succ_host, succ_port, move_all_keys)
+            self._send_to_successor_async(move_all_keys)
         else:
-            resp = self._send(succ_host, succ_port, move_all_keys)
-            logging.info(f"RESPONSE from MOVE_ALL_KEYS: {resp}")
+            resp = self._send_to_successor(move_all_keys)
+            transfer_log.debug("RESPONSE from MOVE_ALL_KEYS: %s", resp)
         
         self.data_store.clear()
+        self.titles.invalidate()
 
+        deleted = sum(f.result().get("deleted", 0) for f in deletes)
+        membership_log.info("[Node %s] Deleted %s of our %s uploaded songs", self.node_id, deleted, len(self.uploaded_songs))
+        self.uploaded_songs.clear()
+
+    def _delete_uploads(self):
+        """
+        Send DELETE_BATCH messages removing our address from every song we
+        uploaded, one lookup per owner instead of one per song. Our own copies
+        are dropped first, so the handoff cannot bring them back. Returns the
+        futures of the batches.
+        """
+        value = f"{self.host}:{self.port}"
+        for key, key_id in self.uploaded_songs.items():
+            self._delete_value(key_id, key, value)
+
+        executor = ThreadPoolExecutor(max_workers=DELETE_BATCH_WORKERS)
+        futures = []
+        for owner, items in self._group_by_owner(self.uploaded_songs).items():
+            for i in range(0, len(items), DELETE_BATCH_SIZE):
+                batch = [[key, value] for key in items[i:i + DELETE_BATCH_SIZE]]
+                if owner[0] == self.node_id:
+                    # We are leaving: the rest of our replica chain deletes them
+                    if not self.replication_factor or self.replication_factor < 2 or self.successor[0] == self.node_id:
+                        continue
+                    msg = {"cmd": "DELETE_BATCH", "items": batch, "start_node_id": self.node_id,
+                           "ttl": self.replication_factor - 1, "version": self._next_version()}
+                    futures.append(executor.submit(tracing.traced(self._send_to_successor), msg))
+                else:
+                    msg = {"cmd": "DELETE_BATCH", "items": batch, "start_node_id": owner[0]}
+                    futures.append(executor.submit(tracing.traced(self._send_to), owner, msg))
+        executor.shutdown(wait=False)
+        return futures
+
+    def _group_by_owner(self, keys):
+        """
+        {owner: [key, ...]} for a {key: key_id} dict. Key ids are visited
+        clockwise from us, so the keys of an owner are consecutive and one
+        lookup per owner covers them all.
+        """
+        groups = {}
+        owner = pred = None
+        for key, key_id in sorted(keys.items(), key=lambda kv: utils.ring_distance(self.node_id, kv[1])):
+            if owner is None or not in_interval(key_id, pred[0], owner[0], inclusive=True):
+                owner, pred = self.find_successor(key_id)
+                owner, pred = tuple(owner), tuple(pred)
+            groups.setdefault(owner, []).append(key)
+        return groups
 
     def find_successor(self, key_id: int):
-        succ_id, succ_host, succ_port = self.successor
-        if in_interval(key_id, self.node_id, succ_id, inclusive=True):
-            return self.successor, (self.node_id, self.host, self.port)
+        # Suspected successors are skipped: the next live one holds their replicas
+        successor = self._live_successor()
+        if in_interval(key_id, self.node_id, successor[0], inclusive=True):
+            return successor, (self.node_id, self.host, self.port)
         else:
-            next_node = self.successor # self.closest_preceding_node(key_id)
-            if next_node[0] == self.node_id:
-                return self.successor, (self.node_id, self.host, self.port)
-            resp = self._send(next_node[1], next_node[2], {
-                "cmd": "FIND_SUCCESSOR",
-                "key_id": key_id
-            })
+            if successor[0] == self.node_id:
+                return successor, (self.node_id, self.host, self.port)
+            msg = {"cmd": "FIND_SUCCESSOR", "key_id": key_id}
+            resp = {}
+            finger = self.closest_preceding_node(key_id) if self.fingers else successor
+            if finger[0] not in (self.node_id, successor[0]):
+                try:
+                    resp = self._request_to(finger, msg)
+                except PeerUnreachable:
+                    self._forget_finger(finger)
+            if "successor" not in resp:
+                # No finger before the key, or it failed: walk the successors
+                resp = self._send_to_successor(msg)
             if "successor" not in resp or "predecessor" not in resp:
-                return self.successor, (self.node_id, self.host, self.port)
+                return successor, (self.node_id, self.host, self.port)
             else:
+                self._learn_fingers((resp["successor"], resp["predecessor"]))
                 return tuple(resp["successor"]), tuple(resp["predecessor"])
 
+    def start_maintenance(self):
+        """Run stabilize and the predecessor heartbeat in a background thread."""
+        t = threading.Thread(target=self._periodic_tasks, daemon=True)
+        t.start()
+
+    def _periodic_tasks(self):
+        """ Periodically call stabilize and check_predecessor. """
+        while True:
+            time.sleep(self.stabilize_interval)
+            try:
+                self.stabilize()
+                self.check_predecessor()
+                self._finger_tick()
+                self._refresh_hot_keys()
+                self._catch_up_tick()
+            except Exception as e:
+                membership_log.error("[Node %s] Maintenance error: %s", self.node_id, e)
+
+    def stabilize(self):
+        """
+        Periodically verify our immediate successor, refresh our successor
+        list from its own and tell the successor about ourselves.
+        A successor that keeps missing heartbeats is replaced by the next
+        live entry of the successor list.
+        """
+        if self.successor[0] == self.node_id:
+            return
+        try:
+            resp = self._request_to(self.successor, {"cmd": "GET_NODE_INFO", "summary": True})
+        except PeerUnreachable:
+            if self._is_suspected(self.successor):
+                self._successor_failed(self.successor)
+            return
+
+        # A node joined between us and our successor
+        successor_list = resp.get("successor_list", [])
+        x = resp.get("predecessor")
+        notified = bool(x) and x[0] == self.node_id
+        if x and not notified and in_interval(x[0], self.node_id, self.successor[0]):
+            x = tuple(x)
+            if not self._is_suspected(x) and self._send_to(x, {"cmd": "PING"}).get("status") == "OK":
+                successor_list = [self.successor] + successor_list
+                self.successor = x
+                notified = False
+
+        self._update_successor_list(successor_list)
+        self._learn_fingers(successor_list)
+
+        # Notify our successor that we might be its predecessor
+        if not notified:
+            self._send_to(self.successor, {
+                "cmd": "NOTIFY",
+                "candidate": (self.node_id, self.host, self.port)
+            })
+
+    def check_predecessor(self):
+        """Heartbeat our predecessor, so the failure detector learns when it dies."""
+        if self.predecessor is None or self.predecessor[0] == self.node_id:
+            return
+        try:
+            self._request_to(self.predecessor, {"cmd": "PING"})
+        except PeerUnreachable:
+            membership_log.warning("[Node %s] Predecessor %s missed a heartbeat", self.node_id, self.predecessor)
+
+    def notify(self, candidate):
+        """
+        Called by 'candidate' node that thinks it might be our predecessor.
+        We update our predecessor if 'candidate' is indeed between our old
+        predecessor and ourselves, or if our old predecessor has failed.
+        """
+        if candidate is None:
+            return
+        candidate = tuple(candidate)
+        pred = self.predecessor
+        pred_failed = pred is not None and pred[0] != self.node_id and self._is_suspected(pred)
+        if (pred is None or pred[0] == self.node_id or pred_failed
+                or in_interval(candidate[0], pred[0], self.node_id)):
+            self.predecessor = candidate
+            if pred_failed:
+                # We took over the failed predecessor's range
+                self._trimmed = None
+                self._replicate_own_range()
+
+    def _update_successor_list(self, successor_list):
+        """Our successor followed by its own list, cut at r entries or where the ring wraps."""
+        new_list = []
+        for entry in [self.successor] + [tuple(e) for e in successor_list]:
+            if entry[0] == self.node_id or len(new_list) == self.successor_list_size:
+                break
+            if entry not in new_list:
+                new_list.append(entry)
+        # A member of our replica chain left the ring: its replacement at the
+        # tail of the chain has no copy of our range yet
+        chain = self.successor_list[:max((self.replication_factor or 1) - 1, 0)]
+        lost = [e for e in chain if e not in new_list]
+        self.successor_list = new_list
+        if lost:
+            self._replicate_own_range()
+
+    def _replicate_own_range(self):
+        """
+        Push our primary range (predecessor, self] down the replica chain again,
+        so that it is back to replication_factor copies after a failure.
+        """
+        if not self.replication_factor or self.replication_factor <= 1 or self.successor[0] == self.node_id:
+            return
+        pred_id = self.predecessor[0]
+        own_range = {k_int: kv_dict for k_int, kv_dict in self.data_store.items()
+                     if in_interval(int(k_int), pred_id, self.node_id, inclusive=True)}
+        if not own_range:
+            return
+        replication_log.info("[Node %s] Re-replicating %s key ids of (%s, %s]", self.node_id, len(own_range), pred_id, self.node_id)
+        self._send_to_successor_async({
+            "cmd": "REPLICATE_RANGE",
+            "origin": self.node_id,
+            "ttl": self.replication_factor - 1,
+            "data_store": _serialize_for_json(own_range)
+        })
+
+    def chord_replicate_range(self, data_store, origin, ttl):
+        """Merge a re-replicated range and pass it on until ttl copies were made."""
+        for k_int, kv_dict in data_store.items():
+            for k, v in kv_dict.items():
+                self._store_new_value(int(k_int), k, v)
+        if ttl > 1 and self.successor[0] not in (origin, self.node_id):
+            self._send_to_successor_async({
+                "cmd": "REPLICATE_RANGE",
+                "origin": origin,
+                "ttl": ttl - 1,
+                "data_store": _serialize_for_json(data_store)
+            })
+
+    def _log_write(self, cmd, key, value, version):
+        """Append a write we applied as owner to our log; what the chain carries of it, or None without a log."""
+        if self.repl_log is None or not self.replication_factor or self.replication_factor <= 1:
+            return None
+        seq = self.repl_log.append(cmd, key, value, version)
+        return {"origin": [self.node_id, self.host, self.port], "epoch": self.repl_log.epoch, "seq": [seq, seq]}
+
+    def _note_log(self, log) -> bool:
+        """
+        Writes log["seq"] of an owner's log reached us down the chain. True
+        if earlier ones did not: called under _write_lock, so the caller
+        starts the catch-up (_start_catch_up) once it released the lock.
+        """
+        if not log:
+            return False
+        first, last = log["seq"]
+        if self.replica_progress.note(log["origin"], log["epoch"], first, last):
+            replication_log.info("[Node %s] Writes before %s of %s missing, catching up", self.node_id, first, log["origin"][0])
+            return True
+        return False
+
+    def _start_catch_up(self, owner_id):
+        """
+        Catch up with owner_id on a thread of its own. Never through
+        _spawn: a full async_executor runs tasks inline, and _catch_up
+        takes _write_lock, which the caller may hold.
+        """
+        threading.Thread(target=tracing.traced(self._catch_up), args=(owner_id,), daemon=True).start()
+
+    def chord_repl_log(self, after, epoch=None, limit=REPL_LOG_PAGE):
+        """
+        Up to limit entries of our log after seq `after`, with the ids of our
+        replica chain so a node that left it can stop asking. If the log does
+        not reach back that far, or `epoch` is not ours (we restarted), the
+        answer is a snapshot: the range to copy with TRANSFER_KEYS.
+        """
+        chain = [e[0] for e in self.successor_list[:max((self.replication_factor or 1) - 1, 0)]]
+        # Our primary range now: the keys of older entries may have moved to a node that joined
+        primary = [self.predecessor[0], self.node_id]
+        if self.repl_log is None:
+            return {"snapshot": True, "range": primary, "epoch": None, "seq": 0, "chain": chain}
+        resp = {"epoch": self.repl_log.epoch, "seq": self.repl_log.seq, "chain": chain, "range": primary}
+        entries = self.repl_log.since(int(after), limit) if epoch == self.repl_log.epoch else None
+        if entries is None:
+            resp["snapshot"] = True
+        else:
+            resp["entries"] = entries
+        return resp
+
+    def _catch_up_tick(self):
+        """Every CATCHUP_ROUNDS calls, check with every owner we replicate whether we missed its last writes."""
+        self._catch_up_countdown -= 1
+        if self._catch_up_countdown > 0:
+            return
+        self._catch_up_countdown = CATCHUP_ROUNDS
+        for owner_id in list(self.replica_progress.owners):
+            self._start_catch_up(owner_id)
+
+    def _catch_up(self, owner_id):
+        """
+        Stream the writes of owner_id's log we have not applied, a page per
+        REPL_LOG, replaying them in order from the first one missing (the
+        later ones we have are applied again, so the last write to a value
+        wins). A truncated log means copying the owner's range instead.
+        """
+        with self._catch_up_lock:
+            if owner_id in self._catching_up:
+                return
+            self._catching_up.add(owner_id)
+        try:
+            while True:
+                known = self.replica_progress.get(owner_id)
+                if known is None:
+                    return
+                owner = tuple(known["node"])
+                resp = self._send_to(owner, {"cmd": "REPL_LOG", "after": known["seq"], "epoch": known["epoch"], "limit": REPL_LOG_PAGE})
+                if not resp:
+                    if self._is_suspected(owner):
+                        # Its range is re-replicated by whoever takes it over
+                        self.replica_progress.forget(owner_id)
+                    return
+                if self.node_id not in resp.get("chain", []) and self.replica_progress.idle(owner_id):
+                    # Out of its chain and its writes stopped coming
+                    self.replica_progress.forget(owner_id)
+                    return
+                with self._stats_lock:
+                    self.repl_stats["bytes"] += len(json.dumps(resp))
+                if resp.get("snapshot"):
+                    start, end = resp["range"]
+                    replication_log.info("[Node %s] Log of %s truncated, copying (%s, %s]", self.node_id, owner_id, start, end)
+                    if not self._fetch_range(owner, start, end, TokenBucket(0), self.repl_stats):
+                        return
+                    with self._stats_lock:
+                        self.repl_stats["snapshots"] += 1
+                    if self.replica_progress.advance(owner_id, resp["epoch"], known["seq"], resp["seq"]):
+                        return
+                    continue
+                entries = resp["entries"]
+                if not entries:
+                    return
+                start, end = resp["range"]
+                with self._write_lock:
+                    for _, cmd, key, value, version in entries:
+                        # Keys the owner no longer holds are replicated down another chain
+                        if in_interval(chord_hash(key), start, end, inclusive=True):
+                            self._apply_log_entry(cmd, key, value, version)
+                    advanced = self.replica_progress.advance(owner_id, resp["epoch"], known["seq"], entries[-1][0])
+                with self._stats_lock:
+                    self.repl_stats["pages"] += 1
+                    self.repl_stats["entries"] += len(entries)
+                if advanced and entries[-1][0] >= resp["seq"]:
+                    return
+        finally:
+            with self._catch_up_lock:
+                self._catching_up.discard(owner_id)
+
+    def _apply_log_entry(self, cmd, key, value, version):
+        if cmd in ("PUT", "DELETE"):
+            self._apply_write(chord_hash(key), key, value, version, cmd == "PUT")
+
+    def start_rebalancing(self):
+        """Compare our load with our successor's every rebalance_interval seconds, see _rebalance."""
+        t = threading.Thread(target=self._rebalance_loop, daemon=True)
+        t.start()
+
+    def _rebalance_loop(self):
+        while True:
+            # Jitter, so neighbours do not ask each other at the same moment
+            time.sleep(self.rebalance_interval * random.uniform(0.5, 1.5))
+            try:
+                self._rebalance()
+            except Exception as e:
+                transfer_log.error("[Node %s] Rebalance error: %s", self.node_id, e)
+
+    def _owned_ids(self):
+        """Key ids of our primary range (predecessor, us], in ring order."""
+        pred_id = self.predecessor[0] if self.predecessor else self.node_id
+        ids = [int(k_int) for k_int in list(self.data_store)
+               if in_interval(int(k_int), pred_id, self.node_id, inclusive=True)]
+        return sorted(ids, key=lambda k_int: utils.ring_distance(pred_id, k_int))
+
+    def _load(self, keys: int) -> float:
+        return keys + self.rebalance_ops_weight * self.owner_ops.rate
+
+    def _lease_name(self):
+        # Stable across moves, unlike our node id
+        return f"{self.host}:{self.port}#{self.vnode_index}"
+
+    def _leased(self) -> bool:
+        with self._rebalance_lock:
+            return self._rebalance_lease is not None and self._rebalance_lease[1] > time.monotonic()
+
+    def _take_lease(self, holder) -> bool:
+        # Under the join lock: once we hold a lease no join is accepted into our range
+        with self._join_lock, self._rebalance_lock:
+            lease = self._rebalance_lease
+            if lease is not None and lease[0] != holder and lease[1] > time.monotonic():
+                return False
+            self._rebalance_lease = (holder, time.monotonic() + REBALANCE_LEASE)
+            return True
+
+    def _release_lease(self, holder):
+        with self._rebalance_lock:
+            if self._rebalance_lease is not None and self._rebalance_lease[0] == holder:
+                self._rebalance_lease = None
+
+    def chord_load_report(self, holder=None, lock=False, unlock=False, rank=None):
+        """
+        Our load, for the predecessor deciding whether to move the boundary
+        between us. lock takes the rebalance lease for holder (status LOCKED
+        if someone else has it), unlock gives it back. With a rank, also the
+        id of the rank-th key id of our range.
+        """
+        if unlock:
+            self._release_lease(holder)
+            return {"status": "OK"}
+        if lock and not self._take_lease(holder):
+            return {"status": "LOCKED"}
+        ids = self._owned_ids()
+        report = {
+            "status": "OK",
+            "predecessor": self.predecessor,
+            "keys": len(ids),
+            "ops_rate": round(self.owner_ops.rate, 3),
+            "load": self._load(len(ids)),
+        }
+        if rank is not None and 0 < rank <= len(ids):
+            report["key_id"] = ids[rank - 1]
+        return report
+
+    def _rebalance(self, elapsed=None):
+        """
+        Even out the load of our successor and us by moving the boundary
+        between us, our own position: forward to take the first key ids of
+        its range, backward to hand it the last ones of ours. Both of us hold
+        a lease meanwhile, so no node joins either range and neither of us
+        starts another move. Returns the key ids moved, negative when handed
+        over.
+        """
+        self.owner_ops.tick(elapsed)
+        self.rebalance_stats["rounds"] += 1
+        successor = self.successor
+        if successor[0] == self.node_id or self.predecessor is None or self.predecessor[0] == self.node_id:
+            return 0
+        me = self._lease_name()
+        if not self._take_lease(me):
+            return 0
+        try:
+            report = self._send_to(successor, {"cmd": "LOAD_REPORT", "holder": me, "lock": True})
+            if report.get("status") != "OK":
+                return 0
+            try:
+                # Someone joined between us since our last stabilize
+                if tuple(report["predecessor"])[0] != self.node_id:
+                    return 0
+                ids = self._owned_ids()
+                move = plan_move(len(ids), self._load(len(ids)), report["keys"], report["load"],
+                                 REBALANCE_RATIO, REBALANCE_MIN_LOAD)
+                if move > 0:
+                    resp = self._send_to(successor, {"cmd": "LOAD_REPORT", "holder": me, "rank": move})
+                    if resp.get("key_id") is None or not self._shift_forward(successor, resp["key_id"]):
+                        return 0
+                elif move < 0:
+                    if not self._shift_backward(successor, ids[len(ids) + move - 1], ids[len(ids) + move:]):
+                        return 0
+            finally:
+                self._send_to(successor, {"cmd": "LOAD_REPORT", "holder": me, "unlock": True})
+        finally:
+            self._release_lease(me)
+        if move:
+            self.rebalance_stats["moves"] += 1
+            self.rebalance_stats["key_ids_moved"] += abs(move)
+            transfer_log.info("[Node %s] Rebalanced %s key ids with %s (load %.1f vs %.1f)",
+                              self.node_id, move, successor[0], self._load(len(ids)), report["load"])
+        return move
+
+    def _shift_forward(self, successor, new_id):
+        """
+        Take (us, new_id] from our successor: copy it over in pages, move to
+        new_id, copy it again to catch the writes the successor applied
+        meanwhile, then let the k-th node after us drop its replicas.
+        """
+        old_id = self.node_id
+        bucket = TokenBucket(self.rebalance_bandwidth)
+        if not self._fetch_range(successor, old_id, new_id, bucket):
+            return False
+        if not self._change_id(new_id, successor):
+            return False
+        self._fetch_range(successor, old_id, new_id, bucket)
+        self._trim_after_join()
+        return True
+
+    def _shift_backward(self, successor, new_id, handed):
+        """
+        Hand the key ids after new_id to our successor: replicate them to
+        its k-1 replicas first (the successor and the k-2 after it already
+        hold them, the next one does not), then move to new_id and drop them.
+        """
+        bucket = TokenBucket(self.rebalance_bandwidth)
+        k = self.replication_factor or 1
+        sent = {key: self.versions.get(key) for k_int in handed for key in self.data_store.get(k_int, {})}
+        if not self._push_range(successor, handed, k, bucket):
+            return False
+        if not self._change_id(new_id, successor):
+            return False
+        # Writes we took before the move went down our chain, one node short
+        changed = [k_int for k_int in handed
+                   if any(sent.get(key, ()) != self.versions.get(key) for key in self.data_store.get(k_int, {}))]
+        self._push_range(successor, changed, k, bucket)
+        self._trim_after_join()
+        return True
+
+    def _fetch_range(self, node, start, end, bucket, stats=None) -> bool:
+        """Copy the key ids of (start, end] from node, a page per TRANSFER_KEYS. False if it stops answering."""
+        stats = self.rebalance_stats if stats is None else stats
+        after = None
+        while True:
+            resp = self._send_to(node, {"cmd": "TRANSFER_KEYS", "range": [start, end], "after": after, "limit": REBALANCE_PAGE})
+            if "keys" not in resp:
+                transfer_log.warning("[Node %s] Range transfer from %s failed", self.node_id, node[0])
+                return False
+            size = len(json.dumps(resp))
+            self._merge_range(_deserialize_from_json(resp["keys"]), resp.get("value_versions", {}), resp.get("deleted", {}))
+            with self._stats_lock:
+                stats["bytes"] += size
+            bucket.consume(size)
+            after = resp.get("next")
+            if after is None:
+                return True
+
+    def _push_range(self, successor, key_ids, ttl, bucket) -> bool:
+        """Replicate key_ids to our successor and the ttl-1 nodes after it, a page per REPLICATE_RANGE."""
+        key_ids = list(key_ids)
+        for i in range(0, len(key_ids), REBALANCE_PAGE):
+            page = {k_int: self.data_store[k_int] for k_int in key_ids[i:i + REBALANCE_PAGE] if k_int in self.data_store}
+            msg = {"cmd": "REPLICATE_RANGE", "origin": self.node_id, "ttl": ttl, "data_store": _serialize_for_json(page)}
+            size = len(json.dumps(msg))
+            if self._send_to(successor, msg).get("status") != "OK":
+                transfer_log.warning("[Node %s] Range push to %s failed", self.node_id, successor[0])
+                return False
+            with self._stats_lock:
+                self.rebalance_stats["bytes"] += size
+            bucket.consume(size)
+        return True
+
+    def chord_transfer_range(self, start, end, after=None, limit=REBALANCE_PAGE):
+        """
+        A page of the key ids in (start, end], in ring order after `after`,
+        with the write records of their values. The last page also lists the
+        records of the keys of the range deleted here, so a node catching up
+        drops them too.
+        """
+        start, end = int(start), int(end)
+        ids = sorted((int(k_int) for k_int in list(self.data_store) if in_interval(int(k_int), start, end, inclusive=True)),
+                     key=lambda k_int: utils.ring_distance(start, k_int))
+        if after is not None:
+            ids = [k_int for k_int in ids if utils.ring_distance(start, k_int) > utils.ring_distance(start, int(after))]
+        page = {k_int: self.data_store[k_int] for k_int in ids[:limit] if k_int in self.data_store}
+        resp = {
+            "keys": _serialize_for_json(page),
+            "value_versions": {key: self._records_to_json(self.value_versions[key])
+                               for kv_dict in page.values() for key in kv_dict if key in self.value_versions},
+            "next": ids[limit - 1] if len(ids) > limit else None,
+        }
+        if resp["next"] is None:
+            resp["deleted"] = {key: self._records_to_json(records) for key, records in list(self.value_versions.items())
+                               if in_interval(chord_hash(key), start, end, inclusive=True)
+                               and key not in self.data_store.get(chord_hash(key), {})}
+        return resp
+
+    def _merge_range(self, keys, value_versions, deleted):
+        """Merge a fetched range value by value (see _merge_values), then the records of the keys deleted there."""
+        for k_int, kv_dict in keys.items():
+            for key, values in kv_dict.items():
+                self._merge_values(int(k_int), key, values, value_versions.get(key))
+        for key, records in deleted.items():
+            self._merge_values(chord_hash(key), key, (), records)
+        if keys or deleted:
+            self.titles.invalidate()
+
+    def _change_id(self, new_id, successor) -> bool:
+        """
+        Move to new_id, which must still lie between our predecessor and
+        successor, and link our neighbours to our new position. Our store
+        goes with us; the server keeps answering to the old id.
+        """
+        with self._join_lock:
+            if self.predecessor is None or not in_interval(new_id, self.predecessor[0], successor[0]):
+                return False
+            old_id = self.node_id
+            self.node_id = new_id
+            if self._store is not None:
+                self._store[new_id] = self._store.pop(old_id, self.data_store)
+            self._replica_cache.clear()
+            # The nodes stay valid hops; refreshes move them to the new starts
+            self.finger_table = [(start, node) for (_, node), (start, _) in zip(self.finger_table, self._empty_fingers())]
+            if self.on_id_change is not None:
+                self.on_id_change(old_id, new_id)
+            predecessor = self.predecessor
+        membership_log.info("[Node %s] Moved from %s to %s", self.node_id, old_id, new_id)
+        self._send_to(predecessor, {
+            "cmd": "UPDATE_SUCCESSOR",
+            "new_succ_id": self.node_id,
+            "new_succ_host": self.host,
+            "new_succ_port": self.port
+        })
+        self._send_to(successor, {
+            "cmd": "UPDATE_PREDECESSOR",
+            "new_pred_id": self.node_id,
+            "new_pred_host": self.host,
+            "new_pred_port": self.port
+        })
+        return True
+
+    def _is_suspected(self, node_info) -> bool:
+        return self.failure_detector.is_suspected((node_info[1], node_info[2]))
+
+    def _live_successor(self):
+        if not self._is_suspected(self.successor):
+            return self.successor
+        for entry in self.successor_list:
+            if not self._is_suspected(entry):
+                return entry
+        return self.successor
+
+    def _successor_failed(self, failed):
+        """
+        Drop a failed successor and promote the next live entry of the
+        successor list. With replication the new successor already holds
+        replicas of the failed node's range.
+        """
+        with self._ring_lock:
+            self.successor_list = [e for e in self.successor_list
+                                   if e[0] != failed[0] and not self._is_suspected(e)]
+            if self.successor[0] != failed[0]:
+                return
+            self.successor = self.successor_list[0] if self.successor_list else (self.node_id, self.host, self.port)
+            new_successor = self.successor
+        membership_log.warning("[Node %s] Successor %s failed, new successor %s", self.node_id, failed, new_successor)
+        self._forget_finger(failed)
+        self._replicate_own_range()
+        if new_successor[0] != self.node_id:
+            self._send_to_async(new_successor, {
+                "cmd": "NOTIFY",
+                "candidate": (self.node_id, self.host, self.port)
+            })
+
     def closest_preceding_node(self, key_id: int):
         """
         Find the highest node in our finger table that is between
-        (self.node_id, key_id) in the ring.
+        (self.node_id, key_id) in the ring, skipping suspected ones.
         """
-        for i in reversed(range(M)):
+        for i in reversed(range(len(self.finger_table))):
             node_info = self.finger_table[i][1]
             if node_info is not None:
                 nid, nhost, nport = node_info
-                if in_interval(nid, self.node_id, key_id):
+                if in_interval(nid, self.node_id, key_id) and not self._is_suspected(node_info):
                     return node_info
         return (self.node_id, self.host, self.port)
 
+    def _empty_fingers(self):
+        return [((self.node_id + (1 << i)) & utils.ID_MASK, None) for i in range(utils.M)]
+
     def fix_fingers(self):
-        # You may wish to reduce how verbose this is in production:
-        # logging.info(f"[Node {self.node_id}] Fixing fingers...")
-        for i in range(M):
-            start = (self.node_id + 2**i) % (2**M)
+        """Look every finger up again: M lookups, see _finger_tick for the incremental refresh."""
+        for i in range(utils.M):
+            start = (self.node_id + (1 << i)) & utils.ID_MASK
             succ_info, prev_info = self.find_successor(start)
-            self.finger_table[i] = (start, succ_info)
-        
-    def chord_join(self, new_node_host: str, new_node_port: int):
+            self.finger_table[i] = (start, succ_info if succ_info[0] != self.node_id else None)
+
+    def _finger_tick(self):
+        """Once per stabilize round: refresh the next finger when our adaptive wait is over."""
+        if not self.fingers:
+            return
+        self._finger_countdown -= 1
+        if self._finger_countdown > 0:
+            return
+        if self.fix_next_finger():
+            self._finger_wait = max(FINGER_MIN_ROUNDS, self._finger_wait // 2)
+        else:
+            self._finger_wait = min(FINGER_MAX_ROUNDS, self._finger_wait + 1)
+        self._finger_countdown = self._finger_wait
+
+    def fix_next_finger(self) -> bool:
+        """
+        Refresh fingers in order until one needed a lookup. A finger whose
+        start falls before our successor, or before the node of the previous
+        finger, is that node, with no message. Returns whether a finger changed.
+        """
+        changed = False
+        for _ in range(len(self.finger_table)):
+            i = self._next_finger
+            self._next_finger = (i + 1) % len(self.finger_table)
+            start, current = self.finger_table[i]
+            previous = self.finger_table[i - 1][1] if i else self.successor
+            if previous is not None and previous[0] != self.node_id and in_interval(start, self.node_id, previous[0], inclusive=True):
+                found, looked_up = tuple(previous), False
+            else:
+                found, looked_up = tuple(self.find_successor(start)[0]), True
+            if found[0] == self.node_id:
+                found = None
+            elif looked_up and self.proximity:
+                found = self._pick_finger(i, found, current)
+            if found != current:
+                self.finger_table[i] = (start, found)
+                changed = True
+            if looked_up:
+                break
+        with self._stats_lock:
+            self.finger_stats["refreshes"] += 1
+            self.finger_stats["changed"] += changed
+        return changed
+
+    def _learn_fingers(self, nodes):
+        """
+        Node identities seen in responses: a node between the start of a
+        finger and the node it points to is a closer successor of that start.
+        """
+        if not self.fingers:
+            return
+        for info in nodes:
+            if not info:
+                continue
+            info = tuple(info)
+            if info[0] == self.node_id or self._is_suspected(info):
+                continue
+            for i, (start, current) in enumerate(self.finger_table):
+                # Without a finger, any node in [start, us) beats walking the successors
+                end = current[0] if current is not None else self.node_id
+                if current == info or not in_interval(info[0], (start - 1) & utils.ID_MASK, end):
+                    continue
+                if self.proximity and current is not None and self._in_finger_interval(i, current[0]):
+                    # Picked for its RTT among the nodes of its interval, see _pick_finger
+                    continue
+                self.finger_table[i] = (start, info)
+                with self._stats_lock:
+                    self.finger_stats["hints"] += 1
+
+    def _in_finger_interval(self, i, node_id) -> bool:
+        """Whether node_id lies in [start of finger i, start of finger i+1)."""
+        start = self.finger_table[i][0]
+        end = self.finger_table[i + 1][0] if i + 1 < len(self.finger_table) else self.node_id
+        return in_interval(node_id, (start - 1) & utils.ID_MASK, end)
+
+    def _pick_finger(self, i, successor, current):
+        """
+        Proximity neighbour selection: any node of finger i's interval makes
+        lookups progress as well as its first one, so take the closest of
+        the first PNS_CANDIDATES, walking successor lists and probing the
+        ones we have no recent RTT for. The current finger stays unless
+        another is PNS_HYSTERESIS times closer.
+        """
+        if not self._in_finger_interval(i, successor[0]):
+            # The interval is empty: its finger is the next node after it
+            return successor
+        candidates = [successor]
+        node = successor
+        while len(candidates) < PNS_CANDIDATES:
+            info = self._send_to(node, {"cmd": "GET_NODE_INFO", "summary": True})
+            following = [tuple(e) for e in info.get("successor_list", [])]
+            fresh = [e for e in following if e[0] != self.node_id and self._in_finger_interval(i, e[0])
+                     and e not in candidates][:PNS_CANDIDATES - len(candidates)]
+            candidates.extend(fresh)
+            if not fresh or len(fresh) < len(following):
+                break
+            node = fresh[-1]
+        if current is not None and current not in candidates and self._in_finger_interval(i, current[0]):
+            candidates.append(current)
+        for candidate in candidates:
+            if self.rtt.stale((candidate[1], candidate[2])):
+                self._probe(candidate)
+        best = self.rtt.closest(candidates) or successor
+        if current in candidates and self._peer_rtt((current[1], current[2])) is not None:
+            if self._peer_rtt((current[1], current[2])) <= PNS_HYSTERESIS * self._peer_rtt((best[1], best[2])):
+                return current
+        return best
+
+    def _probe(self, node_info):
+        """A PING, whose round trip goes into the RTT table (see _request)."""
+        try:
+            self._request_to(node_info, {"cmd": "PING"})
+        except PeerUnreachable:
+            pass
+
+    def _peer_rtt(self, peer):
+        return self.rtt.rtt(peer)
+
+    def _forget_finger(self, node_info):
+        """A finger did not answer: route around it until a refresh or a hint replaces it."""
+        self.finger_table = [(start, None if node is not None and node[0] == node_info[0] else node)
+                             for start, node in self.finger_table]
+
+    def chord_join(self, new_node_host: str, new_node_port: int, new_node_id: Optional[int] = None):
         """
         A new node calls `JOIN` on us. We find its successor in our ring,
         then we might update our own successor to be consistent.
+        Virtual nodes send their own id, plain nodes are hashed from host:port.
         """
-        new_node_id = chord_hash(f"{new_node_host}:{new_node_port}")
+        if new_node_id is None:
+            new_node_id = chord_hash(f"{new_node_host}:{new_node_port}")
         succ_info, pred_info = self.find_successor(new_node_id)
         
         return succ_info, pred_info
 
-    def chord_put(self, key: str, value: str | list, start_node_id: int, ttl: int = None):
+    def chord_put(self, key: str, value: str | list, start_node_id: int, ttl: int = None, version=None, log=None, sender=None, via=None):
         if ttl == 0: return
         
         key_id = chord_hash(key)
 
-        if self._chain_replicate_with_ttl(start_node_id, key_id, key, value, "PUT", ttl): return
+        if self._chain_replicate_with_ttl(start_node_id, key_id, key, value, "PUT", ttl, version, log, sender, via): return
         
-        (node_id, node_host, node_port), _ = self.find_successor(key_id)
         if self.node_id == start_node_id:
-            self.uploaded_songs.append(key)
+            self.uploaded_songs[key] = key_id
 
-        if node_id == self.node_id:
-            self._store_new_value(key_id, key, value)
-            self._chain_replicate_without_ttl(self.node_id, key, value, "PUT")
-            logging.info(f"[Node {self.node_id}] PUT {key}[{key_id}] -> {value}")
+        while True:
+            node_id, node_host, node_port = self._write_owner(key_id)
+            if node_id != self.node_id:
+                break
+            with self._write_lock:
+                if not self._owns(key_id):
+                    # A node joined in front of us since we looked
+                    continue
+                version = self._next_version()
+                self._apply_write(key_id, key, value, version, True)
+                log = self._log_write("PUT", key, value, version)
+                _, copies = self._joiners_for(key_id)
+            self.owner_ops.record()
+            self._copy_to_joiners(copies, "PUT", key, value, version)
+            self._chain_replicate_without_ttl(self.node_id, key, value, "PUT", version, log)
+            if key in self._hot_owned:
+                self._push_hot_replica(key)
+            request_log.info("[Node %s] PUT %s[%s] -> %s", self.node_id, key, key_id, value)
             return
             
-        logging.info(f"[Node {self.node_id}] Forward PUT {key} -> {value} to {node_id} = {ttl}, {self.replication_factor}")
+        request_log.info("[Node %s] Forward PUT %s -> %s to %s = %s, %s", self.node_id, key, value, node_id, ttl, self.replication_factor)
         msg = {
             "cmd": "PUT",
             "key": key,
@@ -222,9 +1554,9 @@ class ChordNode:
             "start_node_id": start_node_id
         }
         if self.replication_consistency == "e":
-            self._send_async(node_host, node_port, msg)
+            self._send_to_owner_async(key_id, msg, (node_id, node_host, node_port))
         else:
-            self._send(node_host, node_port, msg)
+            self._send_to_owner(key_id, msg, (node_id, node_host, node_port))
 
     def chord_get(self, key: str, start_node_id: int, ttl):
         key_id = chord_hash(key)
@@ -232,7 +1564,14 @@ class ChordNode:
         if self.replication_consistency == "e":
             local_value, local_id = self._read_value(key_id, key)
             if local_id >= 0:
+                if in_interval(key_id, self.predecessor[0], self.node_id, inclusive=True):
+                    self.owner_ops.record()
+                self._count_read(key)
+                self._maybe_read_repair(key)
                 return local_value, local_id
+            hot = self._read_hot_replica(key)
+            if hot is not None:
+                return hot
         
         ret_value = self._chain_replicate_with_ttl(start_node_id, key_id, key, None, "GET", ttl)
         if ret_value:
@@ -240,27 +1579,432 @@ class ChordNode:
         
         (node_id, node_host, node_port), _ = self.find_successor(key_id)
         if node_id == self.node_id:
+            self.owner_ops.record()
             if not self.replication_factor: # No replication at all
                 return self._read_value(key_id, key)
             if self.replication_factor == 1:
                 return self._read_value(key_id, key)
             return self._chain_replicate_without_ttl(self.node_id, key, None, "GET")        
+        elif self.replication_consistency == "e" and self.hedge_delay is not None:
+            return self._hedged_read(key, (node_id, node_host, node_port))
         else:
-            logging.info(f"[Node {self.node_id}] Forward GET {key} to {node_id}")
-            resp = self._send(node_host, node_port, {
+            if self.replication_consistency == "e":
+                hot = self._read_hot_route(key)
+                if hot is not None:
+                    return hot
+                self._maybe_read_repair(key, (node_id, node_host, node_port))
+                if self.proximity:
+                    close = self._read_closest(key, (node_id, node_host, node_port))
+                    if close is not None:
+                        return close
+            request_log.info("[Node %s] Forward GET %s to %s", self.node_id, key, node_id)
+            resp = self._send_to_owner(key_id, {
                 "cmd": "GET",
                 "key": key
-            })
+            }, (node_id, node_host, node_port))
+            if resp.get("replicas"):
+                self._learn_hot_route(key, resp["replicas"])
             return resp.get("value", []), resp.get("id", -1)
 
+    def chord_get_local(self, key: str, owner=None):
+        """
+        Read only our own replica, no routing. Returns (value, id, version,
+        write records of its values).
+        A reader spreading a hot key over its replicas sends the owner, so
+        we can tell it how many reads we took off it.
+        """
+        value, id_ = self._read_value(chord_hash(key), key)
+        if id_ < 0:
+            hot = self._read_hot_replica(key)
+            if hot is not None:
+                return hot[0], hot[1], self.hot_replicas.get(key, (None, None))[1], {}
+        elif owner is not None and owner[0] != self.node_id:
+            self._count_served(key, tuple(owner))
+        else:
+            self._count_read(key)
+        return value, id_, self.versions.get(key), self._records_to_json(self.value_versions.get(key, {}))
+
+    def _count_read(self, key):
+        if self.hot_keys is not None:
+            self.hot_keys.record(key)
+
+    def _count_served(self, key, owner):
+        if self.hot_keys is None:
+            return
+        with self._hot_lock:
+            entry = self._hot_served.setdefault(key, [owner, 0])
+            entry[1] += 1
+
+    def _read_hot_replica(self, key):
+        """Our extra copy of another node's hot key, as (value, id), or None."""
+        entry = self.hot_replicas.get(key)
+        if entry is None or entry[2] < time.monotonic():
+            return None
+        self._count_served(key, entry[3])
+        return list(entry[0]), self.node_id
+
+    def _read_hot_route(self, key):
+        """
+        Read a hot key from one of the replicas its owner advertised, picked
+        at random. None if we know of none or the one we asked had no copy.
+        """
+        route = self._hot_routes.get(key)
+        if route is None or route[1] < time.monotonic():
+            return None
+        replicas = [r for r in route[0] if r[0] != self.node_id]
+        if not replicas:
+            return None
+        replica = random.choice(replicas)
+        resp = self._send_to(replica, {"cmd": "GET", "key": key, "local": True, "owner": list(route[0][0])})
+        if resp.get("value"):
+            return resp["value"], resp["id"]
+        self._hot_routes.pop(key, None)
+        return None
+
+    def _learn_hot_route(self, key, replicas):
+        self._hot_routes[key] = ([tuple(r) for r in replicas], time.monotonic() + self.hot_lease)
+
+    def advertised_replicas(self, key):
+        """Every node that can answer reads of key if it is hot, owner first, else None."""
+        owned = self._hot_owned.get(key)
+        if owned is not None:
+            return [list(r) for r in owned[1]]
+        route = self._hot_routes.get(key)
+        if route is not None and route[1] >= time.monotonic():
+            return [list(r) for r in route[0]]
+        return None
+
+    def _refresh_hot_keys(self, elapsed=None):
+        """
+        Once per stabilize round: drop expired copies and routes, tell owners
+        how many reads of their hot keys we served, and for the keys we own
+        place, renew or retire the extra copies.
+        """
+        if self.hot_keys is None:
+            return
+        heated, cooled = self.hot_keys.tick(elapsed)
+        now = time.monotonic()
+        with self._hot_lock:
+            for key in [k for k, entry in self.hot_replicas.items() if entry[2] < now]:
+                self.hot_replicas.pop(key, None)
+            for key in [k for k, route in self._hot_routes.items() if route[1] < now]:
+                self._hot_routes.pop(key, None)
+            served, self._hot_served = self._hot_served, {}
+
+        reports = {}
+        for key, (owner, reads) in served.items():
+            reports.setdefault(owner, {})[key] = reads
+        for owner, counts in reports.items():
+            self._send_to_async(owner, {"cmd": "HOT_REPORT", "counts": counts})
+
+        for key in cooled:
+            self._retire_hot_key(key)
+        hot = [key for key in self.hot_keys.hot
+               if in_interval(chord_hash(key), self.predecessor[0], self.node_id, inclusive=True)]
+        if not hot:
+            return
+        chain, extras = self._hot_replica_nodes()
+        for key in hot:
+            if key in heated:
+                membership_log.info("[Node %s] Key %s is hot, copying it to %s", self.node_id, key, [e[0] for e in extras])
+            self._push_hot_replica(key, chain, extras)
+
+    def _hot_replica_nodes(self):
+        """
+        (our replica chain, the next hot_key_replicas nodes after it). The
+        successor list may not reach that far; the last node we know of
+        tells us the rest.
+        """
+        k = self.replication_factor or 1
+        need = k - 1 + self.hot_key_replicas
+        known = []
+        for node in [self.successor] + [tuple(e) for e in self.successor_list]:
+            if node[0] != self.node_id and node[0] not in (n[0] for n in known):
+                known.append(tuple(node))
+        if known and len(known) < need:
+            resp = self._send_to(known[-1], {"cmd": "GET_NODE_INFO", "summary": True})
+            for node in [tuple(e) for e in resp.get("successor_list", [])]:
+                if len(known) >= need:
+                    break
+                if node[0] != self.node_id and node[0] not in (n[0] for n in known):
+                    known.append(node)
+        me = (self.node_id, self.host, self.port)
+        return [me] + known[:k - 1], known[k - 1:need]
+
+    def _push_hot_replica(self, key, chain=None, extras=None):
+        """Send our current value of a hot key we own to its extra replicas, renewing their lease."""
+        if chain is None:
+            owned = self._hot_owned.get(key)
+            if owned is None:
+                return
+            extras = owned[0]
+            chain = owned[1][:len(owned[1]) - len(extras)]
+        value, id_ = self._read_value(chord_hash(key), key)
+        if id_ < 0:
+            # Deleted: nothing left to copy
+            self._retire_hot_key(key)
+            return
+        previous = self._hot_owned.get(key, ([], []))[0]
+        for node in previous:
+            if node not in extras:
+                self._send_to_async(node, {"cmd": "HOT_RETIRE", "key": key})
+        version = self.versions.get(key)
+        for node in extras:
+            self._send_to_async(node, {"cmd": "HOT_REPLICA", "key": key, "value": value,
+                                       "version": list(version) if version else None,
+                                       "lease_s": self.hot_lease, "owner": list(chain[0])})
+        self._hot_owned[key] = (list(extras), list(chain) + list(extras))
+
+    def _retire_hot_key(self, key):
+        owned = self._hot_owned.pop(key, None)
+        if owned is None:
+            return
+        membership_log.info("[Node %s] Key %s cooled down, retiring its extra copies", self.node_id, key)
+        for node in owned[0]:
+            self._send_to_async(node, {"cmd": "HOT_RETIRE", "key": key})
+
+    def chord_hot_replica(self, key, value, version, lease_s, owner):
+        """Hold (or refresh) an extra read-only copy of a hot key for lease_s seconds."""
+        version = tuple(version) if version else None
+        current = self.hot_replicas.get(key)
+        if current is not None and version is not None and current[1] is not None and version < current[1]:
+            return "STALE"
+        self.hot_replicas[key] = (set(value), version, time.monotonic() + lease_s, tuple(owner))
+        return "OK"
+
+    def chord_hot_retire(self, key):
+        return "OK" if self.hot_replicas.pop(key, None) is not None else "NOT_FOUND"
+
+    def chord_hot_report(self, counts):
+        """Reads of our hot keys that the other replicas served, counted as if they were ours."""
+        if self.hot_keys is not None:
+            for key, reads in counts.items():
+                self.hot_keys.record(key, reads)
+
+    def chord_repair(self, key: str, value: list, value_versions=None):
+        """
+        Apply a read repair: merge the coordinator's values and write
+        records into ours, value by value (see _merge_values).
+        """
+        self._merge_values(chord_hash(key), key, value, value_versions)
+        return "OK"
+
+    def _maybe_read_repair(self, key: str, owner=None, diverged: bool = False):
+        """Check the replicas of key in the background, always if we saw them disagree."""
+        if not diverged and (not self.read_repair_chance or random.random() >= self.read_repair_chance):
+            return
+        self._spawn(self._read_repair, key, owner)
+
+    def _read_repair(self, key: str, owner=None):
+        """
+        Read key from every replica. If their values or write records
+        differ, merge them value by value: the newest write of a value wins,
+        deletes included, and values nobody has a version for are kept
+        (union). Push the merge to the replicas that differ from it.
+        """
+        if owner is None:
+            owner, _ = self.find_successor(chord_hash(key))
+        answers = {}
+        for replica in self._replicas_of(owner):
+            resp = self._send_to(replica, {"cmd": "GET", "key": key, "local": True})
+            if "id" in resp:
+                answers[replica] = (set(resp.get("value", [])), self._records_from_json(resp.get("value_versions")))
+        with self._stats_lock:
+            self.read_repair_stats["checks"] += 1
+        if len(answers) < 2:
+            return
+
+        records = {}
+        for _, recs in answers.values():
+            for value, record in recs.items():
+                if value not in records or record[0] > records[value][0]:
+                    records[value] = record
+        merged = {value for value, (_, present) in records.items() if present}
+        for values, _ in answers.values():
+            merged |= {value for value in values if value not in records}
+        stale = [r for r, (values, recs) in answers.items() if values != merged or recs != records]
+        if not stale:
+            return
+
+        payload = json.dumps({"cmd": "REPAIR", "key": key, "value": sorted(merged),
+                              "value_versions": self._records_to_json(records)})
+        request_log.info("[Node %s] Read repair of %s: %s stale replicas -> %s", self.node_id, key, len(stale), merged)
+        with self._stats_lock:
+            self.read_repair_stats["repairs"] += 1
+            self.read_repair_stats["replicas_repaired"] += len(stale)
+            self.read_repair_stats["bytes"] += len(payload) * len(stale)
+        for replica in stale:
+            self._send_to_async(replica, json.loads(payload))
+
+    def _next_version(self):
+        return (time.time_ns(), self.node_id)
+
+    def _set_version(self, key, version):
+        if not version:
+            return
+        version = tuple(version)
+        current = self.versions.get(key)
+        if current is None or version > current:
+            self.versions[key] = version
+
+    def _apply_write(self, key_id, key, value, version, present):
+        """
+        Add (present) or delete value, one value or a list/set of them, of
+        key as a write stamped version, value by value: a value whose last
+        recorded write is as new or newer is left alone, so writes applied
+        twice or out of order end the same. Deletes are recorded too
+        (tombstones). An unversioned add is applied unless the value was
+        deleted. Returns "OK" if the store changed, else "NOT_FOUND".
+        """
+        version = tuple(version) if version else None
+        records = self.value_versions.get(key, {})
+        result = "NOT_FOUND"
+        for v in (value if isinstance(value, (set, list)) else (value,)):
+            current = records.get(v)
+            if version is None:
+                if current is not None and not current[1]:
+                    continue
+            elif current is not None and current[0] >= version:
+                continue
+            else:
+                records[v] = (version, present)
+            if present:
+                before = len(self.data_store.get(key_id, {}).get(key, ()))
+                self._store_new_value(key_id, key, v)
+                if len(self.data_store[key_id][key]) != before:
+                    result = "OK"
+            elif self._delete_value(key_id, key, v) == "OK":
+                result = "OK"
+        if records:
+            self.value_versions[key] = records
+        self._set_version(key, version)
+        return result
+
+    def _merge_values(self, key_id, key, values, value_versions=None):
+        """
+        Merge another copy of key, its values and the write records
+        {value: [version, present]} it sent: the newest write of each value
+        wins, and values without a record are added unless we deleted them.
+        """
+        records = self._records_from_json(value_versions)
+        with self._write_lock:
+            for value, (version, present) in records.items():
+                self._apply_write(key_id, key, value, version, present)
+            self._apply_write(key_id, key, [v for v in values or () if v not in records], None, True)
+
+    @staticmethod
+    def _records_to_json(records):
+        return {value: [list(version), present] for value, (version, present) in records.items()}
+
+    @staticmethod
+    def _records_from_json(records):
+        return {value: (tuple(version), present) for value, (version, present) in (records or {}).items()}
+
+    def _forget_writes(self, keep):
+        """
+        Drop the versions and write records of the keys whose id keep()
+        rejects, once we no longer hold their range: records of data we
+        dropped would make a later copy of it look stale.
+        """
+        for key in [key for key in list(self.versions) + list(self.value_versions) if not keep(chord_hash(key))]:
+            self.versions.pop(key, None)
+            self.value_versions.pop(key, None)
+
+    def _replicas_of(self, owner):
+        """
+        The k nodes holding a key owned by `owner`: the owner and the head of its
+        successor list. Cached for a few stabilize rounds to keep reads one hop.
+        """
+        cached = self._replica_cache.get(owner[0])
+        if cached and time.monotonic() - cached[1] < 5 * self.stabilize_interval:
+            return cached[0]
+        resp = self._send_to(owner, {"cmd": "GET_NODE_INFO", "summary": True})
+        successor_list = [tuple(e) for e in resp.get("successor_list", [])]
+        replicas = [owner] + successor_list[:max((self.replication_factor or 1) - 1, 0)]
+        self._replica_cache[owner[0]] = (replicas, time.monotonic())
+        return replicas
+
+    def _read_closest(self, key: str, owner):
+        """
+        Eventual read from the replica with the lowest RTT, when that is not
+        the owner. None if the owner is closest (or we know no RTT) or the
+        replica has no copy yet, and the read goes to the owner.
+        """
+        replicas = [r for r in self._replicas_of(owner) if r[0] != self.node_id]
+        best = self.rtt.closest(replicas)
+        if best is None or best[0] == owner[0]:
+            return None
+        resp = self._send_to(best, {"cmd": "GET", "key": key, "local": True})
+        if resp.get("id", -1) < 0:
+            return None
+        return resp.get("value", []), resp["id"]
+
+    def _hedged_read(self, key: str, owner):
+        """
+        Read from the replica with the best latency/queue-depth score. If it has
+        not answered after hedge_delay, ask the next best one too; the first
+        answer wins. Failed replicas are replaced by the next one right away.
+        """
+        ranked = self.replica_selector.rank(self._replicas_of(owner))
+        results = queue.Queue()
+
+        def _read(replica):
+            peer = (replica[1], replica[2])
+            self.replica_selector.begin(peer)
+            start = time.perf_counter()
+            try:
+                resp = self._request_to(replica, {"cmd": "GET", "key": key, "local": True})
+            except PeerUnreachable:
+                resp = {}
+            ok = "id" in resp
+            self.replica_selector.end(peer, time.perf_counter() - start, resp.get("inflight"), ok)
+            results.put(resp if ok else None)
+
+        def _launch():
+            nonlocal sent
+            threading.Thread(target=tracing.traced(_read), args=(ranked[sent],), daemon=True).start()
+            sent += 1
+
+        sent, pending, hedged = 0, 0, False
+        fallback = ([], -1)
+        _launch()
+        pending += 1
+        while pending:
+            can_hedge = not hedged and sent < len(ranked)
+            try:
+                resp = results.get(timeout=self.hedge_delay if can_hedge else self.read_timeout)
+            except queue.Empty:
+                if not can_hedge:
+                    break
+                request_log.info("[Node %s] Hedging GET %s to %s", self.node_id, key, ranked[sent])
+                hedged = True
+                _launch()
+                pending += 1
+                continue
+            pending -= 1
+            if resp is None:
+                # That replica is down, try the next one
+                if sent < len(ranked):
+                    _launch()
+                    pending += 1
+                continue
+            if resp.get("value"):
+                # A replica answered empty before: the copies have diverged
+                self._maybe_read_repair(key, owner, diverged=fallback[1] >= 0)
+                return resp["value"], resp["id"]
+            # An empty answer may come from a lagging replica, wait for the hedge
+            fallback = (resp.get("value", []), resp.get("id", -1))
+        self._maybe_read_repair(key, owner)
+        return fallback
+
     def chord_get_all(self, start_node_id):
         node_id, node_host, node_port = self.successor
         if node_id == start_node_id:
-            logging.info(f"[Node {self.node_id}] GET * local: {self.data_store}")
+            request_log.debug("[Node %s] GET * local: %s key ids", self.node_id, len(self.data_store))
             return {
                 self.node_id: _serialize_for_json(self.data_store)
             }
-        resp = self._send(node_host, node_port, {
+        resp = self._send_to_successor({
             "cmd": "GET",
             "key": "*",
             "start_node_id": start_node_id
@@ -271,14 +2015,210 @@ class ChordNode:
         }
         return result
 
-    def chord_delete(self, key: str, value: str, start_node_id: int, ttl):
+    def chord_scan(self, prefix=None, contains=None, key_range=None, limit=SCAN_PAGE, token=None):
+        """
+        A page of the keys whose title starts with prefix and contains
+        `contains` (case-insensitively), within key_range = [start, end]
+        ((start, end] of key ids; the whole ring without it), in key id
+        order from start. Every node in the range filters its own primary
+        range over its title index; the owner of the first key id fans the
+        scan out along fingers (see chord_scan_tree). A token in the
+        answer continues where the page stopped.
+        """
+        start, end = (utils.to_id(key_range[0]), utils.to_id(key_range[1])) if key_range else (utils.ID_MASK, utils.ID_MASK)
+        limit = max(1, min(int(limit), SCAN_MAX_PAGE))
+        after = None
+        if token:
+            key_id, title = token.split(":", 1)
+            after = [int(key_id), title]
+        root, _ = self.find_successor(after[0] if after else (start + 1) & utils.ID_MASK)
+        last, _ = self.find_successor(end)
+        # Around the whole ring the root stops at its own predecessor
+        until = None if start == end and last[0] == root[0] else last[0]
+        msg = {"cmd": "SCAN", "range": [start, end], "prefix": prefix, "contains": contains,
+               "after": after, "limit": limit, "until": until}
+        resp = self.chord_scan_tree(msg) if root[0] == self.node_id else self._send_to(root, msg)
+        if "items" not in resp:
+            return {"status": "ERROR", "items": [], "token": token}
+        items = resp["items"]
+        return {
+            "items": items,
+            "token": f"{items[-1][0]}:{items[-1][1]}" if resp["more"] and items else None,
+            "nodes": resp["nodes"],
+            "failed": resp["failed"],
+        }
+
+    def chord_scan_tree(self, msg):
+        """
+        Our matches of a SCAN merged with those of the nodes in
+        (us, until]. Those are split among our successor and fingers: each
+        one scans up to the next, in parallel, and does the same in turn,
+        so the range is covered in O(log N) rounds and every node is asked
+        once. Answers at most msg["limit"] items, "more" if there are others.
+        """
+        start, end = msg["range"]
+        limit = msg["limit"]
+        until = msg["until"] if msg.get("until") is not None else self.predecessor[0]
+        children = []
+        if until != self.node_id:
+            seen = {self.node_id}
+            for node_info in [self.successor] + [f for _, f in self.finger_table if f is not None]:
+                node_info = tuple(node_info)
+                if node_info[0] not in seen and in_interval(node_info[0], self.node_id, until, inclusive=True):
+                    seen.add(node_info[0])
+                    children.append(node_info)
+            children.sort(key=lambda n: utils.ring_distance(self.node_id, n[0]))
+
+        def ask(i):
+            bound = (children[i + 1][0] - 1) & utils.ID_MASK if i + 1 < len(children) else until
+            return self._send_to(children[i], dict(msg, until=bound))
+
+        items, more = self._scan_local(start, end, msg.get("prefix"), msg.get("contains"), msg.get("after"), limit)
+        nodes, failed = 1, 0
+        if children:
+            with ThreadPoolExecutor(max_workers=len(children)) as executor:
+                for resp in executor.map(tracing.traced(ask), range(len(children))):
+                    if "items" not in resp:
+                        failed += 1
+                        continue
+                    items.extend(resp["items"])
+                    more = more or resp["more"]
+                    nodes += resp["nodes"]
+                    failed += resp["failed"]
+        items.sort(key=lambda item: (utils.ring_distance(start, item[0]), item[1]))
+        return {"items": items[:limit], "more": more or len(items) > limit, "nodes": nodes, "failed": failed}
+
+    def _scan_local(self, start, end, prefix, contains, after, limit):
+        """([key_id, title, values] of our primary range matching the filter, after `after`, up to limit; more)"""
+        pred_id = self.predecessor[0]
+        after = (utils.ring_distance(start, after[0]), after[1]) if after else None
+        matches = []
+        for key_id, title in self.titles.match(self.data_store, prefix, contains):
+            if not in_interval(key_id, pred_id, self.node_id, inclusive=True) or not in_interval(key_id, start, end, inclusive=True):
+                continue
+            order = (utils.ring_distance(start, key_id), title)
+            values = self.data_store.get(key_id, {}).get(title)
+            if values and (after is None or order > after):
+                matches.append((order, [key_id, title, sorted(values)]))
+        matches.sort()
+        return [item for _, item in matches[:limit]], len(matches) > limit
+
+    def chord_watch(self, watch):
+        """
+        Register watch (see watch.py) with the owners of what it watches:
+        the owner of its key, or every node whose primary range meets its
+        key id range, walking successors from the owner of its start. The
+        entry node calls this when the client subscribes and again before
+        the owners' lease runs out, which also finds the new owners after
+        the ring changed. Returns how many nodes took the watch.
+        """
+        if watch.get("key") is not None:
+            owner, _ = self.find_successor(chord_hash(watch["key"]))
+            return 1 if self._register_watch(owner, watch).get("status") == "OK" else 0
+        start, end = watch.get("range") or (self.node_id, self.node_id)
+        node, _ = self.find_successor((start + 1) & utils.ID_MASK)
+        first, count = node[0], 0
+        while True:
+            resp = self._register_watch(node, watch)
+            if resp.get("status") != "OK":
+                break
+            count += 1
+            # The owner of end is the last one
+            if in_interval(end, resp["predecessor"][0], node[0], inclusive=True):
+                break
+            node = tuple(resp["successor"])
+            if node[0] == first:
+                break
+        return count
+
+    def _register_watch(self, node, watch):
+        if node[0] == self.node_id:
+            return self.chord_watch_register(watch)
+        return self._send_to(node, {"cmd": "WATCH_REGISTER", "watch": watch})
+
+    def chord_watch_register(self, watch):
+        """A watch of (part of) our primary range: push its changes until its lease runs out."""
+        self.watches.add(watch)
+        return {"status": "OK", "predecessor": self.predecessor, "successor": self.successor}
+
+    def _watch_changed(self, op, key_id, key, value):
+        """Queue a change of key for the watches of it, if we own it; replica copies stay quiet."""
+        pred = self.predecessor or (self.node_id,)
+        if not in_interval(key_id, pred[0], self.node_id, inclusive=True):
+            return
+        watches = self.watches.matching(key_id, key)
+        if not watches:
+            return
+        values = sorted(self.data_store.get(key_id, {}).get(key, ()))
+        if isinstance(value, (set, list)):
+            value = sorted(value)
+        with self._watch_lock:
+            for watch in watches:
+                self._watch_events.append((tuple(watch["subscriber"]), {
+                    "watch": watch["id"], "op": op, "key": key, "value": value, "values": values, "owner": self.node_id
+                }))
+            self.watch_stats["events"] += len(watches)
+            if self._watch_pushing:
+                return
+            self._watch_pushing = True
+        self._start_watch_push()
+
+    def _start_watch_push(self):
+        """
+        Run _push_watch_events on a thread of its own. Never through _spawn:
+        a full async_executor runs tasks inline, and our caller holds
+        _write_lock, which the sends must not be made under.
+        """
+        threading.Thread(target=tracing.traced(self._push_watch_events), daemon=True).start()
+
+    def _push_watch_events(self):
+        """
+        Send the queued changes to their subscribers, up to WATCH_BATCH at a
+        time in one WATCH_EVENT per subscriber, until none are left. Only
+        one of these runs at a time, so each watch sees changes in order.
+        """
+        while True:
+            with self._watch_lock:
+                if not self._watch_events:
+                    self._watch_pushing = False
+                    return
+                batch = [self._watch_events.popleft() for _ in range(min(WATCH_BATCH, len(self._watch_events)))]
+            by_subscriber = {}
+            for subscriber, event in batch:
+                by_subscriber.setdefault(subscriber, []).append(event)
+            for subscriber, events in by_subscriber.items():
+                resp = self._send_to(subscriber, {"cmd": "WATCH_EVENT", "events": events})
+                self.watch_stats["messages"] += 1
+                if "status" not in resp:
+                    # Entry node unreachable: its watches expire unless it comes back to renew them
+                    self.watch_stats["dropped"] += len(events)
+                # Watches whose client is gone
+                for watch_id in resp.get("gone", []):
+                    self.watches.remove(watch_id)
+
+    def chord_delete(self, key: str, value: str, start_node_id: int, ttl, version=None, log=None, sender=None, via=None):
+        if ttl == 0: return "OK"
+
         key_id = chord_hash(key)
-        if self._chain_replicate_with_ttl(start_node_id, key_id, key, value, "DELETE", ttl): return
-        (node_id, node_host, node_port), _ = self.find_successor(key_id)
-        if node_id == self.node_id:
-            self._delete_value(key_id, key, value)
-            self._chain_replicate_without_ttl(self.node_id, key, value, "DELETE")
-            logging.info(f"[Node {self.node_id}] PUT {key}[{key_id}] -> {value}")
+        if self._chain_replicate_with_ttl(start_node_id, key_id, key, value, "DELETE", ttl, version, log, sender, via): return
+        while True:
+            node_id, node_host, node_port = self._write_owner(key_id)
+            if node_id != self.node_id:
+                break
+            with self._write_lock:
+                if not self._owns(key_id):
+                    # A node joined in front of us since we looked
+                    continue
+                version = self._next_version()
+                self._apply_write(key_id, key, value, version, False)
+                log = self._log_write("DELETE", key, value, version)
+                _, copies = self._joiners_for(key_id)
+            self.owner_ops.record()
+            self._copy_to_joiners(copies, "DELETE", key, value, version)
+            self._chain_replicate_without_ttl(self.node_id, key, value, "DELETE", version, log)
+            if key in self._hot_owned:
+                self._push_hot_replica(key)
+            request_log.info("[Node %s] DELETE %s[%s] -> %s", self.node_id, key, key_id, value)
             return "OK"
         
         msg = {
@@ -288,12 +2228,64 @@ class ChordNode:
             "start_node_id": start_node_id
         }
         if self.replication_consistency == "e":
-            self._send_async(node_host, node_port, msg)
+            self._send_to_owner_async(key_id, msg, (node_id, node_host, node_port))
             return "OK"  # We don't wait for the real outcome
         else:
-            resp = self._send(node_host, node_port, msg)
+            resp = self._send_to_owner(key_id, msg, (node_id, node_host, node_port))
             return resp.get("status", "ERROR")
 
+    def chord_delete_batch(self, items, start_node_id, ttl=None, version=None, log=None):
+        """
+        Delete many (key, value) pairs in one message, down the replica chain
+        like chord_delete. Without a ttl we are asked as the owner: pairs of
+        keys we do not own (the ring changed since the sender looked us up)
+        go through chord_delete one by one. Returns how many pairs we deleted.
+        """
+        if ttl == 0: return 0
+        owner = ttl is None
+        if owner:
+            pred_id = self.predecessor[0]
+            mine = []
+            for key, value in items:
+                if in_interval(chord_hash(key), pred_id, self.node_id, inclusive=True):
+                    mine.append((key, value))
+                else:
+                    self.chord_delete(key, value, self.node_id, None)
+            items = mine
+            version = self._next_version()
+            start_node_id = self.node_id
+            ttl = self.replication_factor
+
+        deleted = 0
+        gap = False
+        copies = []
+        with self._write_lock:
+            for key, value in items:
+                deleted += self._apply_write(chord_hash(key), key, value, version, False) == "OK"
+                copies.append((self._joiners_for(chord_hash(key))[1], key, value))
+            if owner:
+                # One log entry per pair
+                logged = [self._log_write("DELETE", key, value, version) for key, value in items]
+                if logged and logged[0]:
+                    log = dict(logged[0], seq=[logged[0]["seq"][0], logged[-1]["seq"][1]])
+            else:
+                gap = self._note_log(log)
+        if gap:
+            self._start_catch_up(log["origin"][0])
+        for joiners, key, value in copies:
+            self._copy_to_joiners(joiners, "DELETE", key, value, version)
+        request_log.info("[Node %s] DELETE_BATCH of %s pairs, %s deleted, ttl %s", self.node_id, len(items), deleted, ttl)
+
+        if not items or not ttl or ttl <= 1 or self.successor[0] in (start_node_id, self.node_id):
+            return deleted
+        msg = {"cmd": "DELETE_BATCH", "items": items, "start_node_id": start_node_id,
+               "ttl": ttl - 1, "version": version, "log": log}
+        if self.replication_consistency == "e":
+            self._send_to_successor_async(msg)
+        else:
+            self._send_to_successor(msg)
+        return deleted
+
 
     def chord_overlay(self, start_node_id):
         """
@@ -307,7 +2299,7 @@ class ChordNode:
                 "successor": self.successor,
                 "predecessor": self.predecessor,
                 "data_store": _serialize_for_json(self.data_store),
-                "uploaded_songs": _serialize_for_json(self.uploaded_songs)
+                "uploaded_songs": list(self.uploaded_songs)
             }
         ]
 
@@ -316,7 +2308,7 @@ class ChordNode:
             return overlay
 
         # Otherwise, fetch the overlay information from the successor
-        resp = self._send(self.successor[1], self.successor[2], {
+        resp = self._send_to_successor({
             "cmd": "GET_OVERLAY",
             "start_node_id": start_node_id
         })
@@ -325,26 +2317,48 @@ class ChordNode:
         overlay.extend(resp.get("overlay", []))
         return overlay
 
+    def chord_trace(self, trace_id, start_node_id):
+        """Spans of trace_id from every server of the ring, walking successors like chord_overlay."""
+        spans = self.tracer.find(trace_id)
+        if self.successor[0] == start_node_id or self.successor[0] == self.node_id:
+            return spans
+        resp = self._send_to_successor({
+            "cmd": "TRACE",
+            "trace_id": trace_id,
+            "ring": True,
+            "start_node_id": start_node_id
+        })
+        # Virtual nodes of a server share its buffer, keep each span once
+        seen = {span["id"] for span in spans}
+        spans.extend(span for span in resp.get("spans", []) if span["id"] not in seen)
+        return spans
+
     def chord_transfer_keys(self, next_node_id, new_node_id, ttl=None):
         """
         Transfer keys that belong to new_node_id to the new node.
         """
         keys_to_give = self._find_keys_for_node(next_node_id)
         serialize_data = _serialize_for_json(keys_to_give)
-        logging.info(f"[Node {self.node_id}] Transferring keys to {next_node_id}: {serialize_data}")
+        transfer_log.debug("[Node %s] Transferring keys to %s: %s", self.node_id, next_node_id, serialize_data)
         
         # Remove them from local store
-        logging.info(f"DELETING ? {new_node_id} != {self.node_id}")
         if new_node_id != self.node_id and ttl != 1:
             for k_int in keys_to_give.keys():
                 self.data_store.pop(k_int)
+            given = {int(k_int) for k_int in keys_to_give}
+            self._forget_writes(lambda key_id: key_id not in given)
+            self.titles.invalidate()
             
-        logging.info(f"[Node {self.node_id}] Transferring keys to {new_node_id}: {serialize_data}")
+        transfer_log.debug("[Node %s] Transferring keys to %s: %s", self.node_id, new_node_id, serialize_data)
         
         self._chain_replicate_acquire_keys(new_node_id, new_node_id, ttl)
         return serialize_data
 
-    def chord_move_all_keys(self, data_store, ttl=1):
+    def chord_move_all_keys(self, data_store, ttl=1, deleted=None, watches=None):
+        # Uploads of the departing node are gone everywhere, see depart
+        if deleted:
+            for key in deleted["keys"]:
+                self._delete_value(chord_hash(key), key, deleted["value"])
         # Step 1: Get data from predecessor
         if ttl > 1:
             succ_id, succ_host, succ_port = self.successor
@@ -352,77 +2366,175 @@ class ChordNode:
             move_all_keys = {
                 "cmd": "MOVE_ALL_KEYS",
                 "ttl": ttl - 1,
-                "data_store": _serialize_for_json(keys_to_give)
+                "data_store": _serialize_for_json(keys_to_give),
+                "deleted": deleted
             }
             if self.replication_consistency == "e":
-                self._send_async(succ_host, succ_port, move_all_keys)
+                self._send_to_successor_async(move_all_keys)
             else:
-                resp = self._send(succ_host, succ_port, move_all_keys)
-                logging.info(f"RESPONSE from MOVE_ALL_KEYS: {resp}")
+                resp = self._send_to_successor(move_all_keys)
+                transfer_log.debug("RESPONSE from MOVE_ALL_KEYS: %s", resp)
             
         # We merge our data_store based on the data_store variable
         for k_int, kv_dict in data_store.items():
             for k, v in kv_dict.items():
                 self._store_new_value(int(k_int), k, v)
+        # The departing node's watches, once its keys are in
+        for watch in watches or ():
+            self.watches.add(watch)
     
+    def _send_to(self, node_info, message_dict):
+        """
+        Send to a ring member (node_id, host, port). The node id travels as
+        target_id so a server hosting several virtual nodes can pick the right one.
+        """
+        message_dict["target_id"] = node_info[0]
+        return self._send(node_info[1], node_info[2], message_dict)
+
+    def _send_to_async(self, node_info, message_dict):
+        message_dict["target_id"] = node_info[0]
+        self._send_async(node_info[1], node_info[2], message_dict)
+
+    def _request_to(self, node_info, message_dict):
+        message_dict["target_id"] = node_info[0]
+        return self._request(node_info[1], node_info[2], message_dict)
+
+    def _send_to_successor(self, message_dict):
+        """
+        Send to our successor. If it does not answer, route around it along
+        the successor list, so a dead node costs at most one timeout per hop.
+        """
+        candidates = [self.successor] + [e for e in self.successor_list if e != self.successor]
+        live = [e for e in candidates if not self._is_suspected(e)] or candidates[:1]
+        for successor in live:
+            try:
+                return self._request_to(successor, message_dict)
+            except PeerUnreachable:
+                if self._is_suspected(successor):
+                    self._successor_failed(successor)
+        return {}
+
+    def _send_to_successor_async(self, message_dict):
+        self._spawn(self._send_to_successor, message_dict)
+
+    def _send_to_owner(self, key_id, message_dict, owner=None):
+        """
+        Send a key operation to the node responsible for key_id. If it does
+        not answer, look the owner up again once the failure detector had
+        time to react; the next live node on the ring holds the replicas.
+        """
+        for attempt in range(self.failure_detector.threshold + 1):
+            if owner is None:
+                owner, _ = self.find_successor(key_id)
+            try:
+                return self._request_to(owner, message_dict)
+            except PeerUnreachable:
+                transport_log.warning("[Node %s] Owner %s of %s unreachable (attempt %s)", self.node_id, owner, key_id, attempt + 1)
+                left = self._time_left()
+                if left is not None and left <= self.stabilize_interval:
+                    # Whoever asked us stops waiting before another try could answer
+                    break
+                if not self._is_suspected(owner):
+                    time.sleep(self.stabilize_interval)
+                owner = None
+        return {}
+
+    def _time_left(self):
+        """Seconds left to answer the request this thread is handling, or None if it has no deadline."""
+        deadline = tracing.deadline()
+        return None if deadline is None else deadline - time.monotonic()
+
+    def _send_to_owner_async(self, key_id, message_dict, owner=None):
+        self._spawn(self._send_to_owner, key_id, message_dict, owner)
+
     def _send_async(self, host, port, message_dict):
         """
         Fire-and-forget sending in a background thread (non-blocking).
         """
-        def _bg_send():
-            self._send(host, port, message_dict)
-        t = threading.Thread(target=_bg_send, daemon=True)
-        t.start()
+        self._spawn(self._send, host, port, message_dict)
+
+    def _spawn(self, fn, *args):
+        """Run fn(*args) in the background, within the current trace."""
+        if self.async_executor is not None:
+            self.async_executor.submit(tracing.traced(fn), *args)
+        else:
+            threading.Thread(target=tracing.traced(fn), args=args, daemon=True).start()
         
     def _send(self, host, port, message_dict):
+        """Send a request and return the response, or {} if the peer is unreachable."""
         try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.connect((host, port))
-
-            # 1) Convert message_dict to bytes
-            data_bytes = json.dumps(message_dict).encode('utf-8')
-
-            # 2) Send the length of the data (8 bytes, big-endian)
-            data_length = len(data_bytes)
-            s.sendall(data_length.to_bytes(8, byteorder='big'))
-
-            # 3) Send the data in chunks
-            bytes_sent = 0
-            while bytes_sent < data_length:
-                chunk = data_bytes[bytes_sent : bytes_sent + BUFF_SIZE]
-                s.sendall(chunk)
-                bytes_sent += len(chunk)
-
-            # 4) Read the length of the response (8 bytes)
-            response_length_bytes = s.recv(8)
-            if not response_length_bytes:
-                s.close()
-                return {}
-
-            response_length = int.from_bytes(response_length_bytes, byteorder='big')
-
-            # Read the entire response
-            response_data = b''
-            while len(response_data) < response_length:
-                chunk = s.recv(BUFF_SIZE)
-                if not chunk:
-                    break
-                response_data += chunk
-
-            s.close()
-
-            # 5) Deserialize the response and return
-            return json.loads(response_data.decode('utf-8'))
+            return self._request(host, port, message_dict)
+        except PeerUnreachable:
+            return {}
 
+    def _request(self, host, port, message_dict):
+        """
+        Send a request and return the response. Raises PeerUnreachable if
+        the peer refuses the connection or does not answer within the
+        configured timeouts; every outcome feeds the failure detector.
+        While handling a request with a deadline we wait no longer than it
+        allows, and pass what is left on as the peer's deadline_ms, so no
+        hop waits on a peer longer than its own caller waits on it. Running
+        out of it raises DeadlineExceeded, which does not count against the peer.
+        """
+        peer = (host, port)
+        cmd = message_dict.get("cmd")
+        # Internal messages carry the trace of the request that caused them,
+        # one hop further; maintenance traffic starts a trace of its own
+        trace_id, hop = tracing.current() or (tracing.new_trace_id(), 0)
+        message_dict["trace_id"] = trace_id
+        message_dict["hop"] = hop + 1
+        timeout = self.read_timeout
+        left = self._time_left()
+        if left is not None:
+            if left <= DEADLINE_MARGIN:
+                raise DeadlineExceeded(f"{host}:{port}")
+            timeout = min(timeout, left - DEADLINE_MARGIN)
+        message_dict["deadline_ms"] = int(timeout * 1000)
+        started = time.time()
+        start = time.perf_counter_ns()
+        self.metrics.gauge_add("outbound_inflight", 1)
+        ok = False
+        try:
+            for attempt in range(BUSY_RETRIES + 1):
+                sent = self._clock()
+                asked = time.monotonic()
+                response = self.transport.request(host, port, message_dict, timeout)
+                if not isinstance(response, dict) or response.get("status") != "BUSY" or attempt == BUSY_RETRIES:
+                    if cmd in RTT_CMDS or message_dict.get("local"):
+                        self.rtt.observe(peer, self._clock() - sent)
+                    break
+                self.metrics.inc("busy_retries", cmd)
+                time.sleep(response.get("retry_after_ms", 10) / 1000)
+            ok = True
+        except OSError as e:
+            # Refused, reset or timed out (socket.timeout is an OSError)
+            if timeout < self.read_timeout and isinstance(e, TimeoutError) and time.monotonic() - asked >= timeout:
+                # Cut short by our own deadline, not slow by the peer's usual standards
+                transport_log.warning("[_send] %s:%s no answer before the deadline", host, port)
+                raise DeadlineExceeded(f"{host}:{port}") from e
+            self.failure_detector.record_failure(peer)
+            transport_log.error("[_send] %s:%s unreachable: %s", host, port, e)
+            raise PeerUnreachable(f"{host}:{port}") from e
         except Exception as e:
-            logging.error(f"[_send] Exception: {e}")
+            self.failure_detector.record_success(peer)
+            transport_log.error("[_send] Exception: %s", e)
             return {}
+        finally:
+            self.metrics.gauge_add("outbound_inflight", -1)
+            self.metrics.observe("send", cmd, start, ok)
+            self.tracer.record("send", (trace_id, hop + 1), self.node_id, f"{self.host}:{self.port}",
+                               cmd, started, start, ok, f"{host}:{port}")
+        self.failure_detector.record_success(peer)
+        return response
 
     def _update_successor(self, new_successor):
         self.successor = tuple(new_successor)
 
     def _update_predecessor(self, new_predecessor):
         self.predecessor = tuple(new_predecessor)
+        # Our predecessor left: we hold more than our last trim kept
+        self._trimmed = None
 
     def _acquire_keys(self, new_node_id: int = None, next_node_id: int = None, ttl: int = None):
         """
@@ -437,7 +2549,7 @@ class ChordNode:
             }
         """
         if ttl == 0:
-            logging.debug("REACHED THE END OF TTL ACQUIRE KEYS")
+            transfer_log.debug("REACHED THE END OF TTL ACQUIRE KEYS")
             return 
         
         succ_id, succ_host, succ_port = self.successor        
@@ -449,18 +2561,19 @@ class ChordNode:
         if ttl:
             request["ttl"] = ttl - 1
         
-        logging.info(f"[Node {self.node_id}] Requesting keys from {succ_id} with TTL {ttl}")
-        resp = self._send(succ_host, succ_port, request)
-        logging.info(f"RESPONSE from TRANSFER_KEYS: {resp}")
+        transfer_log.info("[Node %s] Requesting keys from %s with TTL %s", self.node_id, succ_id, ttl)
+        resp = self._send_to_successor(request)
+        transfer_log.debug("RESPONSE from TRANSFER_KEYS: %s", resp)
 
         keys_to_move = resp.get("keys", {})
-        logging.info(f"[Node {self.node_id}] Acquiring keys from {succ_id}: {keys_to_move}")
+        transfer_log.debug("[Node %s] Acquiring keys from %s: %s", self.node_id, succ_id, keys_to_move)
 
         # Convert keys to integers and lists to sets (if needed):
         for k_int, nested_dict in keys_to_move.items():
             # Convert any list inside nested_dict back to a set (if that’s desired)
             # For example: { "Like a Rolling Stone": ["127.0.0.1:5000"] } -> set(...)[Node 88] REPLICATE PUT Like a Rolling Stone -> 127.0.0.1:5000 to 119 with TTL 1                                       │[Node 119] Forward PUT Like a Rolling Stone -> 127.0.0.1:5000 to 29
             self.data_store[int(k_int)] = nested_dict
+        self.titles.invalidate()
 
 
     def _find_keys_for_node(self, new_node_id: int) -> dict:
@@ -486,6 +2599,7 @@ class ChordNode:
             self.data_store[key_id] = dict()
         if key not in self.data_store[key_id]:
             self.data_store[key_id][key] = set()
+            self.titles.add(key_id, key)
         
         if not isinstance(self.data_store[key_id][key], set):
             if isinstance(self.data_store[key_id][key], list):
@@ -496,10 +2610,14 @@ class ChordNode:
                 self.data_store[key_id][key] = {self.data_store[key_id][key]}
 
             
+        current = self.data_store[key_id][key]
+        before = len(current)
         if isinstance(value, set):
-            self.data_store[key_id][key].update(set(value))
+            current.update(set(value))
         else:
-            self.data_store[key_id][key].add(value)
+            current.add(value)
+        if self.watches and len(current) != before:
+            self._watch_changed("PUT", key_id, key, value)
 
     def _delete_value(self, key_id, key, value):
         if (key_id in self.data_store and
@@ -508,8 +2626,11 @@ class ChordNode:
             self.data_store[key_id][key].remove(value)
             if not self.data_store[key_id][key]:
                 self.data_store[key_id].pop(key)
+                self.titles.discard(key)
             if not self.data_store[key_id]:
                 self.data_store.pop(key_id)
+            if self.watches:
+                self._watch_changed("DELETE", key_id, key, value)
             return "OK"
         return "NOT_FOUND"
     
@@ -520,28 +2641,48 @@ class ChordNode:
             # return list(self.data_store[key_id][key])
         return [], -1
     
-    def _chain_replicate_with_ttl(self, start_node_id, key_id, key, value, cmd, ttl):
+    def _chain_replicate_with_ttl(self, start_node_id, key_id, key, value, cmd, ttl, version=None, log=None, sender=None, via=None):
         if not self.replication_factor: return False
         if not ttl: return False
         if ttl == 0: return True
         ret_value = True
+        gap = False
         # We need to update the successor node as well
-        if cmd == "PUT":
-            self._store_new_value(key_id, key, value)
-        elif cmd == "DELETE":
-            self._delete_value(key_id, key, value)
+        if cmd in ("PUT", "DELETE"):
+            with self._write_lock:
+                skipped, copies = self._joiners_for(key_id, sender)
+                # Past the end of the chain if a node joined before us since it was sent
+                trimmed = not skipped and self._trimmed_away(key_id)
+                if not skipped and not trimmed:
+                    self._apply_write(key_id, key, value, version, cmd == "PUT")
+                    gap = self._note_log(log)
+            self._copy_to_joiners(copies, cmd, key, value, version)
+            if trimmed:
+                return True
+            if skipped:
+                # The chain goes through the joiners it skipped first, then back to us
+                route = skipped[1:] + [(self.node_id, self.host, self.port)] + [tuple(e) for e in via or []]
+                detour = {"cmd": cmd, "key": key, "value": value, "start_node_id": start_node_id, "ttl": ttl,
+                          "version": version, "log": log, "sender": sender, "via": route}
+                if self.replication_consistency == "e":
+                    self._send_to_async(skipped[0], detour)
+                else:
+                    self._send_to(skipped[0], detour)
+                return True
+        if gap:
+            self._start_catch_up(log["origin"][0])
         elif cmd == "GET":
             ret_value = self._read_value(key_id, key)
 
-        succ_id, succ_host, succ_port = self.successor
+        succ_id, succ_host, succ_port = tuple(via[0]) if via else self.successor
         
-        logging.info(f"[Node {self.node_id}] REPLICATE {cmd} {key} -> {value} to {succ_id} with TTL {ttl}, {start_node_id}")
+        replication_log.info("[Node %s] REPLICATE %s %s -> %s to %s with TTL %s, %s", self.node_id, cmd, key, value, succ_id, ttl, start_node_id)
         if succ_id == start_node_id or ttl <= 1:
-            logging.info(f"[Node {self.node_id}] TTL {ttl} for {key} reached")
+            replication_log.debug("[Node %s] TTL %s for %s reached", self.node_id, ttl, key)
             return ret_value
         
         if ttl == 1:
-            logging.info(f"[Node {self.node_id}] TTL {ttl} for {key} reached")
+            replication_log.debug("[Node %s] TTL %s for %s reached", self.node_id, ttl, key)
             return ret_value
         
         chain_data = {
@@ -549,38 +2690,51 @@ class ChordNode:
             "key": key,
             "value": value,
             "start_node_id": start_node_id,
-            "ttl": ttl - 1
+            "ttl": ttl - 1,
+            "version": version,
+            "log": log,
+            "sender": self.node_id
         }
+        if via:
+            # Still on a detour around joiners, see above
+            chain_data["via"] = via[1:]
+            if self.replication_consistency == "e":
+                self._send_to_async((succ_id, succ_host, succ_port), chain_data)
+                return True
+            return self._send_to((succ_id, succ_host, succ_port), chain_data)
         if self.replication_consistency == "e" and cmd != "GET":
-            self._send_async(succ_host, succ_port, chain_data)
+            self._send_to_successor_async(chain_data)
             return True
         else:
-            logging.info(f"[Node {self.node_id}] REPLICATE {cmd} {key} -> {value} to {succ_id}")
-            ret = self._send(succ_host, succ_port, chain_data)
+            replication_log.debug("[Node %s] REPLICATE %s %s -> %s to %s", self.node_id, cmd, key, value, succ_id)
+            ret = self._send_to_successor(chain_data)
             if "value" in ret and "id" in ret: return ret["value"], ret["id"] # GET SPECIFIC
             return ret
     
-    def _chain_replicate_without_ttl(self, start_node_id, key, value, cmd):
-        if not self.replication_factor:
-            # If replication factor is None or it's zero we are done.
+    def _chain_replicate_without_ttl(self, start_node_id, key, value, cmd, version=None, log=None):
+        if not self.replication_factor or self.replication_factor <= 1:
+            # If replication factor is None or it's zero we are done
             return
         
         # That was the first put, we need to replicate it
         # We need to update the successor node as well
         succ_id, succ_host, succ_port = self.successor
 
-        logging.info(f"[Node {self.node_id}] REPLICATE {cmd} {key} -> {value} to {succ_id} without TTL, {start_node_id}")
+        replication_log.info("[Node %s] REPLICATE %s %s -> %s to %s without TTL, %s", self.node_id, cmd, key, value, succ_id, start_node_id)
         data = {
             "cmd": cmd,
             "key": key,
             "value": value,
             "start_node_id": start_node_id,
-            "ttl": self.replication_factor - 1
+            "ttl": self.replication_factor - 1,
+            "version": version,
+            "log": log,
+            "sender": self.node_id
         }
         if self.replication_consistency == "e" and cmd != "GET":
-            self._send_async(succ_host, succ_port, data)
+            self._send_to_successor_async(data)
             return
-        ret = self._send(succ_host, succ_port, data)
+        ret = self._send_to_successor(data)
         if "value" in ret and "id" in ret: return ret["value"], ret["id"]
         return ret
     
@@ -0,0 +1,119 @@
+# compression.py
+#
+# Compression of large frames. The 8-byte length prefix of a frame keeps its
+# two top bits for flags:
+#
+#   FLAG_COMPRESSED  the payload is zlib compressed
+#   FLAG_ACCEPTS     the sender reads compressed frames
+#
+# A node sets FLAG_ACCEPTS on its requests. A server that sees it may
+# compress its response and sets FLAG_ACCEPTS on it too, after which the node
+# may compress its requests to that server. A peer that never sets the flag
+# (loadgen.py, a node started with --no-compression) never gets a flag or a
+# compressed frame back.
+
+import threading
+import time
+import zlib
+
+FLAG_COMPRESSED = 1 << 63
+FLAG_ACCEPTS = 1 << 62
+LENGTH_MASK = FLAG_ACCEPTS - 1
+
+# Frames below this many bytes are never compressed
+COMPRESS_THRESHOLD = 64 * 1024
+# Link speed assumed when weighing CPU time against bytes on the wire
+DEFAULT_LINK_MBPS = 1000.0
+# Every PROBE_EVERY-th large frame is compressed even when it does not seem
+# worth it, so the ratio and speed estimates follow the data
+PROBE_EVERY = 16
+# Decompressing costs the receiver about this fraction of the compression time
+DECOMPRESS_COST = 0.3
+# Bytes a compressed frame may decompress to; a larger one is rejected
+MAX_FRAME = 256 * 1024 * 1024
+
+class CompressionPolicy:
+    """
+    Whether a frame is worth compressing. A frame must be at least threshold
+    bytes. It is then compressed only while the CPU time that costs on both
+    sides is less than the time the saved bytes take on a link of link_mbps.
+    The ratio and speed are EWMAs of the frames compressed so far. Shared by
+    the transport and the server of a node.
+    """
+    def __init__(self, threshold: int = COMPRESS_THRESHOLD, link_mbps: float = DEFAULT_LINK_MBPS,
+                 level: int = 1, alpha: float = 0.3):
+        self.threshold = threshold
+        self.link_bps = link_mbps * 1e6 / 8
+        self.level = level
+        self.alpha = alpha
+        # Compressed size over original size, and bytes compressed per second
+        self.ratio = None
+        self.speed = None
+        self.stats = {"compressed": 0, "skipped": 0, "bytes_in": 0, "bytes_out": 0}
+        self._large = 0
+        self._lock = threading.Lock()
+
+    def worth_it(self, size: int) -> bool:
+        if size < self.threshold:
+            return False
+        self._large += 1
+        if self.ratio is None or self._large % PROBE_EVERY == 0:
+            return True
+        saved = size * (1 - self.ratio) / self.link_bps
+        cost = size / self.speed * (1 + DECOMPRESS_COST)
+        return saved > cost
+
+    def encode(self, data: bytes):
+        """(payload, compressed): data itself when compressing does not pay."""
+        if not self.worth_it(len(data)):
+            if len(data) >= self.threshold:
+                self.stats["skipped"] += 1
+            return data, False
+        start = time.perf_counter()
+        out = zlib.compress(data, self.level)
+        self._observe(len(data), len(out), time.perf_counter() - start)
+        if len(out) >= len(data):
+            return data, False
+        return out, True
+
+    def _observe(self, size, compressed_size, seconds):
+        ratio = compressed_size / size
+        speed = size / max(seconds, 1e-9)
+        with self._lock:
+            if self.ratio is None:
+                self.ratio, self.speed = ratio, speed
+            else:
+                self.ratio = (1 - self.alpha) * self.ratio + self.alpha * ratio
+                self.speed = (1 - self.alpha) * self.speed + self.alpha * speed
+            self.stats["compressed"] += 1
+            self.stats["bytes_in"] += size
+            self.stats["bytes_out"] += compressed_size
+
+    def snapshot(self):
+        return dict(self.stats,
+                    ratio=round(self.ratio, 3) if self.ratio is not None else None,
+                    speed_mb_s=round(self.speed / 1e6, 1) if self.speed is not None else None)
+
+def encode_frame(data: bytes, policy: CompressionPolicy = None, accepts: bool = False):
+    """(length prefix, payload) of a frame, compressed if policy finds it worth it."""
+    flags = FLAG_ACCEPTS if accepts else 0
+    if policy is not None:
+        data, compressed = policy.encode(data)
+        if compressed:
+            flags |= FLAG_COMPRESSED
+    return (len(data) | flags).to_bytes(8, byteorder='big'), data
+
+def decode_prefix(prefix: bytes):
+    """(payload length, compressed, sender accepts compressed frames)"""
+    value = int.from_bytes(prefix, byteorder='big')
+    return value & LENGTH_MASK, bool(value & FLAG_COMPRESSED), bool(value & FLAG_ACCEPTS)
+
+def decode_payload(payload: bytes, compressed: bool) -> bytes:
+    """The payload, decompressed if compressed; ValueError if it would exceed MAX_FRAME."""
+    if not compressed:
+        return payload
+    decompressor = zlib.decompressobj()
+    data = decompressor.decompress(payload, MAX_FRAME)
+    if decompressor.unconsumed_tail:
+        raise ValueError(f"compressed frame exceeds {MAX_FRAME} bytes")
+    return data
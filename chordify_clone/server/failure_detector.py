@@ -0,0 +1,47 @@
+# failure_detector.py
+
+import threading
+import time
+
+class PeerUnreachable(Exception):
+    """A peer did not accept the connection or did not answer within the timeouts."""
+
+class DeadlineExceeded(PeerUnreachable):
+    """
+    No answer before the deadline of the request being handled: the peer
+    got less than a full timeout, so this says nothing about its health.
+    """
+
+class FailureDetector:
+    """
+    Heartbeat based failure detector.
+    Every request or heartbeat to a peer reports its outcome here. A peer
+    that misses `threshold` consecutive ones is suspected, until it answers again.
+    Peers are (host, port) pairs, so all virtual nodes of a server share fate.
+    """
+    def __init__(self, threshold: int = 2):
+        self.threshold = threshold
+        self._misses = {}
+        self._last_seen = {}
+        self._lock = threading.Lock()
+
+    def record_success(self, peer):
+        with self._lock:
+            self._misses.pop(peer, None)
+            self._last_seen[peer] = time.monotonic()
+
+    def record_failure(self, peer):
+        with self._lock:
+            self._misses[peer] = self._misses.get(peer, 0) + 1
+
+    def is_suspected(self, peer) -> bool:
+        return self._misses.get(peer, 0) >= self.threshold
+
+    def snapshot(self):
+        """Suspected peers and how long ago we last heard from each peer."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "suspected": [f"{h}:{p}" for (h, p), n in self._misses.items() if n >= self.threshold],
+                "last_seen": {f"{h}:{p}": round(now - t, 3) for (h, p), t in self._last_seen.items()},
+            }
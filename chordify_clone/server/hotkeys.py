@@ -0,0 +1,86 @@
+# hotkeys.py
+
+import threading
+import time
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters sketch: counts for at most `capacity` keys.
+    A new key takes the place of the smallest counter and inherits its
+    count as possible error, so every key read more than total/capacity
+    times is always in the sketch and count - error never overestimates.
+    """
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+
+    def add(self, key, n: int = 1):
+        if key in self.counts:
+            self.counts[key] += n
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = n
+            self.errors[key] = 0
+        else:
+            victim = min(self.counts, key=self.counts.get)
+            floor = self.counts.pop(victim)
+            self.errors.pop(victim)
+            self.counts[key] = floor + n
+            self.errors[key] = floor
+
+    def guaranteed(self, key) -> int:
+        """Lower bound of the count of key."""
+        return self.counts.get(key, 0) - self.errors.get(key, 0)
+
+    def clear(self):
+        self.counts.clear()
+        self.errors.clear()
+
+class HotKeyTracker:
+    """
+    Read rates of the most read keys. Reads go into a SpaceSaving sketch;
+    every tick the guaranteed counts become rates, smoothed over ticks. A
+    key turns hot at `hot_rate` reads/s and cools below half of it, so a
+    key near the threshold does not flap.
+    """
+    def __init__(self, hot_rate: float, capacity: int = 64, smoothing: float = 0.5):
+        self.hot_rate = hot_rate
+        self.cool_rate = hot_rate / 2
+        self.smoothing = smoothing
+        self.sketch = SpaceSaving(capacity)
+        self.rates = {}
+        self.hot = set()
+        self._last_tick = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, key, n: int = 1):
+        with self._lock:
+            self.sketch.add(key, n)
+
+    def tick(self, elapsed: float = None):
+        """Close the current window. Returns (keys that turned hot, keys that cooled)."""
+        now = time.monotonic()
+        with self._lock:
+            elapsed = elapsed or max(now - self._last_tick, 1e-6)
+            self._last_tick = now
+            window = {key: self.sketch.guaranteed(key) / elapsed for key in self.sketch.counts}
+            self.sketch.clear()
+            for key in set(self.rates) | set(window):
+                rate = self.smoothing * self.rates.get(key, 0.0) + (1 - self.smoothing) * window.get(key, 0.0)
+                if rate < self.cool_rate / 10:
+                    self.rates.pop(key, None)
+                else:
+                    self.rates[key] = rate
+            heated = {key for key, rate in self.rates.items() if rate >= self.hot_rate} - self.hot
+            cooled = {key for key in self.hot if self.rates.get(key, 0.0) < self.cool_rate}
+            self.hot = (self.hot | heated) - cooled
+            return heated, cooled
+
+    def snapshot(self, top: int = 10):
+        with self._lock:
+            ranked = sorted(self.rates.items(), key=lambda kv: -kv[1])[:top]
+            return {
+                "hot_rate": self.hot_rate,
+                "hot": sorted(self.hot),
+                "top": [{"key": key, "rate": round(rate, 2)} for key, rate in ranked],
+            }
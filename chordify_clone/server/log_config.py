@@ -0,0 +1,255 @@
+# log_config.py
+#
+# Logging of a server process, kept off the request path:
+#   - callers use lazy %-style arguments, and records are formatted by the
+#     writer thread, never by the caller
+#   - each category (a CategoryLogger, e.g. chordify.request) can be sampled
+#     and rate limited on its own; its isEnabledFor says no to a record that
+#     would be dropped, so that record is never even created
+#   - records go through a bounded queue to a background thread that writes
+#     them in batches, as JSON lines by default; when the queue is full they
+#     are dropped instead of blocking the request
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import random
+import threading
+import time
+import tracing
+from collections import deque
+
+# Records per second per category when no limit is given for it
+DEFAULT_RATE_LIMIT = 1000.0
+
+def parse_category_values(pairs):
+    """["chordify.request=0.1", ...] -> {"chordify.request": 0.1}"""
+    values = {}
+    for pair in pairs or []:
+        category, _, value = pair.partition("=")
+        values[category.strip()] = float(value)
+    return values
+
+class SamplingFilter:
+    """
+    Keeps a record of category C with probability sample[C] (INFO and below
+    only, warnings and errors are never sampled away) and at most
+    rate_limits[C] records per second (token bucket with one second of burst).
+    A setting for chordify.request also applies to chordify.request.*.
+    """
+    def __init__(self, sample=None, rate_limits=None, default_rate_limit=DEFAULT_RATE_LIMIT, seed=None):
+        self.sample = sample or {}
+        self.rate_limits = rate_limits or {}
+        self.default_rate_limit = default_rate_limit
+        self.sampled_out = 0
+        self.rate_limited = 0
+        self._rng = random.Random(seed)
+        self._settings = {}
+        self._buckets = {}
+
+    def _lookup(self, table, category, default):
+        name = category
+        while name:
+            if name in table:
+                return table[name]
+            name = name.rpartition(".")[0]
+        return default
+
+    def _settings_for(self, category):
+        settings = self._settings.get(category)
+        if settings is None:
+            settings = self._settings[category] = (
+                self._lookup(self.sample, category, 1.0),
+                self._lookup(self.rate_limits, category, self.default_rate_limit),
+            )
+        return settings
+
+    def admit(self, category, level) -> bool:
+        """True if a record of category at level is to be kept."""
+        rate, limit = self._settings_for(category)
+        if rate < 1.0 and level <= logging.INFO and self._rng.random() >= rate:
+            self.sampled_out += 1
+            return False
+        if limit:
+            # No lock: a race between two threads only lets one extra record through
+            now = time.monotonic()
+            tokens, last = self._buckets.get(category, (limit, now))
+            tokens = min(limit, tokens + (now - last) * limit)
+            if tokens < 1.0:
+                self._buckets[category] = (tokens, now)
+                self.rate_limited += 1
+                return False
+            self._buckets[category] = (tokens - 1.0, now)
+        return True
+
+class CategoryLogger(logging.Logger):
+    """
+    The logger of a category. Once configure() has run, isEnabledFor also
+    asks the sampling and rate limit, so a record they drop costs one call
+    and is never created. Every yes counts against the rate limit: guard a
+    log call with isEnabledFor only right before making it.
+    """
+    sampling = None
+
+    def isEnabledFor(self, level):
+        if not super().isEnabledFor(level):
+            return False
+        sampling = CategoryLogger.sampling
+        return sampling is None or sampling.admit(self.name, level)
+
+def category(name) -> logging.Logger:
+    """
+    The logger of category name, e.g. chordify.request: a CategoryLogger,
+    unless a plain logger of that name was created first.
+    """
+    manager = logging.Logger.manager
+    previous = manager.loggerClass
+    manager.setLoggerClass(CategoryLogger)
+    try:
+        return logging.getLogger(name)
+    finally:
+        manager.loggerClass = previous
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread through a bounded deque: appending is
+    a single C call, and when the writer falls behind new records are
+    dropped (and counted) instead of blocking the request.
+    """
+    def __init__(self, maxlen: int):
+        super().__init__(deque())
+        self.maxlen = maxlen
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting, of exceptions too, and the write happen on the writer
+        # thread. Containers among the arguments may be state of the node
+        # that changes meanwhile, so they are copied (shallow) here.
+        if isinstance(record.args, tuple):
+            record.args = tuple(copy.copy(arg) if isinstance(arg, (dict, list, set)) else arg
+                                for arg in record.args)
+        elif isinstance(record.args, dict):
+            # A single dict argument is the args itself
+            record.args = copy.copy(record.args)
+        trace = tracing.current()
+        record.trace_id = trace[0] if trace else None
+        return record
+
+    def enqueue(self, record):
+        if len(self.queue) >= self.maxlen:
+            self.dropped += 1
+            return
+        self.queue.append(record)
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+    def __init__(self, static=None):
+        super().__init__()
+        # Extra fields of every line, e.g. the port of the node
+        self._static = "".join(f", {json.dumps(str(k))}: {json.dumps(v)}" for k, v in (static or {}).items())
+
+    def format(self, record):
+        # Only the message and exception need escaping, the rest is known to be safe
+        line = (f'{{"ts": {record.created:.6f}, "level": "{record.levelname}", "cat": "{record.name}", '
+                f'"msg": {json.dumps(record.getMessage())}, "thread": {json.dumps(record.threadName)}{self._static}')
+        if getattr(record, "trace_id", None):
+            line += f', "trace_id": "{record.trace_id}"'
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line += f', "exc": {json.dumps(record.exc_text)}'
+        return line + "}"
+
+class BatchWriter(threading.Thread):
+    """
+    Writer thread: every `interval` seconds drains the deque and writes
+    what it found with a single write and flush.
+    """
+    def __init__(self, records, stream, formatter, interval: float = 0.05):
+        super().__init__(name="log-writer", daemon=True)
+        self.records = records
+        self.stream = stream
+        self.formatter = formatter
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        lines = []
+        while True:
+            try:
+                record = self.records.popleft()
+            except IndexError:
+                break
+            try:
+                lines.append(self.formatter.format(record))
+            except Exception:
+                pass
+        if lines:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+class LogPipeline:
+    """The queue handler, sampling and writer thread installed by configure()."""
+    def __init__(self, handler, sampling, writer):
+        self.handler = handler
+        self.sampling = sampling
+        self.writer = writer
+        self._stopped = False
+
+    def stats(self):
+        return {
+            "sampled_out": self.sampling.sampled_out,
+            "rate_limited": self.sampling.rate_limited,
+            "queue_dropped": self.handler.dropped,
+            "queued": len(self.handler.queue),
+        }
+
+    def stop(self):
+        """Flush the queue and uninstall."""
+        if self._stopped:
+            return
+        self._stopped = True
+        if CategoryLogger.sampling is self.sampling:
+            CategoryLogger.sampling = None
+        logging.getLogger().removeHandler(self.handler)
+        self.writer.stop()
+        self.writer.stream.close()
+
+def configure(path, level="INFO", fmt="json", sample=None, rate_limits=None,
+              default_rate_limit=DEFAULT_RATE_LIMIT, queue_size=10000, static=None):
+    """
+    Send all logging of the process to `path` through a background writer.
+    Replaces the handlers of the root logger, and samples the categories
+    (see CategoryLogger). Returns the LogPipeline.
+    """
+    if fmt == "json":
+        formatter = JsonFormatter(static)
+    else:
+        formatter = logging.Formatter("[%(levelname)s] %(name)s %(message)s")
+
+    handler = AsyncQueueHandler(queue_size)
+    sampling = SamplingFilter(sample, rate_limits, default_rate_limit)
+    writer = BatchWriter(handler.queue, open(path, "a", encoding="utf-8"), formatter)
+    writer.start()
+
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+    CategoryLogger.sampling = sampling
+
+    pipeline = LogPipeline(handler, sampling, writer)
+    atexit.register(pipeline.stop)
+    return pipeline
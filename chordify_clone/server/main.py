@@ -4,49 +4,176 @@ import sys
 import time
 import signal
 import argparse
+import atexit
 import logging
+import shutil
+import subprocess
+import threading
 from chord_node_simple import ChordNode
 from server import ChordServer
+from metrics import Metrics, serve_prometheus
+from tracing import Tracer
+from recorder import WorkloadRecorder
+from admission import AdmissionController, BoundedExecutor
+from compression import CompressionPolicy
+import utils
+from utils import vnode_id
+from transport import ipc_path, private_ipc_dir
+import log_config
 import os
 
 # Ensure the logs directory exists
 os.makedirs("logs", exist_ok=True)
 
-# Configure the root logger
-logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+def configure_logging(port, level="INFO", fmt="json", sample=None, rate_limits=None, worker=0):
+    """
+    Write logs only to logs/<port>.log (logs/<port>-w<worker>.log for the
+    extra workers), from a background thread and without console output.
+    See log_config.py for sampling and rate limits.
+    """
+    if not worker:
+        return log_config.configure(f"logs/{port}.log", level, fmt, sample, rate_limits,
+                                    static={"port": port})
+    return log_config.configure(f"logs/{port}-w{worker}.log", level, fmt, sample, rate_limits,
+                                static={"port": port, "worker": worker})
 
-def configure_logging(port):
+def worker_file(path, worker):
+    """records.chrec -> records-w1.chrec, so the workers do not share an output file."""
+    if not path or not worker:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-w{worker}{ext}"
+
+def spawn_workers(workers):
     """
-    Configure logging to write only to a file and suppress console output.
+    Start workers 1..workers-1 of this node: main.py again with the same
+    arguments and --worker-index. They join the ring through us, then bind
+    the port too. Returns the processes once all of them are ready; their
+    output is copied to ours.
     """
-    logger = logging.getLogger()
-    # Setup file logging
-    file_handler = logging.FileHandler(f"logs/{port}.log")
-    file_handler.setLevel(logging.INFO)
-    file_handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
-    
-    logger.addHandler(file_handler)  # Add the file handler to the logger
-    logger.setLevel(logging.INFO)
+    children = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--worker-index", str(i)],
+                         stdout=subprocess.PIPE, text=True, start_new_session=True)
+        for i in range(1, workers)
+    ]
+    for i, child in enumerate(children, 1):
+        for line in child.stdout:
+            if line.startswith("[Main]"):
+                break
+            sys.stdout.write(line)
+        else:
+            raise RuntimeError(f"Worker {i} exited before joining the ring, see logs/")
+        threading.Thread(target=shutil.copyfileobj, args=(child.stdout, sys.stdout), daemon=True).start()
+    return children
 
-def run_node(host, port, bootstrap_host=None, bootstrap_port=None, replication_factor=1, replication_consistency=None):
+def run_node(host, port, bootstrap_host=None, bootstrap_port=None, replication_factor=1, replication_consistency=None, vnodes=1, metrics_port=None, trace_buffer=10000, log_pipeline=None, record=None, admission=None, max_connections=0, workers=1, worker_index=0, ipc_dir=None, ipc=True, **node_options):
     """
     Instantiates a ChordNode and a ChordServer, then keeps it running.
+    With vnodes > 1 the server hosts that many positions on the ring,
+    all sharing the same listener and data store.
+    node_options (timeouts, successor list size, ...) go to every ChordNode.
+    With metrics_port set, metrics are served in Prometheus format on it.
+    The last trace_buffer spans are kept for the TRACE command.
+    With record set, client requests are recorded to that file (see recorder.py).
+    admission and max_connections bound the work the server accepts (see admission.py).
+
+    With workers > 1 the node is that many processes sharing the port
+    (SO_REUSEPORT). Worker w hosts vnodes w*vnodes..(w+1)*vnodes-1 with a
+    store of its own, and relays requests for its siblings' vnodes to them
+    over Unix sockets in ipc_dir. Worker 0 is started by hand and starts
+    the others.
+    With ipc, the server listens on its Unix socket in ipc_dir even with
+    one worker, and reaches other nodes on this host through theirs.
     """
-    node = ChordNode(host, port, bootstrap_host, bootstrap_port, replication_factor, replication_consistency)
-    server = ChordServer(node)
-    server.start()  # Start the background thread that accepts incoming connections
+    store = {}
+    first = worker_index * vnodes
+    metrics = Metrics()
+    if log_pipeline is not None:
+        # Log records lost to sampling, rate limits or a full queue
+        metrics.gauge_fn("log_dropped", lambda: sum(v for k, v in log_pipeline.stats().items() if k != "queued"))
+        metrics.gauge_fn("log_queued", lambda: len(log_pipeline.handler.queue))
+    node_options["metrics"] = metrics
+    if admission is not None:
+        metrics.gauge_fn("admission_waiting", lambda: admission.waiting)
+    if node_options.get("async_executor") is not None:
+        metrics.gauge_fn("async_pending", node_options["async_executor"].pending)
+    node_options["tracer"] = Tracer(trace_buffer)
+    if ipc or workers > 1:
+        ipc_dir = private_ipc_dir(ipc_dir)
+    if ipc:
+        node_options["ipc_dir"] = ipc_dir
+    if metrics_port:
+        labels = {"node": f"{host}:{port}"}
+        if workers > 1:
+            labels["worker"] = str(worker_index)
+        serve_prometheus(metrics, host, metrics_port + worker_index, labels)
+    # Join only once we listen: during a bulk join other joining nodes may
+    # already be redirected to us. A worker other than 0 is reached through
+    # its siblings until it has joined, only then it takes connections.
+    node = ChordNode(host, port, None, None, replication_factor, replication_consistency, vnode_index=first, store=store, **node_options)
+    server = ChordServer(node, listen=worker_index == 0, admission=admission,
+                         max_connections=max_connections, reuse_port=workers > 1,
+                         compression=node_options.get("compression"))
+    if ipc or workers > 1:
+        path = ipc_path(ipc_dir, host, port, worker_index)
+        server.listen_ipc(path)
+        atexit.register(lambda: os.path.exists(path) and os.unlink(path))
+    if workers > 1:
+        server.set_siblings({
+            ipc_path(ipc_dir, host, port, w): [vnode_id(host, port, i) for i in range(w * vnodes, (w + 1) * vnodes)]
+            for w in range(workers) if w != worker_index
+        })
+    if record:
+        server.recorder = WorkloadRecorder(worker_file(record, worker_index))
+        atexit.register(server.recorder.stop)
+    if worker_index == 0:
+        server.start()  # Start the background thread that accepts incoming connections
+    if bootstrap_host and bootstrap_port:
+        node.join(bootstrap_host, bootstrap_port)
+
+    # The extra virtual nodes join through the ring we are already part of
+    for i in range(first + 1, first + vnodes):
+        vnode = ChordNode(host, port, None, None, replication_factor, replication_consistency, vnode_index=i, store=store, **node_options)
+        server.add_node(vnode)
+        vnode.join(bootstrap_host or host, bootstrap_port or port)
+    if worker_index > 0:
+        server.listen(reuse_port=True)
+        server.start()
+
+    # Stabilization and failure detection
+    for vnode in list(server.nodes.values()):
+        vnode.start_maintenance()
+        if vnode.rebalance_interval:
+            vnode.start_rebalancing()
+    children = spawn_workers(workers) if worker_index == 0 and workers > 1 else []
+    # server.sh waits for this line
+    print(f"[Main] Node {node.node_id} ready", flush=True)
 
     def signal_handler(sig, frame):
         logging.info("[Main] Caught CTRL+C. Shutting down node...")
-        node.depart()
+        # One worker at a time: vnodes next to each other must not hand
+        # their ranges to a successor that is leaving too
+        for child in children:
+            child.send_signal(signal.SIGINT)
+            child.wait()
+        server.depart_all()
         sys.exit(0)
         return
 
     signal.signal(signal.SIGINT, signal_handler)
 
     # Block main thread to keep the node alive
+    parent = os.getppid()
     while True:
         time.sleep(1)
+        if worker_index and os.getppid() != parent:
+            # Worker 0 was killed without taking us down
+            os.kill(os.getpid(), signal.SIGINT)
+        for child in children:
+            if child.poll() is not None:
+                # Its vnodes are gone; leave as a whole rather than serve part of a node
+                logging.error("[Main] Worker exited with %s. Shutting down node...", child.returncode)
+                os.kill(os.getpid(), signal.SIGINT)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -56,11 +183,67 @@ if __name__ == "__main__":
     parser.add_argument("--bootstrap-port", dest="bootstrap_port", type=int, default=None)
     parser.add_argument("--replication-factor", dest="replication_factor", type=int, default=3)
     parser.add_argument("--replication-consistency", dest="replication_consistency", type=str, default="l", help="l for linearizability or e for eventual consistency")
+    parser.add_argument("--vnodes", type=int, default=1, help="Number of virtual nodes hosted by this server")
+    parser.add_argument("--connect-timeout", dest="connect_timeout", type=float, default=1.0, help="Seconds to wait for a peer to accept a connection")
+    parser.add_argument("--read-timeout", dest="read_timeout", type=float, default=5.0, help="Seconds to wait for a peer's response")
+    parser.add_argument("--successor-list-size", dest="successor_list_size", type=int, default=3, help="Successors kept to route around failures")
+    parser.add_argument("--stabilize-interval", dest="stabilize_interval", type=float, default=1.0, help="Seconds between stabilize/heartbeat rounds")
+    parser.add_argument("--hedge-delay-ms", dest="hedge_delay_ms", type=float, default=None, help="Eventual consistency only: read from the best replica and hedge to a second one after this delay")
+    parser.add_argument("--read-repair-chance", dest="read_repair_chance", type=float, default=0.0, help="Eventual consistency only: fraction of reads that also check and repair all replicas")
+    parser.add_argument("--hot-key-rate", dest="hot_key_rate", type=float, default=None, help="Eventual consistency only: reads/s at which a key gets extra replicas")
+    parser.add_argument("--hot-key-replicas", dest="hot_key_replicas", type=int, default=2, help="Extra read-only replicas of a hot key, after its K replicas")
+    parser.add_argument("--rebalance", action="store_true", help="Shift our position on the ring to even out load with our successor")
+    parser.add_argument("--rebalance-interval", dest="rebalance_interval", type=float, default=10.0, help="Seconds between two load comparisons with --rebalance")
+    parser.add_argument("--rebalance-bandwidth-kb", dest="rebalance_bandwidth_kb", type=float, default=256, help="KB/s a range move may use, 0 for no limit")
+    parser.add_argument("--rebalance-ops-weight", dest="rebalance_ops_weight", type=float, default=1.0, help="Keys one request/s handled as owner weighs in the load")
+    parser.add_argument("--repl-log-size", dest="repl_log_size", type=int, default=10000,
+                        help="Writes kept as owner for replicas that missed some, 0 turns the replication log off")
+    parser.add_argument("--metrics-port", dest="metrics_port", type=int, default=None, help="Serve Prometheus metrics at http://host:PORT/metrics")
+    parser.add_argument("--trace-buffer", dest="trace_buffer", type=int, default=10000, help="Spans kept in memory for the TRACE command")
+    parser.add_argument("--log-level", dest="log_level", type=str, default="INFO", help="DEBUG adds full requests, responses and transferred keys")
+    parser.add_argument("--log-format", dest="log_format", choices=["json", "text"], default="json")
+    parser.add_argument("--log-sample", dest="log_sample", action="append", default=[], metavar="CATEGORY=P",
+                        help="Keep this fraction of INFO records of a category, e.g. chordify.request=0.01 (repeatable)")
+    parser.add_argument("--log-rate-limit", dest="log_rate_limit", action="append", default=[], metavar="CATEGORY=N",
+                        help=f"At most N records per second of a category (default {log_config.DEFAULT_RATE_LIMIT:g}, 0 for none; repeatable)")
+    parser.add_argument("--no-fingers", dest="no_fingers", action="store_true", help="Route lookups along successors only, without a finger table")
+    parser.add_argument("--proximity", action="store_true", help="Pick the closest node of each finger interval, and the closest replica for eventual reads")
+    parser.add_argument("--legacy-join", dest="legacy_join", action="store_true", help="Join with the original protocol, only safe when nodes join one at a time")
+    parser.add_argument("--record", type=str, default=None, help="Record client requests to this file for client/replay.py (.gz to compress)")
+    parser.add_argument("--max-requests", dest="max_requests", type=int, default=64, help="Client requests handled at once, 0 turns admission control off; off without --ring-secret too (see admission.py)")
+    parser.add_argument("--max-internal", dest="max_internal", type=int, default=256, help="Requests from other nodes handled at once; past half of it client requests wait")
+    parser.add_argument("--ring-secret", dest="ring_secret", type=str, default=os.environ.get("CHORDIFY_RING_SECRET"),
+                        help="Shared by every node and cli.py: requests over TCP that carry it count as internal and may use admin commands (default: $CHORDIFY_RING_SECRET; without it only nodes on this host may)")
+    parser.add_argument("--client-queue", dest="client_queue", type=int, default=128, help="Client requests waiting for a slot before new ones get BUSY")
+    parser.add_argument("--client-queue-timeout-ms", dest="client_queue_timeout_ms", type=float, default=1000, help="Longest wait of a client request for a slot")
+    parser.add_argument("--max-connections", dest="max_connections", type=int, default=1024, help="Open connections, further ones are closed on accept (0 for no limit)")
+    parser.add_argument("--async-workers", dest="async_workers", type=int, default=16, help="Threads for asynchronous sends (eventual replication, read repair)")
+    parser.add_argument("--async-queue", dest="async_queue", type=int, default=1024, help="Asynchronous sends waiting for a thread; beyond it the sender sends itself")
+    parser.add_argument("--id-bits", dest="id_bits", type=int, default=utils.M, help=f"Bits of the identifier space (1..{utils.MAX_ID_BITS}), must match the rest of the ring")
+    parser.add_argument("--workers", type=int, default=1, help="Processes serving this node on the same port, each with --vnodes vnodes of its own")
+    parser.add_argument("--worker-index", dest="worker_index", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--ipc-dir", dest="ipc_dir", type=str, default=None, help="Directory of the Unix sockets of nodes and workers, only writable by us (default: chordify-<uid> in the temp directory)")
+    parser.add_argument("--no-compression", dest="no_compression", action="store_true", help="Never compress frames, nor tell peers we read compressed ones")
+    parser.add_argument("--compress-threshold-kb", dest="compress_threshold_kb", type=float, default=64, help="Frames over TCP from this size on may be compressed")
+    parser.add_argument("--link-mbps", dest="link_mbps", type=float, default=1000, help="Link speed the CPU cost of compression is weighed against")
+    parser.add_argument("--no-ipc", dest="no_ipc", action="store_true", help="Reach nodes on this host over TCP too, and listen on TCP only (unless --workers)")
 
     args = parser.parse_args()
     
     # configure logging
-    configure_logging(args.port)
+    log_pipeline = configure_logging(args.port, args.log_level.upper(), args.log_format,
+                                     log_config.parse_category_values(args.log_sample),
+                                     log_config.parse_category_values(args.log_rate_limit),
+                                     args.worker_index)
+    utils.set_id_bits(args.id_bits)
+    if args.worker_index and not args.bootstrap_host:
+        # Started by worker 0, which is in the ring by now
+        args.bootstrap_host, args.bootstrap_port = args.host, args.port
+    if args.max_requests and args.ring_secret is None:
+        # Nodes on other hosts would count as clients: their chain writes
+        # and lookups would wait behind the client limit, on each other
+        logging.warning("[Main] No ring secret, admission control is off")
+        args.max_requests = 0
 
     run_node(
         host=args.host,
@@ -68,5 +251,35 @@ if __name__ == "__main__":
         bootstrap_host=args.bootstrap_host,
         bootstrap_port=args.bootstrap_port,
         replication_factor=args.replication_factor,
-        replication_consistency=args.replication_consistency
+        replication_consistency=args.replication_consistency,
+        vnodes=args.vnodes,
+        metrics_port=args.metrics_port,
+        trace_buffer=args.trace_buffer,
+        log_pipeline=log_pipeline,
+        record=args.record,
+        admission=AdmissionController(args.max_requests, args.max_internal, args.client_queue,
+                                      args.client_queue_timeout_ms / 1000),
+        max_connections=args.max_connections,
+        workers=args.workers,
+        worker_index=args.worker_index,
+        ipc_dir=args.ipc_dir,
+        ipc=not args.no_ipc,
+        compression=None if args.no_compression else CompressionPolicy(int(args.compress_threshold_kb * 1024), args.link_mbps),
+        ring_secret=args.ring_secret,
+        async_executor=BoundedExecutor(args.async_workers, args.async_queue),
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout,
+        successor_list_size=args.successor_list_size,
+        stabilize_interval=args.stabilize_interval,
+        hedge_delay=args.hedge_delay_ms / 1000 if args.hedge_delay_ms is not None else None,
+        read_repair_chance=args.read_repair_chance,
+        hot_key_rate=args.hot_key_rate,
+        hot_key_replicas=args.hot_key_replicas,
+        rebalance_interval=args.rebalance_interval if args.rebalance else None,
+        rebalance_bandwidth=args.rebalance_bandwidth_kb * 1024,
+        rebalance_ops_weight=args.rebalance_ops_weight,
+        repl_log_size=args.repl_log_size,
+        bulk_join=not args.legacy_join,
+        fingers=not args.no_fingers,
+        proximity=args.proximity
     )
@@ -0,0 +1,211 @@
+# metrics.py
+#
+# In-process metrics of a server: latency histograms per command, counters,
+# bytes in/out and in-flight gauges. Read them with the STATS command or,
+# with --metrics-port, in Prometheus text format at http://host:port/metrics.
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Sub-buckets per power of two: 2^SUB_BITS, so values are kept within ~3%
+SUB_BITS = 5
+SUB_COUNT = 1 << SUB_BITS
+HALF_COUNT = SUB_COUNT >> 1
+# Latencies are recorded in microseconds, up to 2^36 us (~19 hours)
+MAX_EXPONENT = 36 - SUB_BITS + 1
+BUCKETS = SUB_COUNT + MAX_EXPONENT * HALF_COUNT
+
+QUANTILES = (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("p999", 0.999))
+
+def bucket_index(value: int) -> int:
+    """Log-linear (HDR style) bucket of a non-negative integer."""
+    if value < SUB_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BITS
+    index = SUB_COUNT + (shift - 1) * HALF_COUNT + (value >> shift) - HALF_COUNT
+    return index if index < BUCKETS else BUCKETS - 1
+
+def bucket_value(index: int) -> int:
+    """Highest value that falls in bucket index."""
+    if index < SUB_COUNT:
+        return index
+    shift = (index - SUB_COUNT) // HALF_COUNT + 1
+    return ((HALF_COUNT + (index - SUB_COUNT) % HALF_COUNT + 1) << shift) - 1
+
+class Histogram:
+    """Fixed memory latency histogram, in microseconds."""
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, us: int):
+        self.counts[bucket_index(us)] += 1
+        self.count += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+
+    def quantile(self, q: float) -> int:
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(bucket_value(index), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_us": round(self.total / self.count, 1) if self.count else 0,
+            **{f"{name}_us": self.quantile(q) for name, q in QUANTILES},
+            "max_us": self.max,
+        }
+
+class Metrics:
+    """
+    Metrics of one server, shared by its virtual nodes. Names are
+    (kind, label) pairs, e.g. ("dispatch", "PUT") or ("send", "FIND_SUCCESSOR").
+    Recording is a few integer operations and takes no lock: under the GIL
+    two threads updating the same counter can, rarely, lose one increment,
+    which is fine for metrics. Gauges go up and down, where a lost update
+    would never heal, so they take the lock, as does the first observation
+    of a (kind, label). Readers copy the items under the lock (list() of a
+    dict does not let other threads in) and work on the copies.
+    """
+    def __init__(self):
+        self.started = time.time()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._gauge_fns = {}
+        self._lock = threading.Lock()
+
+    def observe(self, kind, label, start_ns: int, ok: bool = True):
+        """Record the latency of an operation that started at perf_counter_ns() == start_ns."""
+        us = (time.perf_counter_ns() - start_ns) // 1000
+        h = self._histograms.get((kind, label))
+        if h is None:
+            with self._lock:
+                h = self._histograms.setdefault((kind, label), Histogram())
+        # Histogram.record and bucket_index inlined, this runs twice per request
+        if us < SUB_COUNT:
+            index = us
+        else:
+            shift = us.bit_length() - SUB_BITS
+            index = SUB_COUNT + (shift - 1) * HALF_COUNT + (us >> shift) - HALF_COUNT
+            if index >= BUCKETS:
+                index = BUCKETS - 1
+        h.counts[index] += 1
+        h.count += 1
+        h.total += us
+        if us > h.max:
+            h.max = us
+        if not ok:
+            self.inc(kind + "_errors", label)
+
+    def inc(self, kind, label=None, n: int = 1):
+        key = (kind, label)
+        self._counters[key] = self._counters.get(key, 0) + n
+
+    def gauge_add(self, kind, n: int):
+        with self._lock:
+            self._gauges[kind] = self._gauges.get(kind, 0) + n
+
+    def gauge_fn(self, kind, fn):
+        """A gauge read from fn() whenever metrics are read."""
+        self._gauge_fns[kind] = fn
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    @staticmethod
+    def _name(key):
+        kind, label = key
+        return kind if label is None else f"{kind}.{label}"
+
+    def snapshot(self):
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+            gauges = dict(self._gauges)
+        histograms = {self._name(k): h.summary() for k, h in histograms}
+        counters = {self._name(k): v for k, v in counters}
+        gauges.update({kind: fn() for kind, fn in self._gauge_fns.items()})
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "histograms": histograms,
+            "counters": counters,
+            "gauges": gauges,
+        }
+
+    def prometheus(self, labels=None):
+        """Prometheus text exposition format; histograms are exported as summaries."""
+        base = ",".join(f'{k}="{escape(v)}"' for k, v in (labels or {}).items())
+
+        def fmt(extra):
+            parts = [p for p in (base, extra) if p]
+            return "{" + ",".join(parts) + "}" if parts else ""
+
+        lines = []
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+            gauges = list(self._gauges.items())
+            gauges += [(kind, fn()) for kind, fn in self._gauge_fns.items()]
+            by_kind = {}
+            for (kind, label), h in histograms:
+                by_kind.setdefault(kind, []).append((label, h.count, h.total, [(q, h.quantile(q)) for _, q in QUANTILES]))
+        for kind, entries in sorted(by_kind.items()):
+            name = f"chordify_{kind}_seconds"
+            lines.append(f"# TYPE {name} summary")
+            for label, count, total, quantiles in entries:
+                cmd = 'cmd="%s"' % escape(label)
+                for q, us in quantiles:
+                    quantile = '%s,quantile="%s"' % (cmd, q)
+                    lines.append(f"{name}{fmt(quantile)} {us / 1e6}")
+                lines.append(f"{name}_sum{fmt(cmd)} {total / 1e6}")
+                lines.append(f"{name}_count{fmt(cmd)} {count}")
+        for (kind, label), value in sorted(counters, key=lambda kv: (kv[0][0], str(kv[0][1]))):
+            name = f"chordify_{kind}_total"
+            extra = 'cmd="%s"' % escape(label) if label is not None else ""
+            lines.append(f"{name}{fmt(extra)} {value}")
+        for kind, value in sorted(gauges):
+            lines.append(f"# TYPE chordify_{kind} gauge")
+            lines.append(f"chordify_{kind}{fmt('')} {value}")
+        return "\n".join(lines) + "\n"
+
+def escape(value) -> str:
+    """value as a Prometheus label value: backslash, double quote and newline escaped."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def serve_prometheus(metrics: Metrics, host: str, port: int, labels=None):
+    """Serve metrics.prometheus() at /metrics from a background thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus(labels).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
@@ -0,0 +1,208 @@
+# profiler.py
+#
+# Sampling profiler for a live server, started and stopped with the
+# PROFILE_START / PROFILE_STOP commands. Every interval a background thread
+# reads the Python stack of every thread (sys._current_frames) and the CPU
+# clock of every thread, so nothing is added to the request path itself.
+#
+# A thread whose CPU clock did not move since the last sample was off CPU;
+# the line it stopped at tells why: a lock ("lock"), a condition, event or
+# thread ("wait"), a socket ("io"), a sleep ("sleep"), or anything else,
+# mostly waiting for the GIL ("other").
+#
+# The result is a collapsed-stack file (one "frame;frame;... count" line per
+# stack, the input of flamegraph.pl and speedscope) and per-thread-group
+# CPU time and wait statistics.
+
+import linecache
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# Default time between two samples
+INTERVAL = 0.01
+# A forgotten profiler stops by itself after this long; PROFILE_STOP still
+# returns the run, and a new start replaces it
+MAX_SECONDS = 300
+
+_IO_CALLS = ("recv", "send", "accept", "connect", "select", "poll", "create_connection")
+
+_active = None
+_active_lock = threading.Lock()
+
+def thread_group(name: str) -> str:
+    """"Thread-17 (_handle_connection)" -> "_handle_connection", so short lived threads add up."""
+    match = re.match(r"^Thread-\d+(?: \((.*)\))?$", name)
+    if match:
+        return match.group(1) or "Thread"
+    return name
+
+_frame_names = {}
+
+def _frame_name(code) -> str:
+    name = _frame_names.get(code)
+    if name is None:
+        name = _frame_names[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+    return name
+
+def _wait_kind(frame):
+    """
+    Why a thread that is off CPU is waiting, from the line it stopped at.
+    Returns the kind and the frame of that line.
+    """
+    # Inside threading.py (Condition.wait, Event.wait, Thread.join...) the
+    # line of the caller says more
+    while frame.f_back is not None and os.path.basename(frame.f_code.co_filename) == "threading.py":
+        frame = frame.f_back
+    line = linecache.getline(frame.f_code.co_filename, frame.f_lineno)
+    if "sleep(" in line:
+        return "sleep", frame
+    if "lock" in line or ".acquire(" in line:
+        return "lock", frame
+    if ".wait(" in line or ".join(" in line or ".start(" in line:
+        return "wait", frame
+    if any(call in line for call in _IO_CALLS):
+        return "io", frame
+    return "other", frame
+
+def _cpu_time(ident):
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError):
+        # Not on this platform, or the thread just exited
+        return None
+
+class SamplingProfiler(threading.Thread):
+    def __init__(self, interval: float = INTERVAL, max_seconds: float = MAX_SECONDS):
+        super().__init__(name="profiler", daemon=True)
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self.lock_sites = Counter()
+        self.samples = 0
+        # Per thread group: samples by state, and the CPU clock of its threads
+        self.states = {}
+        self.cpu_first = {}
+        self.cpu_last = {}
+        self.groups = {}
+        self._stop_event = threading.Event()
+        self.started = None
+        self.stopped = None
+        # Stopped by itself after max_seconds
+        self.timed_out = False
+        self.sampler_cpu = 0.0
+
+    def run(self):
+        self.started = time.time()
+        own_cpu = time.thread_time()
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop_event.wait(self.interval):
+            if time.monotonic() >= deadline:
+                self.timed_out = True
+                break
+            self.sample()
+        self.sampler_cpu = time.thread_time() - own_cpu
+        self.stopped = time.time()
+
+    def sample(self):
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        self.samples += 1
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            group = thread_group(names.get(ident, "unknown"))
+            self.groups[ident] = group
+
+            cpu = _cpu_time(ident)
+            previous = self.cpu_last.get(ident)
+            if cpu is not None:
+                self.cpu_first.setdefault(ident, cpu)
+                self.cpu_last[ident] = cpu
+            # On CPU for at least half of the interval
+            if cpu is None or previous is None or cpu - previous >= self.interval / 2:
+                state = "on_cpu"
+            else:
+                state, site = _wait_kind(frame)
+                if state == "lock":
+                    self.lock_sites[f"{_frame_name(site.f_code)}:{site.f_lineno}"] += 1
+
+            stack = []
+            f = frame
+            while f is not None:
+                stack.append(_frame_name(f.f_code))
+                f = f.f_back
+            stack.append(group)
+            stack.reverse()
+            if state != "on_cpu":
+                stack.append(f"[{state}]")
+            self.stacks[";".join(stack)] += 1
+
+            counts = self.states.setdefault(group, Counter())
+            counts[state] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def report(self, top: int = 10):
+        interval_ms = self.interval * 1000
+        cpu = Counter()
+        threads = Counter()
+        for ident, group in self.groups.items():
+            threads[group] += 1
+            # Only CPU time between two samples counts: a thread that lived
+            # for less than an interval shows up in the samples, not here
+            if ident in self.cpu_first:
+                cpu[group] += self.cpu_last[ident] - self.cpu_first[ident]
+        groups = {}
+        for group, counts in sorted(self.states.items(), key=lambda kv: -cpu[kv[0]]):
+            groups[group] = {
+                "threads": threads[group],
+                "cpu_s": round(max(cpu[group], 0.0), 3),
+                "samples": dict(counts),
+                "lock_wait_ms": round(counts["lock"] * interval_ms, 1),
+                "io_wait_ms": round(counts["io"] * interval_ms, 1),
+            }
+        return {
+            "duration_s": round((self.stopped or time.time()) - self.started, 2),
+            "interval_ms": interval_ms,
+            "samples": self.samples,
+            "timed_out": self.timed_out,
+            "sampler_cpu_s": round(self.sampler_cpu, 3),
+            "threads": groups,
+            "lock_sites": [{"site": site, "samples": n, "ms": round(n * interval_ms, 1)}
+                           for site, n in self.lock_sites.most_common(top)],
+            "top_stacks": [{"stack": stack, "samples": n} for stack, n in self.stacks.most_common(top)],
+        }
+
+def start(interval: float = INTERVAL, max_seconds: float = MAX_SECONDS):
+    """
+    Start the profiler of this process, replacing a run that stopped by
+    itself. Returns False if it is already running.
+    """
+    global _active
+    with _active_lock:
+        if _active is not None and _active.is_alive():
+            return False
+        _active = SamplingProfiler(interval, max_seconds)
+        _active.start()
+        return True
+
+def stop():
+    """
+    Stop the profiler of this process and return it, also if it stopped by
+    itself; None if it was not started since the last stop.
+    """
+    global _active
+    with _active_lock:
+        profiler, _active = _active, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
@@ -0,0 +1,41 @@
+# proximity.py
+
+import threading
+import time
+
+class RttTable:
+    """
+    Round trip times to peers, from requests that do no work on the other
+    side (heartbeats, pings, pointer updates) and from probes. Each peer
+    keeps an EWMA of its samples; an estimate older than max_age seconds is
+    stale and worth probing again. Peers are (host, port) pairs.
+    """
+    def __init__(self, alpha: float = 0.3, max_age: float = 60.0):
+        self.alpha = alpha
+        self.max_age = max_age
+        self._rtt = {}
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def observe(self, peer, rtt: float):
+        with self._lock:
+            prev = self._rtt.get(peer)
+            self._rtt[peer] = rtt if prev is None else (1 - self.alpha) * prev + self.alpha * rtt
+            self._seen[peer] = time.monotonic()
+
+    def rtt(self, peer):
+        """The estimate in seconds, or None if we never measured peer."""
+        return self._rtt.get(peer)
+
+    def stale(self, peer) -> bool:
+        seen = self._seen.get(peer)
+        return seen is None or time.monotonic() - seen > self.max_age
+
+    def closest(self, nodes):
+        """The (node_id, host, port) with the lowest known RTT, or None if we know none of them."""
+        known = [n for n in nodes if self._rtt.get((n[1], n[2])) is not None]
+        return min(known, key=lambda n: self._rtt[(n[1], n[2])]) if known else None
+
+    def snapshot(self):
+        with self._lock:
+            return {f"{h}:{p}": round(rtt * 1000, 3) for (h, p), rtt in self._rtt.items()}
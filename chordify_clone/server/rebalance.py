@@ -0,0 +1,71 @@
+# rebalance.py
+#
+# Building blocks of load-aware range rebalancing (see ChordNode._rebalance):
+# the request rate a node serves as owner, the move that evens out the load
+# of a node and its successor, and a token bucket that keeps the keys moved
+# below a bandwidth budget.
+
+import threading
+import time
+
+class LoadTracker:
+    """Requests a node handled as the owner of the key, as a smoothed rate."""
+    def __init__(self, smoothing: float = 0.5):
+        self.smoothing = smoothing
+        self.rate = 0.0
+        self._count = 0
+        self._last_tick = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, n: int = 1):
+        with self._lock:
+            self._count += n
+
+    def tick(self, elapsed: float = None):
+        now = time.monotonic()
+        with self._lock:
+            elapsed = elapsed or max(now - self._last_tick, 1e-6)
+            self._last_tick = now
+            self.rate = self.smoothing * self.rate + (1 - self.smoothing) * self._count / elapsed
+            self._count = 0
+            return self.rate
+
+def plan_move(my_keys: int, my_load: float, succ_keys: int, succ_load: float,
+              ratio: float, min_load: float):
+    """
+    How many keys should cross the boundary between a node and its
+    successor so both carry about half of their combined load. Load per key
+    is taken as even within each range. Returns a positive count to take
+    from the successor, a negative one to hand to it, or 0 when the two are
+    within `ratio` of each other or differ by less than min_load.
+    """
+    low, high = sorted((my_load, succ_load))
+    if high - low < min_load or high <= ratio * low:
+        return 0
+    excess = (high - low) / 2
+    if succ_load > my_load:
+        # Never take the successor's last key: its range would be empty
+        return min(round(succ_keys * excess / succ_load), succ_keys - 1)
+    return -min(round(my_keys * excess / my_load), my_keys - 1)
+
+class TokenBucket:
+    """Allows `rate` units per second on average, bursts up to `burst`. A rate of 0 means no limit."""
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, n: float):
+        """Take n units, sleeping until they are available. A request larger than the burst waits for the debt."""
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+            self._last = now
+            self.tokens -= n
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
@@ -0,0 +1,76 @@
+# recorder.py
+#
+# Records the client requests a server handles, with their responses and
+# timings, into a compact binary trace that client/replay.py can replay
+# against a ring. Started with main.py --record PATH or the RECORD_START /
+# RECORD_STOP commands.
+#
+# File format (a ".gz" path is gzip compressed):
+#   MAGIC, then one record per request:
+#     header  ">QHIII": start time (us since the epoch), port of the node
+#             that received it, latency (us), request length, response length
+#     request and response, compact JSON
+# replay.py reads the same format; keep the two in sync.
+
+import gzip
+import json
+import struct
+import threading
+from collections import deque
+
+MAGIC = b"CHORDREC1\n"
+HEADER = struct.Struct(">QHIII")
+
+# Only data requests are recorded: replaying DEPART or admin commands makes no sense
+RECORDED_CMDS = ("PUT", "GET", "DELETE")
+
+def _dumps(obj) -> bytes:
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+class WorkloadRecorder:
+    """
+    Appending a record is a deque.append, from the request thread; a
+    background thread encodes and writes them every `interval` seconds.
+    """
+    def __init__(self, path: str, interval: float = 0.2):
+        self.path = path
+        self.records = 0
+        self._pending = deque()
+        self._file = gzip.open(path, "wb") if path.endswith(".gz") else open(path, "wb")
+        self._file.write(MAGIC)
+        self._stop_event = threading.Event()
+        self._writer = threading.Thread(target=self._run, args=(interval,), name="recorder", daemon=True)
+        self._writer.start()
+
+    def record(self, port, request, response, started: float, latency_ns: int):
+        if request.get("cmd") in RECORDED_CMDS:
+            self._pending.append((port, request, response, started, latency_ns))
+
+    def _run(self, interval):
+        while not self._stop_event.wait(interval):
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        chunks = []
+        while True:
+            try:
+                port, request, response, started, latency_ns = self._pending.popleft()
+            except IndexError:
+                break
+            response = {k: v for k, v in response.items() if k != "trace_id"}
+            req, resp = _dumps(request), _dumps(response)
+            chunks.append(HEADER.pack(int(started * 1e6), port, min(latency_ns // 1000, 0xFFFFFFFF), len(req), len(resp)))
+            chunks.append(req)
+            chunks.append(resp)
+            self.records += 1
+        if chunks:
+            self._file.write(b"".join(chunks))
+            self._file.flush()
+
+    def stop(self):
+        """Write what is pending and close the file. Returns the number of records."""
+        self._stop_event.set()
+        self._writer.join()
+        self._file.close()
+        return self.records
@@ -0,0 +1,59 @@
+# replica_selector.py
+
+import threading
+
+class ReplicaSelector:
+    """
+    Ranks the replicas of a key for eventual-consistency reads.
+    Each peer is scored by an EWMA of its recent read latency, scaled by its
+    queue depth: the reads we have in flight to it plus the number of
+    requests it reported as in flight on its last answer. prior(peer), if
+    given, estimates the latency of a peer we never read from (e.g. its RTT).
+    Peers are (host, port) pairs.
+    """
+    # Latency charged for a read that failed or timed out, in seconds
+    FAILURE_PENALTY = 1.0
+
+    def __init__(self, alpha: float = 0.2, prior=None):
+        self.alpha = alpha
+        self.prior = prior
+        self._latency = {}
+        self._outstanding = {}
+        self._queue_depth = {}
+        self._lock = threading.Lock()
+
+    def begin(self, peer):
+        with self._lock:
+            self._outstanding[peer] = self._outstanding.get(peer, 0) + 1
+
+    def end(self, peer, latency: float, queue_depth=None, ok: bool = True):
+        if not ok:
+            latency = max(latency, self.FAILURE_PENALTY)
+        with self._lock:
+            self._outstanding[peer] = max(self._outstanding.get(peer, 1) - 1, 0)
+            prev = self._latency.get(peer)
+            self._latency[peer] = latency if prev is None else (1 - self.alpha) * prev + self.alpha * latency
+            if queue_depth is not None:
+                self._queue_depth[peer] = queue_depth
+
+    def score(self, peer) -> float:
+        # Peers we never read from score their prior or 0, so they get tried and measured
+        latency = self._latency.get(peer)
+        if latency is None:
+            latency = (self.prior(peer) if self.prior else None) or 0.0
+        return latency * (1 + self._outstanding.get(peer, 0) + self._queue_depth.get(peer, 0))
+
+    def rank(self, replicas):
+        """replicas are (node_id, host, port) tuples, best first."""
+        return sorted(replicas, key=lambda r: self.score((r[1], r[2])))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                f"{h}:{p}": {
+                    "ewma_ms": round(lat * 1000, 3),
+                    "outstanding": self._outstanding.get((h, p), 0),
+                    "queue_depth": self._queue_depth.get((h, p), 0),
+                }
+                for (h, p), lat in self._latency.items()
+            }
@@ -0,0 +1,121 @@
+# replog.py
+#
+# Replication log of a primary range (see ChordNode._log_write): the writes
+# a node applied as owner, numbered in the order it applied them, and on
+# the replica side how far down each owner's log a replica got.
+
+import collections
+import threading
+import time
+
+class ReplicationLog:
+    """
+    The last `capacity` writes applied by the owner of a range, numbered
+    1, 2, ... An epoch, fixed when the log is created, tells a replica
+    that the owner restarted and its numbers started over.
+    """
+    def __init__(self, capacity: int = 10000):
+        self.epoch = time.time_ns()
+        self.seq = 0
+        self._entries = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def append(self, cmd, key, value, version) -> int:
+        with self._lock:
+            self.seq += 1
+            self._entries.append((self.seq, cmd, key, value, version))
+            return self.seq
+
+    def since(self, seq: int, limit: int):
+        """
+        Up to limit entries after seq, oldest first, or None if the log
+        no longer reaches back to seq + 1 (a snapshot is needed).
+        """
+        with self._lock:
+            if seq >= self.seq:
+                return []
+            first = self._entries[0][0] if self._entries else self.seq + 1
+            if seq + 1 < first:
+                return None
+            return [list(e) for e in self._entries if e[0] > seq][:limit]
+
+    def snapshot(self):
+        with self._lock:
+            return {"epoch": self.epoch, "seq": self.seq, "kept": len(self._entries)}
+
+class ReplicaProgress:
+    """
+    For every owner whose writes reach us down its replica chain: its
+    address, the epoch of its log and the last of its writes we applied
+    with none missing before it.
+    """
+    def __init__(self):
+        self.owners = {}
+        self._lock = threading.Lock()
+
+    def note(self, origin, epoch, first, last) -> bool:
+        """
+        Record that we applied writes first..last of origin's log. Returns
+        True if we should catch up: writes before `first` are missing, or
+        these arrived after later ones we applied (async sends overtake
+        each other), so they are replayed from `first` on in order.
+        The first writes we see of an owner (or of a new epoch) are taken
+        as the start: what came before reached us with the range itself.
+        """
+        origin = tuple(origin)
+        with self._lock:
+            known = self.owners.get(origin[0])
+            if known is None or known["epoch"] != epoch:
+                self.owners[origin[0]] = {"node": origin, "epoch": epoch, "seq": last, "seen": last, "noted": True}
+                return False
+            known["node"] = origin
+            known["noted"] = True
+            known["seen"] = max(known["seen"], last)
+            if first == known["seq"] + 1:
+                known["seq"] = last
+                return False
+            if first <= known["seq"]:
+                known["seq"] = first - 1
+            return True
+
+    def advance(self, owner_id, epoch, after, seq) -> bool:
+        """
+        We replayed owner_id's log (epoch) from after + 1 to seq. True if
+        that caught us up with every write we saw. False if meanwhile a
+        late write moved our position back, or a later write got applied
+        before the replay did: replay on from our position.
+        """
+        with self._lock:
+            known = self.owners.get(owner_id)
+            if known is None:
+                return False
+            if known["epoch"] != epoch:
+                known.update(epoch=epoch, seq=seq, seen=seq)
+                return True
+            if known["seq"] != after:
+                return False
+            known["seq"] = seq
+            return seq >= known["seen"]
+
+    def idle(self, owner_id) -> bool:
+        """True if no write of owner_id reached us since the last call."""
+        with self._lock:
+            known = self.owners.get(owner_id)
+            if known is None:
+                return True
+            noted, known["noted"] = known["noted"], False
+            return not noted
+
+    def forget(self, owner_id):
+        with self._lock:
+            self.owners.pop(owner_id, None)
+
+    def get(self, owner_id):
+        with self._lock:
+            known = self.owners.get(owner_id)
+            return dict(known) if known is not None else None
+
+    def snapshot(self):
+        """owner id -> (applied seq, writes seen but not applied yet)"""
+        with self._lock:
+            return {owner_id: [known["seq"], known["seen"] - known["seq"]] for owner_id, known in self.owners.items()}
@@ -0,0 +1,77 @@
+# scan.py
+#
+# Index of the titles a node stores, for SCAN (see ChordNode.chord_scan).
+# Titles are kept sorted by their casefolded form, so a prefix filter is a
+# binary search and a substring filter one pass over short strings rather
+# than over the store's nested dicts.
+
+import threading
+from bisect import bisect_left
+
+# Pending adds and removes folded into the sorted list at once
+MERGE_AT = 1024
+
+class TitleIndex:
+    """
+    Titles of a data store (replica copies included) with their key ids.
+    Writes land in small added/removed sets that are merged into the sorted
+    list once they outgrow MERGE_AT. Bulk changes of the store (ranges moved
+    in or out) call invalidate(), and the next match rebuilds from the store.
+    """
+    def __init__(self):
+        # (casefolded title, title, key id), sorted
+        self._sorted = []
+        self._added = {}
+        self._removed = set()
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def add(self, key_id, title):
+        with self._lock:
+            if self._stale:
+                return
+            self._removed.discard(title)
+            self._added[title] = key_id
+
+    def discard(self, title):
+        with self._lock:
+            if self._stale:
+                return
+            # Also in _sorted if it was there before it was added again
+            self._added.pop(title, None)
+            self._removed.add(title)
+
+    def invalidate(self):
+        with self._lock:
+            self._stale = True
+            self._added.clear()
+            self._removed.clear()
+
+    def match(self, data_store, prefix=None, contains=None):
+        """(key id, title) of the titles starting with prefix and containing `contains`, case-insensitively."""
+        prefix = (prefix or "").casefold()
+        contains = contains.casefold() if contains else None
+        with self._lock:
+            if self._stale:
+                self._sorted = sorted((title.casefold(), title, int(k_int))
+                                      for k_int, kv_dict in list(data_store.items()) for title in list(kv_dict))
+                self._stale = False
+            elif len(self._added) + len(self._removed) > MERGE_AT:
+                entries = {e[1]: e for e in self._sorted if e[1] not in self._removed}
+                entries.update((title, (title.casefold(), title, k_int)) for title, k_int in self._added.items())
+                self._sorted = sorted(entries.values())
+                self._added.clear()
+                self._removed.clear()
+
+            found = {}
+            for i in range(bisect_left(self._sorted, (prefix,)), len(self._sorted)):
+                folded, title, k_int = self._sorted[i]
+                if not folded.startswith(prefix):
+                    break
+                if title not in self._removed and (contains is None or contains in folded):
+                    found[title] = k_int
+            for title, k_int in self._added.items():
+                folded = title.casefold()
+                if folded.startswith(prefix) and (contains is None or contains in folded):
+                    found[title] = k_int
+        return [(k_int, title) for title, k_int in found.items()]
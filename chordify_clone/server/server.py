@@ -3,126 +3,462 @@
 import socket
 import threading
 import json
-from chord_node_simple import ChordNode
-from utils import BUFF_SIZE, _serialize_for_json, _deserialize_from_json
+import queue
+import uuid
+from chord_node_simple import ChordNode, REBALANCE_PAGE, REPL_LOG_PAGE, SCAN_PAGE
+import tracing
+import log_config
+import profiler
+from recorder import WorkloadRecorder
+from admission import AdmissionController, request_class, needs_ring
+from utils import _serialize_for_json, _deserialize_from_json
+from transport import UnixTransport, recv_exact
+from compression import CompressionPolicy, encode_frame, decode_prefix, decode_payload
+from watch import WatchStreams, WATCH_LEASE, WATCH_BATCH, WATCH_HEARTBEAT
+import errno
+import hmac
+import os
+import stat
 import sys
+import time
 import logging
 
+request_log = log_config.category("chordify.request")
+membership_log = log_config.category("chordify.membership")
+transfer_log = log_config.category("chordify.transfer")
+transport_log = log_config.category("chordify.transport")
+
+# Seconds a pooled connection may stay idle between two requests
+IDLE_TIMEOUT = 60
+# Least seconds between two WORKER_NODES rounds for an unknown target_id
+SIBLING_REFRESH = 1.0
+# Commands _execute knows; metrics count any other under "UNKNOWN", so a
+# client cannot add labels of its own
+COMMANDS = frozenset((
+    "PING", "GET_NODE_INFO", "FIND_SUCCESSOR", "NOTIFY", "PUT", "GET", "SCAN", "WATCH",
+    "WATCH_REGISTER", "WATCH_EVENT", "DELETE", "DELETE_BATCH", "JOIN", "JOIN_RANGE",
+    "TRIM_RANGE", "DEPART", "WORKER_NODES", "UPDATE_SUCCESSOR", "UPDATE_PREDECESSOR",
+    "TRANSFER_KEYS", "REPL_LOG", "MOVE_ALL_KEYS", "LOAD_REPORT", "HOT_REPLICA",
+    "HOT_RETIRE", "HOT_REPORT", "REPAIR", "REPLICATE_RANGE", "STATS", "TRACE",
+    "PROFILE_START", "PROFILE_STOP", "RECORD_START", "RECORD_STOP", "GET_OVERLAY",
+))
+
+def cmd_label(request) -> str:
+    """The metrics label of request's command."""
+    cmd = request.get("cmd")
+    return cmd if cmd in COMMANDS else "UNKNOWN"
+
 class ChordServer:
-    def __init__(self, chord_node: ChordNode):
+    def __init__(self, chord_node: ChordNode, listen: bool = True,
+                 admission: AdmissionController = None, max_connections: int = 0,
+                 reuse_port: bool = False, compression: CompressionPolicy = None):
         """
         chord_node is an instance of ChordNode. We will listen on chord_node.host:chord_node.port
         and forward incoming requests to chord_node's logic.
+        With listen=False no socket is opened; the simulator calls _dispatch directly.
+        admission limits the requests handled at once (see admission.py);
+        connections beyond max_connections (0: no limit) are closed on accept.
+        reuse_port lets the worker processes of one node share the port (see set_siblings).
+        With compression, large responses to peers that read compressed frames
+        may be compressed (see compression.py).
         """
         self.node = chord_node
+        # Every virtual node hosted by this server, by node id. Internal
+        # messages carry a target_id, client requests go to self.node.
+        self.nodes = {chord_node.node_id: chord_node}
+        # Node ids a node left when it moved (see ChordNode._rebalance), for
+        # messages still addressed to the old position
+        self.moved = {}
+        chord_node.on_id_change = self._node_moved
+        # Requests being handled right now, reported to hedged readers as queue depth
+        self.inflight = 0
+        self._inflight_lock = threading.Lock()
+        self.metrics = chord_node.metrics
+        self.tracer = chord_node.tracer
+        self.metrics.gauge_fn("inflight", lambda: self.inflight)
+        # WorkloadRecorder of the client requests, see RECORD_START
+        self.recorder = None
+        # Events for the WATCH streams of our clients, see _stream_watch
+        self.watch_streams = WatchStreams()
+        self.metrics.gauge_fn("watch_streams", lambda: len(self.watch_streams))
+        self.admission = admission or AdmissionController(max_requests=0)
+        self.max_connections = max_connections
+        self.connections = 0
+        self.compression = compression
+        # Node ids hosted by the other worker processes of this node, and the
+        # Unix sockets they listen on
+        self.siblings = {}
+        self.sibling_paths = []
+        self._siblings_refreshed = 0.0
+        self.ipc = None
+        self.server_sock = None
+        if listen:
+            self.listen(reuse_port)
+
+    def listen(self, reuse_port: bool = False):
+        """Open the TCP listener; start() accepts on it."""
         self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            # The kernel spreads new connections over every worker bound to the port
+            self.server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.server_sock.bind((self.node.host, self.node.port))
-        self.server_sock.listen(5)
+        self.server_sock.listen(socket.SOMAXCONN)
         print(
             f"[ChordServer] Listening on {self.node.host}:{self.node.port} (NodeID={self.node.node_id})"
         )
 
+    def listen_ipc(self, path):
+        """
+        Accept requests forwarded by sibling workers on a Unix socket at path.
+        Only a socket of ours that nobody listens on any more (its process
+        died) is replaced; a live one, or a file of someone else, is an error.
+        """
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            st = None
+        if st is not None:
+            if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+                raise PermissionError(f"{path} exists and is not a socket of ours")
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except ConnectionRefusedError:
+                os.unlink(path)
+            else:
+                raise OSError(errno.EADDRINUSE, f"{path} is in use by another process")
+            finally:
+                probe.close()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        sock.listen(socket.SOMAXCONN)
+        threading.Thread(target=self._accept_connections, args=(sock,), daemon=True).start()
+
+    def set_siblings(self, siblings):
+        """
+        siblings maps the Unix socket of every other worker process of this
+        node to the node ids it starts with. A request whose target_id one
+        of them hosts is relayed there; ids they move to later are learned
+        with WORKER_NODES.
+        """
+        self.sibling_paths = list(siblings)
+        self.siblings = {node_id: path for path, ids in siblings.items() for node_id in ids}
+        self.ipc = UnixTransport(self.node.read_timeout)
+
+    def _sibling_for(self, request):
+        """The socket of the worker hosting the request's target, or None to handle it here."""
+        target_id = request.get("target_id")
+        if (not self.sibling_paths or target_id is None or request.get("forwarded")
+                or target_id in self.nodes or target_id in self.moved):
+            return None
+        path = self.siblings.get(target_id)
+        if path is None and time.monotonic() - self._siblings_refreshed > SIBLING_REFRESH:
+            self._refresh_siblings()
+            path = self.siblings.get(target_id)
+        return path
+
+    def _refresh_siblings(self):
+        self._siblings_refreshed = time.monotonic()
+        for path in self.sibling_paths:
+            try:
+                for node_id in self.ipc.request(path, {"cmd": "WORKER_NODES"}).get("nodes", []):
+                    self.siblings[node_id] = path
+            except (OSError, ValueError) as e:
+                transport_log.warning("[ChordServer] Worker at %s unreachable: %s", path, e)
+
+    def add_node(self, chord_node: ChordNode):
+        """
+        Host an extra virtual node behind the same listener.
+        Register it before it joins, so messages routed to it find it.
+        """
+        self.nodes[chord_node.node_id] = chord_node
+        chord_node.on_id_change = self._node_moved
+
+    def _node_moved(self, old_id, new_id):
+        node = self.nodes.pop(old_id)
+        self.nodes[new_id] = node
+        self.moved[old_id] = node
+
+    def depart_all(self):
+        """Depart every virtual node; each one hands its own range to its successor."""
+        for node in list(self.nodes.values()):
+            node.depart()
+
+    def _depart_siblings(self):
+        for path in self.sibling_paths:
+            try:
+                self.ipc.request(path, {"cmd": "DEPART", "local_only": True})
+            except (OSError, ValueError) as e:
+                transport_log.warning("[ChordServer] Worker at %s did not depart: %s", path, e)
+
+    def _select_node(self, request):
+        target_id = request.get("target_id")
+        return self.nodes.get(target_id) or self.moved.get(target_id, self.node)
+
     def start(self):
         """
         Start accepting incoming requests in a background thread.
         """
-        t_accept = threading.Thread(target=self._accept_connections, daemon=True)
+        t_accept = threading.Thread(target=self._accept_connections, args=(self.server_sock,), daemon=True)
         t_accept.start()
 
-    def _accept_connections(self):
+    def _accept_connections(self, server_sock):
         while True:
             try:
-                client_sock, addr = self.server_sock.accept()
+                client_sock, addr = server_sock.accept()
+                if self.max_connections and self.connections >= self.max_connections:
+                    # Last line of defence; requests are limited by admission control
+                    self.metrics.inc("connections_rejected")
+                    client_sock.close()
+                    continue
                 t = threading.Thread(target=self._handle_connection, args=(client_sock, addr))
                 t.daemon = True
                 t.start()
             except Exception as e:
-                print(f"[ChordServer] Error accepting connection: {e}")
+                transport_log.error("[ChordServer] Error accepting connection: %s", e)
 
     def _handle_connection(self, client_sock, addr):
+        """
+        Serve requests on a connection until the peer closes it. Nodes and the
+        CLI send a single request per connection; the load generator keeps
+        its connections open and sends many. After a WATCH the connection
+        streams the watch's events instead. Only processes of our user reach
+        our Unix socket (see transport.private_ipc_dir): those are nodes.
+        """
+        local = client_sock.family == socket.AF_UNIX
+        self.metrics.gauge_add("connections", 1)
+        with self._inflight_lock:
+            self.connections += 1
         try:
-            logging.info(f"[ChordServer] Connection from {addr} {client_sock}")
-            
-            # 1) Read the request length prefix
-            length_bytes = client_sock.recv(8)
-            if not length_bytes:
-                logging.info("[ChordServer] No size received. Closing connection.")
-                return
+            transport_log.debug("[ChordServer] Connection from %s", addr)
+            while True:
+                served = self._handle_request(client_sock, local)
+                if not served:
+                    break
+                if served is not True:
+                    self._stream_watch(client_sock, served)
+                    break
+        finally:
+            self.metrics.gauge_add("connections", -1)
+            with self._inflight_lock:
+                self.connections -= 1
+            client_sock.close()
 
-            data_length = int.from_bytes(length_bytes, byteorder='big')
+    def _handle_request(self, client_sock, local=False):
+        """
+        Serve one framed request. Returns False when the connection should be
+        closed, or the watch a WATCH registered, to stream on it.
+        """
+        try:
+            # 1) Read the request length prefix; pooled connections may idle here
+            client_sock.settimeout(IDLE_TIMEOUT)
+            length_bytes = recv_exact(client_sock, 8)
+            if len(length_bytes) < 8:
+                transport_log.debug("[ChordServer] No size received. Closing connection.")
+                return False
+        except OSError:
+            return False
+
+        with self._inflight_lock:
+            self.inflight += 1
+        watch = None
+        try:
+            client_sock.settimeout(self.node.read_timeout)
+            data_length, compressed, accepts = decode_prefix(length_bytes)
             # logging.info(f"[ChordServer] Receiving data of length {data_length}")
 
             # 2) Read the entire request data
-            data = b''
-            while len(data) < data_length:
-                chunk = client_sock.recv(BUFF_SIZE)
-                if not chunk:
-                    break
-                data += chunk
+            data = recv_exact(client_sock, data_length)
 
             if not data:
-                logging.info("[ChordServer] No data received. Closing connection.")
-                return
+                transport_log.debug("[ChordServer] No data received. Closing connection.")
+                return False
 
             # logging.info(f"[ChordServer] Received data: {data}")
-            request = json.loads(data)
+            self.metrics.inc("bytes_in", None, 8 + len(data))
+            request = json.loads(decode_payload(data, compressed))
+            from_ring = local or self._from_ring(request.pop("ring_key", None))
 
-            # 3) Dispatch the request
-            logging.info(f"[ChordServer] Dispatching request: {request}")
-            response = self._dispatch(request)
-            logging.info(f"[ChordServer] Response: {response}")
+            # 3) Dispatch the request, if it may be sent and there is room for it
+            request_log.debug("[ChordServer] Dispatching request: %s", request)
+            cls = request_class(request, from_ring)
+            forbidden = not from_ring and needs_ring(request)
+            retry_after_ms = None if forbidden else self.admission.admit(cls)
+            if forbidden:
+                self.metrics.inc("forbidden", cmd_label(request))
+                response = {"error": "Forbidden: needs the ring secret"}
+            elif retry_after_ms is not None:
+                self.metrics.inc("busy", cls)
+                response = {"status": "BUSY", "retry_after_ms": retry_after_ms}
+            else:
+                admitted = time.perf_counter()
+                try:
+                    response = self._dispatch(request)
+                finally:
+                    self.admission.release(cls, time.perf_counter() - admitted)
+            request_log.debug("[ChordServer] Response: %s", response)
+            if request.get("cmd") == "WATCH" and "hop" not in request:
+                watch = response.get("watch")
 
             # 4) Prepare response data
             r_data = json.dumps(response).encode("utf-8")
 
             # 5) If departing, do something special (just be sure to follow the protocol)
-            if "status" in request and request["status"] == "departing":
-                self.node.depart()
+            if from_ring and request.get("status") == "departing":
+                self.depart_all()
                 print(f"[Node {self.node.node_id}] Closing socket and shutting down.")
                 # Possibly still send a final response to follow the protocol?
                 # Then shutdown:
                 self.shutdown()
 
-            # 6) Send response length + data
-            data_length = len(r_data)
+            # 6) Send response length + data; flags only to a peer that set them itself
+            compression = self.compression if accepts else None
+            prefix, r_data = encode_frame(r_data, compression, compression is not None)
+            self.metrics.inc("bytes_out", None, 8 + len(r_data))
             # logging.info(f"[ChordServer] Sending response of length {data_length}")
-            client_sock.sendall(data_length.to_bytes(8, byteorder='big'))
-
-            bytes_sent = 0
-            while bytes_sent < data_length:
-                chunk = r_data[bytes_sent : bytes_sent + BUFF_SIZE]
-                client_sock.sendall(chunk)
-                bytes_sent += len(chunk)
+            client_sock.sendall(prefix)
+            client_sock.sendall(r_data)
+            return watch or True
 
         except Exception as e:
-            print("[ChordServer] Exception while handling connection:", e)
+            transport_log.error("[ChordServer] Exception while handling connection: %s", e)
             
             # Always send length prefix + error data
-            error_msg = b"ERROR"
-            client_sock.sendall(len(error_msg).to_bytes(8, byteorder='big'))
-            client_sock.sendall(error_msg)
+            try:
+                error_msg = b"ERROR"
+                client_sock.sendall(len(error_msg).to_bytes(8, byteorder='big'))
+                client_sock.sendall(error_msg)
+            except OSError:
+                pass
+            if watch is not None:
+                self.watch_streams.close(watch["id"])
+            return False
 
         finally:
-            client_sock.close()
+            with self._inflight_lock:
+                self.inflight -= 1
 
+    def _from_ring(self, ring_key) -> bool:
+        """True if ring_key is our ring's secret."""
+        secret = self.node.ring_secret
+        return secret is not None and ring_key is not None and hmac.compare_digest(str(ring_key).encode("utf-8"), secret.encode("utf-8"))
+
+    def _stream_watch(self, client_sock, watch):
+        """
+        Send the client the events owners push for its watch (WATCH_EVENT),
+        up to WATCH_BATCH per frame, and a heartbeat frame every
+        WATCH_HEARTBEAT seconds without any, which fails once the client is
+        gone. Renews the watch with its owners before their lease runs out.
+        A client too slow to keep up gets an error frame and is disconnected.
+        """
+        node = self._select_node({"target_id": watch["subscriber"][0]})
+        events = self.watch_streams.open(watch["id"])
+        renewed = time.monotonic()
+        try:
+            while True:
+                try:
+                    batch = [events.get(timeout=WATCH_HEARTBEAT)]
+                    while len(batch) < WATCH_BATCH:
+                        batch.append(events.get_nowait())
+                except queue.Empty:
+                    pass
+                if self.watch_streams.overflowed(watch["id"]):
+                    self.metrics.inc("watch_overflows")
+                    frame = json.dumps({"status": "ERROR", "error": "Watch dropped: the client fell behind"}).encode("utf-8")
+                    client_sock.sendall(len(frame).to_bytes(8, byteorder="big") + frame)
+                    break
+                frame = json.dumps({"events": batch} if batch else {"heartbeat": True}).encode("utf-8")
+                client_sock.sendall(len(frame).to_bytes(8, byteorder="big") + frame)
+                self.metrics.inc("bytes_out", None, 8 + len(frame))
+                if time.monotonic() - renewed > WATCH_LEASE / 3:
+                    renewed = time.monotonic()
+                    node.chord_watch(watch)
+        except OSError:
+            transport_log.debug("[ChordServer] Watch %s closed", watch["id"])
+        finally:
+            self.watch_streams.close(watch["id"])
 
     def _dispatch(self, request):
+        """
+        Execute a request within its trace and record its latency under its
+        command. Client requests (no "hop") start a new trace and get its id back.
+        Requests for a node of a sibling worker are relayed to it untouched.
+        """
+        sibling = self._sibling_for(request)
+        if sibling is not None:
+            self.metrics.inc("forwarded", cmd_label(request))
+            return self.ipc.request(sibling, dict(request, forwarded=True))
+        client = "hop" not in request
+        trace = (request.get("trace_id") or tracing.new_trace_id(), request.get("hop", 0))
+        outer = tracing.current(), tracing.deadline()
+        tracing.set_current(trace)
+        # Answer before the sender stops waiting, see ChordNode._request
+        tracing.set_deadline(time.monotonic() + request["deadline_ms"] / 1000 if "deadline_ms" in request else None)
+        started = time.time()
+        start = time.perf_counter_ns()
+        ok = False
+        recorder = self.recorder if client else None
+        recorded = dict(request) if recorder is not None else None
+        try:
+            response = self._execute(request)
+            ok = "error" not in response
+            if client:
+                response["trace_id"] = trace[0]
+            if recorder is not None:
+                recorder.record(self.node.port, recorded, response, started, time.perf_counter_ns() - start)
+            return response
+        finally:
+            self.metrics.observe("dispatch", cmd_label(request), start, ok)
+            node = self._select_node(request)
+            self.tracer.record("dispatch", trace, node.node_id, f"{node.host}:{node.port}",
+                               request.get("cmd"), started, start, ok)
+            tracing.set_current(outer[0])
+            tracing.set_deadline(outer[1])
+
+    def _execute(self, request):
         """
         A mapping of commands (from request) to chord_node methods.
         Return the response dictionary.
         """
         cmd = request.get("cmd")
-        if cmd == "GET_NODE_INFO":
-            return {
-                "node_id": self.node.node_id,
-                "successor": self.node.successor,
-                "predecessor": self.node.predecessor,
-                "data_store": _serialize_for_json(self.node.data_store),
+        node = self._select_node(request)
+        if cmd == "PING":
+            return {"status": "OK", "node_id": node.node_id}
+        elif cmd == "GET_NODE_INFO":
+            info = {
+                "node_id": node.node_id,
+                "successor": node.successor,
+                "predecessor": node.predecessor,
+                "successor_list": node.successor_list,
             }
+            if request.get("summary"):
+                # Stabilize only needs the pointers, skip the data store
+                return info
+            info.update({
+                "data_store": _serialize_for_json(node.data_store),
+                "vnodes": list(self.nodes.keys()),
+                "sibling_vnodes": sorted(self.siblings),
+                "failure_detector": node.failure_detector.snapshot(),
+                "replica_selector": node.replica_selector.snapshot(),
+                "read_repair": dict(node.read_repair_stats),
+                "hot_keys": node.hot_keys.snapshot() if node.hot_keys is not None else None,
+                "hot_replicas": sorted(node.hot_replicas),
+                "rebalance": dict(node.rebalance_stats, ops_rate=round(node.owner_ops.rate, 3)),
+                "fingers": sorted({tuple(f) for _, f in node.finger_table if f is not None}),
+                "finger_stats": dict(node.finger_stats, wait_rounds=node._finger_wait),
+                "rtt_ms": node.rtt.snapshot(),
+                "repl_log": node.repl_log.snapshot() if node.repl_log is not None else None,
+                "replica_progress": node.replica_progress.snapshot(),
+                "repl_stats": dict(node.repl_stats),
+                "watches": node.watches.snapshot(),
+                "watch_stats": dict(node.watch_stats),
+                "watch_streams": len(self.watch_streams),
+            })
+            return info
         elif cmd == "FIND_SUCCESSOR":
             key_id = request["key_id"]
-            successor_info, predecessor_info = self.node.find_successor(key_id)
+            successor_info, predecessor_info = node.find_successor(key_id)
             return {
                 "successor": successor_info,
                 "predecessor": predecessor_info,
@@ -130,31 +466,73 @@ class ChordServer:
         elif cmd == "NOTIFY":
                 # Another node calls 'notify' on us, claiming it might be our predecessor
             candidate = request["candidate"]
-            self.node.notify(candidate)
+            node.notify(candidate)
             return {"status": "OK"}
 
         elif cmd == "PUT":
             key = request["key"]
             value = request["value"]
-            start_node_id = request.get("start_node_id", self.node.node_id)
+            start_node_id = request.get("start_node_id", node.node_id)
             ttl = request.get("ttl", None)
-            logging.error(f"HERE {key}, {value}, {start_node_id}, {ttl}")
-            self.node.chord_put(key, value, start_node_id, ttl)
+            node.chord_put(key, value, start_node_id, ttl, request.get("version"), request.get("log"), request.get("sender"),
+                           request.get("via"))
             return {"status": "OK"}
 
         elif cmd == "GET":
             key = request["key"]
             if key == "*":
                 # Get all keys
-                start_node_id = request.get("start_node_id", self.node.node_id)
-                result = self.node.chord_get_all(start_node_id)
+                start_node_id = request.get("start_node_id", node.node_id)
+                result = node.chord_get_all(start_node_id)
                 return {"value": result}
             
-            start_node_id = request.get("start_node_id", self.node.node_id)
+            if request.get("local"):
+                # Replica read from a hedged reader or a hot key reader: answer from our own copy
+                result, id_, version, records = node.chord_get_local(key, request.get("owner"))
+                return {"id": id_, "value": result, "version": version, "value_versions": records,
+                        "inflight": self.inflight - 1}
+
+            start_node_id = request.get("start_node_id", node.node_id)
             ttl = request.get("ttl", None)
-            result, id_ = self.node.chord_get(key, start_node_id, ttl)
-            print(f"[Node {self.node.node_id}] GET {key} -> {result}")
-            return {"id": id_, "value": result}
+            result, id_ = node.chord_get(key, start_node_id, ttl)
+            request_log.debug("[Node %s] GET %s -> %s", node.node_id, key, result)
+            response = {"id": id_, "value": result}
+            # A hot key can be read from any of these, see ChordNode._refresh_hot_keys
+            replicas = node.advertised_replicas(key)
+            if replicas:
+                response["replicas"] = replicas
+            return response
+
+        elif cmd == "SCAN":
+            if "until" in request:
+                # Our part of a scan fanned out by another node
+                return node.chord_scan_tree(request)
+            return node.chord_scan(request.get("prefix"), request.get("contains"), request.get("range"),
+                                   request.get("limit", SCAN_PAGE), request.get("token"))
+
+        elif cmd == "WATCH":
+            # A client subscribing to the changes of a key or a key id range
+            # (neither: every key); its connection streams them from now on
+            key_range = request.get("range")
+            if key_range is not None and len(key_range) != 2:
+                return {"status": "WRONG_PARAMS"}
+            watch = {
+                "id": uuid.uuid4().hex,
+                "key": request.get("key"),
+                "range": key_range,
+                "subscriber": [node.node_id, node.host, node.port],
+            }
+            # Open before registering: an owner may push right away
+            self.watch_streams.open(watch["id"])
+            return {"status": "OK", "watch": watch, "owners": node.chord_watch(watch)}
+
+        elif cmd == "WATCH_REGISTER":
+            # An entry node registering or renewing a watch of our range
+            return node.chord_watch_register(request["watch"])
+
+        elif cmd == "WATCH_EVENT":
+            # Changes an owner pushes for the watches of our clients
+            return {"status": "OK", "gone": self.watch_streams.deliver(request.get("events", []))}
 
         elif cmd == "DELETE":
             key = request.get("key", None)
@@ -162,60 +540,183 @@ class ChordServer:
             if not key or not value:
                 return {"status": "WRONG_PARAMS"}
             
-            start_node_id = request.get("start_node_id", self.node.node_id)
+            start_node_id = request.get("start_node_id", node.node_id)
             ttl = request.get("ttl", None)
-            return {"status": self.node.chord_delete(key, value, start_node_id, ttl)}
+            return {"status": node.chord_delete(key, value, start_node_id, ttl, request.get("version"), request.get("log"),
+                                                request.get("sender"), request.get("via"))}
+
+        elif cmd == "DELETE_BATCH":
+            # [[key, value], ...] of one owner, sent by a departing node
+            start_node_id = request.get("start_node_id", node.node_id)
+            deleted = node.chord_delete_batch(request.get("items", []), start_node_id, request.get("ttl"),
+                                              request.get("version"), request.get("log"))
+            return {"status": "OK", "deleted": deleted}
 
         elif cmd == "JOIN":
             new_node_host = request["host"]
             new_node_port = request["port"]
-            print(f"[Node {self.node.node_id}] New node wants to join via {new_node_host}:{new_node_port}")
-            succ, pred = self.node.chord_join(new_node_host, new_node_port)
+            membership_log.info("[Node %s] New node wants to join via %s:%s", node.node_id, new_node_host, new_node_port)
+            succ, pred = node.chord_join(new_node_host, new_node_port, request.get("node_id"))
             return {"successor": succ, "predecessor": pred}
 
+        elif cmd == "JOIN_RANGE":
+            return node.chord_join_range(request["node"], request.get("done", False))
+
+        elif cmd == "TRIM_RANGE":
+            return {"status": "OK", "dropped": node.chord_trim_range(request["bounds"], request["origin"], request.get("sender"))}
+
         elif cmd == "DEPART":
-            self.node.depart()
+            if not request.get("local_only"):
+                self._depart_siblings()
+            self.depart_all()
             return {"status": "departing"}
 
+        elif cmd == "WORKER_NODES":
+            # Asked by a sibling worker that got a request for a node id it does not know
+            return {"nodes": list(self.nodes) + list(self.moved)}
+
         elif cmd == "UPDATE_SUCCESSOR":
-            print(f"[Node {self.node.node_id}] Updating successor to {request['new_succ_id']}, {request}")
-            self.node._update_successor((request["new_succ_id"],
-                                    request["new_succ_host"],
-                                    request["new_succ_port"]))
+            membership_log.info("[Node %s] Updating successor to %s", node.node_id, request["new_succ_id"])
+            new_successor = (request["new_succ_id"], request["new_succ_host"], request["new_succ_port"])
+            if request.get("join"):
+                # Sent by a node that just joined after us, see ChordNode.accept_successor
+                return {"status": node.accept_successor(new_successor)}
+            node._update_successor(new_successor)
             return {"status": "OK"}
 
         elif cmd == "UPDATE_PREDECESSOR":
-            print(f"[Node {self.node.node_id}] Updating predecessor to {request['new_pred_id']}, {request}")
-            self.node._update_predecessor((request["new_pred_id"],
+            membership_log.info("[Node %s] Updating predecessor to %s", node.node_id, request["new_pred_id"])
+            node._update_predecessor((request["new_pred_id"],
                                     request["new_pred_host"],
                                     request["new_pred_port"]))
             return {"status": "OK"}
 
+        elif cmd == "TRANSFER_KEYS" and "range" in request:
+            # A page of a range moving to a rebalancing predecessor
+            start, end = request["range"]
+            return node.chord_transfer_range(start, end, request.get("after"), request.get("limit", REBALANCE_PAGE))
+
         elif cmd == "TRANSFER_KEYS":
             new_node_id = request["new_node_id"]
             next_node_id = request.get("next_node_id", None)
             ttl = request.get("ttl", None)
-            logging.info(f"[Node {self.node.node_id}] TTL TRANSFER_KEYS {ttl}")
+            transfer_log.debug("[Node %s] TTL TRANSFER_KEYS %s", node.node_id, ttl)
             if ttl == 0:
-                return {"keys": []}
-            serialize_data = self.node.chord_transfer_keys(new_node_id, next_node_id, ttl)
+                return {"keys": {}}
+            serialize_data = node.chord_transfer_keys(new_node_id, next_node_id, ttl)
             return {"keys": serialize_data}
         
+        elif cmd == "REPL_LOG":
+            # A replica catching up with our log, see ChordNode._catch_up
+            return node.chord_repl_log(request.get("after", 0), request.get("epoch"), request.get("limit", REPL_LOG_PAGE))
+
         elif cmd == "MOVE_ALL_KEYS":
             # Our custom chain departure backward step:
             ttl = request.get("ttl", 1)
             data_store = _deserialize_from_json(request.get("data_store", None))
-            logging.info(f"data store: {data_store}")
-            self.node.chord_move_all_keys(data_store, ttl)
+            transfer_log.debug("[Node %s] MOVE_ALL_KEYS of %s key ids", node.node_id, len(data_store))
+            node.chord_move_all_keys(data_store, ttl, request.get("deleted"), request.get("watches"))
             return {"status": "OK"}
         
+        elif cmd == "LOAD_REPORT":
+            return node.chord_load_report(request.get("holder"), request.get("lock", False),
+                                          request.get("unlock", False), request.get("rank"))
+
+        elif cmd == "HOT_REPLICA":
+            return {"status": node.chord_hot_replica(request["key"], request.get("value", []), request.get("version"),
+                                                     request.get("lease_s", 5.0), request["owner"])}
+
+        elif cmd == "HOT_RETIRE":
+            return {"status": node.chord_hot_retire(request["key"])}
+
+        elif cmd == "HOT_REPORT":
+            node.chord_hot_report(request.get("counts", {}))
+            return {"status": "OK"}
+
+        elif cmd == "REPAIR":
+            return {"status": node.chord_repair(request["key"], request.get("value", []), request.get("value_versions"))}
+
+        elif cmd == "REPLICATE_RANGE":
+            data_store = _deserialize_from_json(request.get("data_store", {}))
+            node.chord_replicate_range(data_store, request["origin"], request.get("ttl", 1))
+            return {"status": "OK"}
+
+        elif cmd == "STATS":
+            # Latency histograms, counters and gauges of this server
+            stats = self.metrics.snapshot()
+            admission = self.admission.snapshot()
+            if request.get("reset"):
+                self.metrics.reset()
+                self.admission.reset()
+            response = {"node_id": node.node_id, "stats": stats, "admission": admission}
+            if self.compression is not None:
+                response["compression"] = self.compression.snapshot()
+            return response
+
+        elif cmd == "TRACE":
+            # Spans of a trace from this server, or from the whole ring with "ring";
+            # without a trace_id, the latest client requests handled here
+            trace_id = request.get("trace_id")
+            if not trace_id:
+                return {"recent": self.tracer.recent(request.get("limit", 100))}
+            if request.get("ring"):
+                spans = node.chord_trace(trace_id, request.get("start_node_id", node.node_id))
+            else:
+                spans = self.tracer.find(trace_id)
+            spans.sort(key=lambda span: span["start"])
+            return {"trace_id": trace_id, "summary": tracing.summarize(spans), "spans": spans}
+
+        elif cmd == "PROFILE_START":
+            # Sample the stacks of every thread of this process until PROFILE_STOP
+            interval = request.get("interval_ms", profiler.INTERVAL * 1000) / 1000
+            if not profiler.start(interval, request.get("max_seconds", profiler.MAX_SECONDS)):
+                return {"error": "Profiler already running"}
+            return {"status": "OK", "interval_ms": interval * 1000}
+
+        elif cmd == "PROFILE_STOP":
+            # Statistics of the run; the collapsed stacks are saved under profiles/
+            # and, with "inline", returned too
+            run = profiler.stop()
+            if run is None:
+                return {"error": "Profiler not running"}
+            os.makedirs("profiles", exist_ok=True)
+            path = os.path.abspath(f"profiles/{node.port}-{int(run.started)}.folded")
+            collapsed = run.collapsed()
+            with open(path, "w") as f:
+                f.write(collapsed)
+            response = {"node_id": node.node_id, "path": path, "profile": run.report(request.get("top", 10))}
+            if request.get("inline"):
+                response["collapsed"] = collapsed
+            return response
+
+        elif cmd == "RECORD_START":
+            # Record client data requests for replay.py under records/, to the
+            # file named "path" there. Only a new file name: any client may ask
+            if self.recorder is not None:
+                return {"error": f"Already recording to {self.recorder.path}"}
+            name = request.get("path") or f"{node.port}-{int(time.time())}.chrec"
+            if os.path.basename(name) != name or name in (".", ".."):
+                return {"error": "path must be a file name, it is created under records/"}
+            path = os.path.abspath(os.path.join("records", name))
+            if os.path.exists(path):
+                return {"error": f"{path} exists"}
+            os.makedirs("records", exist_ok=True)
+            self.recorder = WorkloadRecorder(path)
+            return {"status": "OK", "path": self.recorder.path}
+
+        elif cmd == "RECORD_STOP":
+            recorder, self.recorder = self.recorder, None
+            if recorder is None:
+                return {"error": "Not recording"}
+            return {"status": "OK", "path": recorder.path, "records": recorder.stop()}
+
         elif cmd == "GET_OVERLAY":
             if "start_node_id" not in request:
-                start_node_id = self.node.node_id
+                start_node_id = node.node_id
             else:
                 start_node_id = request["start_node_id"]
             
-            return {"overlay": self.node.chord_overlay(start_node_id)}
+            return {"overlay": node.chord_overlay(start_node_id)}
             
         else:
             return {"error": f"Unknown command '{cmd}'"}
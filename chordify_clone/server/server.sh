@@ -1,10 +1,12 @@
 #!/bin/bash
 
-# Usage: ./server.sh [replication_factor] [consistency]
-# Example: ./server.sh 3 l
+# Usage: ./server.sh [replication_factor] [consistency] [id_bits] [vnodes]
+# Example: ./server.sh 3 l 32 8
 
 REPLICATION_FACTOR="$1"
 CONSISTENCY="$2"
+ID_BITS="$3"
+VNODES="$4"
 
 # If not provided, fallback to defaults
 if [ -z "$REPLICATION_FACTOR" ]; then
@@ -15,17 +17,38 @@ if [ -z "$CONSISTENCY" ]; then
   CONSISTENCY="l"
 fi
 
+if [ -z "$ID_BITS" ]; then
+  ID_BITS=8
+fi
+
+if [ -z "$VNODES" ]; then
+  VNODES=1
+fi
+
+# Wait (up to 60s) until the node on port $1 printed that it joined the ring
+wait_ready() {
+  local log="logs/${1}_${CONSISTENCY}_${REPLICATION_FACTOR}.log"
+  for _ in $(seq 600); do
+    grep -q "\[Main\] Node .* ready" "$log" 2>/dev/null && return 0
+    sleep 0.1
+  done
+  echo "Server on port $1 is not ready, see $log"
+}
+
 echo "Starting 10 servers with k=$REPLICATION_FACTOR and consistency=$CONSISTENCY..."
+rm -f logs/500[0-9]_${CONSISTENCY}_${REPLICATION_FACTOR}.log
 # Start the first server
 python main.py \
   --port 5000 \
   --replication-factor "$REPLICATION_FACTOR" \
   --replication-consistency "$CONSISTENCY" \
+  --id-bits "$ID_BITS" \
+  --vnodes "$VNODES" \
   &> "logs/5000_${CONSISTENCY}_${REPLICATION_FACTOR}.log" &
-# echo "Server 0 on port 5000 started..."
-sleep 2  # Give the first server time to stabilize
+wait_ready 5000
 
-# Start servers 1..9, bootstrap to first server
+# Start servers 1..9 at once, bootstrap to first server: concurrent joins
+# into the same range are serialized by the node that owns it (JOIN_RANGE)
 for i in {1..9}; do
   port=$((5000 + i))
   python main.py \
@@ -34,10 +57,13 @@ for i in {1..9}; do
     --port "$port" \
     --replication-factor "$REPLICATION_FACTOR" \
     --replication-consistency "$CONSISTENCY"  \
+    --id-bits "$ID_BITS" \
+    --vnodes "$VNODES" \
     &> "logs/${port}_${CONSISTENCY}_${REPLICATION_FACTOR}.log" &
+done
 
-#   echo "Server $i on port $port started..."
-  sleep 1
+for i in {1..9}; do
+  wait_ready $((5000 + i))
 done
 
 echo "All servers started."
@@ -0,0 +1,222 @@
+# simulator.py
+#
+# Runs a whole ring inside one process on an InMemoryNetwork: every node is
+# a real ChordNode behind a ChordServer that never opens a socket. Reports,
+# per ring size, lookup hops, messages per operation, simulated latency and
+# the bytes moved around by joins and departures.
+#
+# Examples:
+#   python simulator.py --nodes 10 100 500 --keys 1000
+#   python simulator.py --nodes 200 --replication-factor 3 --latency-ms 5 --jitter-ms 2 --loss 0.01
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import random
+import statistics
+import sys
+import threading
+import time
+import utils
+from chord_node_simple import ChordNode
+from server import ChordServer
+from transport import InMemoryNetwork
+
+# Lookups are recursive, so each hop is a few nested Python calls
+RECURSION_LIMIT = 200000
+STACK_SIZE = 512 * 1024 * 1024
+
+# Commands that carry key ranges between nodes
+HANDOFF_CMDS = ("TRANSFER_KEYS", "JOIN_RANGE", "MOVE_ALL_KEYS", "REPLICATE_RANGE")
+
+class Cluster:
+    """A ring of in-process nodes; host 10.x.y.z, port 5000 for node i."""
+    def __init__(self, network, replication_factor, consistency, seed, bulk_join=True):
+        self.network = network
+        self.bulk_join = bulk_join
+        self.replication_factor = replication_factor
+        self.consistency = consistency
+        self.rng = random.Random(seed)
+        self.nodes = []
+
+    @staticmethod
+    def address(i):
+        return f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}", 5000
+
+    def add_node(self, i):
+        host, port = self.address(i)
+        node = ChordNode(host, port, None, None, self.replication_factor, self.consistency,
+                         stabilize_interval=0.0, transport=self.network.transport(host), bulk_join=self.bulk_join)
+        self.network.register(host, port, ChordServer(node, listen=False))
+        if self.nodes:
+            bootstrap = self.rng.choice(self.nodes)
+            node.join(bootstrap.host, bootstrap.port)
+        self.nodes.append(node)
+        return node
+
+    def remove_node(self, node):
+        node.depart()
+        self.network.unregister(node.host, node.port)
+        self.nodes.remove(node)
+
+    def stabilize(self, rounds=1):
+        for _ in range(rounds):
+            for node in list(self.nodes):
+                node.stabilize()
+                node.check_predecessor()
+                node._finger_tick()
+                node._catch_up_tick()
+
+    def client(self, msg):
+        """Send a client request to a random node."""
+        node = self.rng.choice(self.nodes)
+        return self.network.deliver(node.host, node.port, msg)
+
+def quiesce(baseline, timeout=10.0):
+    """Wait for the asynchronous sends of eventual consistency to finish."""
+    deadline = time.monotonic() + timeout
+    while threading.active_count() > baseline and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+def measure(network, baseline, op):
+    """Run op and return (messages, FIND_SUCCESSOR hops, simulated seconds)."""
+    before = network.stats()
+    network.reset_virtual_time()
+    op()
+    quiesce(baseline)
+    after = network.stats()
+    hops = after["by_cmd"].get("FIND_SUCCESSOR", 0) - before["by_cmd"].get("FIND_SUCCESSOR", 0)
+    return after["messages"] - before["messages"], hops, network.virtual_time()
+
+def handoff_bytes(before, after):
+    return sum(after["bytes_by_cmd"].get(c, 0) - before["bytes_by_cmd"].get(c, 0) for c in HANDOFF_CMDS)
+
+def summarize(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return {
+        "mean": round(statistics.mean(ordered), 3),
+        "p50": round(ordered[len(ordered) // 2], 3),
+        "p99": round(ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))], 3),
+        "max": round(ordered[-1], 3),
+    }
+
+def simulate(n, args):
+    network = InMemoryNetwork(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                              loss=args.loss, seed=args.seed)
+    cluster = Cluster(network, args.replication_factor, args.consistency, args.seed)
+    baseline = threading.active_count()
+    rng = random.Random(args.seed)
+    keys = [f"song-{i}" for i in range(args.keys)]
+
+    # Build the ring with half the keys already stored, so joins move data
+    start = time.perf_counter()
+    join_messages = []
+    cluster.add_node(0)
+    for key in keys[: len(keys) // 2]:
+        cluster.client({"cmd": "PUT", "key": key, "value": "v"})
+    before = network.stats()
+    for i in range(1, n):
+        messages, _, _ = measure(network, baseline, lambda: cluster.add_node(i))
+        join_messages.append(messages)
+    join_bytes = handoff_bytes(before, network.stats())
+    build_s = time.perf_counter() - start
+
+    before = network.stats()
+    cluster.stabilize(args.stabilize_rounds)
+    stabilize_messages = network.stats()["messages"] - before["messages"]
+
+    put = {"messages": [], "hops": [], "latency_ms": []}
+    for key in keys[len(keys) // 2:]:
+        msg = {"cmd": "PUT", "key": key, "value": "v"}
+        messages, hops, elapsed = measure(network, baseline, lambda: cluster.client(msg))
+        put["messages"].append(messages)
+        put["hops"].append(hops)
+        put["latency_ms"].append(elapsed * 1000)
+
+    get = {"messages": [], "hops": [], "latency_ms": []}
+    misses = 0
+    for _ in range(args.queries):
+        msg = {"cmd": "GET", "key": rng.choice(keys)}
+        result = {}
+        def op():
+            result.update(cluster.client(msg))
+        messages, hops, elapsed = measure(network, baseline, op)
+        misses += not result.get("value")
+        get["messages"].append(messages)
+        get["hops"].append(hops)
+        get["latency_ms"].append(elapsed * 1000)
+
+    before = network.stats()
+    departs = min(args.departs, n - 1)
+    for node in rng.sample(cluster.nodes[1:], departs):
+        measure(network, baseline, lambda: cluster.remove_node(node))
+    depart_bytes = handoff_bytes(before, network.stats())
+
+    stats = network.stats()
+    return {
+        "nodes": n,
+        "keys": args.keys,
+        "replication_factor": args.replication_factor,
+        "consistency": args.consistency,
+        "build_wall_s": round(build_s, 3),
+        "join": {
+            "messages": summarize(join_messages),
+            "handoff_bytes_per_join": round(join_bytes / max(n - 1, 1), 1),
+        },
+        "stabilize_messages_per_node_round": round(stabilize_messages / (n * max(args.stabilize_rounds, 1)), 2),
+        "put": {k: summarize(v) for k, v in put.items()},
+        "get": {k: summarize(v) for k, v in get.items()},
+        "get_misses": misses,
+        "depart": {
+            "departures": departs,
+            "handoff_bytes_per_depart": round(depart_bytes / departs, 1) if departs else None,
+        },
+        "network": {"messages": stats["messages"], "bytes": stats["bytes"], "dropped": stats["dropped"]},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process Chordify ring simulator")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[10, 100, 500], help="Ring sizes to simulate")
+    parser.add_argument("--keys", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--departs", type=int, default=5, help="Nodes that leave gracefully at the end")
+    parser.add_argument("--replication-factor", dest="replication_factor", type=int, default=1)
+    parser.add_argument("--consistency", type=str, default="l", choices=["l", "e"])
+    parser.add_argument("--stabilize-rounds", dest="stabilize_rounds", type=int, default=2)
+    parser.add_argument("--latency-ms", dest="latency_ms", type=float, default=1.0, help="One-way message latency")
+    parser.add_argument("--jitter-ms", dest="jitter_ms", type=float, default=0.0)
+    parser.add_argument("--loss", type=float, default=0.0, help="Probability that a message is dropped")
+    parser.add_argument("--id-bits", dest="id_bits", type=int, default=32, help="Wide enough that node ids do not collide")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    utils.set_id_bits(args.id_bits)
+    logging.basicConfig(level=logging.CRITICAL)
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    threading.stack_size(STACK_SIZE)
+
+    reports = []
+    def run():
+        # The nodes print every request they handle
+        with contextlib.redirect_stdout(io.StringIO()):
+            for n in args.nodes:
+                reports.append(simulate(n, args))
+
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+    threading.stack_size(0)
+
+    out = json.dumps(reports, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    print(out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# tracing.py
+#
+# End-to-end request tracing. A client request gets a trace id when a server
+# first handles it; every internal message sent while handling it carries the
+# same "trace_id" and a "hop" one higher than the request that caused it.
+# Client requests are the only messages without a "hop".
+#
+# Each server keeps the spans it saw in a ring buffer: one "dispatch" span
+# per request handled and one "send" span per request sent to a peer.
+# The TRACE command collects them by trace id, from one server or the ring.
+#
+# A request's deadline travels the same way: every message carries the
+# "deadline_ms" its sender waits for the answer, and the requests sent
+# while handling it must be answered within it (see ChordNode._request).
+
+import functools
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+
+_context = threading.local()
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+def current():
+    """(trace_id, hop) of the request this thread is handling, or None."""
+    return getattr(_context, "trace", None)
+
+def set_current(trace):
+    _context.trace = trace
+
+def deadline():
+    """time.monotonic() by which the request this thread is handling must be answered, or None."""
+    return getattr(_context, "deadline", None)
+
+def set_deadline(deadline):
+    _context.deadline = deadline
+
+def traced(target):
+    """
+    Wrap a thread target so it runs within the caller's trace. Not within
+    its deadline: background work outlives the request that started it.
+    A target run inline (see admission.BoundedExecutor) gets the caller's
+    context back when it returns.
+    """
+    trace = current()
+
+    @functools.wraps(target)
+    def run(*args, **kwargs):
+        outer = current(), deadline()
+        set_current(trace)
+        set_deadline(None)
+        try:
+            return target(*args, **kwargs)
+        finally:
+            set_current(outer[0])
+            set_deadline(outer[1])
+    return run
+
+class Tracer:
+    """Ring buffer of the last `capacity` spans of a server, shared by its vnodes."""
+    def __init__(self, capacity: int = 10000):
+        self.spans = deque(maxlen=capacity)
+        self._ids = itertools.count()
+
+    def record(self, kind, trace, node_id, addr, cmd, start, start_ns, ok=True, peer=None):
+        # deque.append is atomic, no lock needed
+        self.spans.append({
+            "id": f"{addr}#{next(self._ids)}",
+            "trace_id": trace[0],
+            "hop": trace[1],
+            "span": kind,
+            "node": node_id,
+            "addr": addr,
+            "peer": peer,
+            "cmd": cmd,
+            "start": start,
+            "us": (time.perf_counter_ns() - start_ns) // 1000,
+            "ok": ok,
+        })
+
+    def find(self, trace_id):
+        return [span for span in list(self.spans) if span["trace_id"] == trace_id]
+
+    def recent(self, limit: int = 100):
+        """The last `limit` dispatch spans of client requests (hop 0)."""
+        roots = [span for span in list(self.spans) if span["span"] == "dispatch" and span["hop"] == 0]
+        return roots[-limit:]
+
+def summarize(spans):
+    """
+    Hops, messages and total time of a trace, and the hop that spent the
+    most time itself: a dispatch span minus the sends it made, which are the
+    spans of the same server one hop further.
+    """
+    dispatches = [s for s in spans if s["span"] == "dispatch"]
+    sends = [s for s in spans if s["span"] == "send"]
+    for d in dispatches:
+        waited = sum(s["us"] for s in sends if s["addr"] == d["addr"] and s["node"] == d["node"] and s["hop"] == d["hop"] + 1)
+        d["self_us"] = max(d["us"] - waited, 0)
+    root = next((d for d in dispatches if d["hop"] == 0), None)
+    slowest = max(dispatches, key=lambda d: d["self_us"], default=None)
+    return {
+        "spans": len(spans),
+        "messages": len(sends),
+        "max_hop": max((s["hop"] for s in spans), default=0),
+        "total_us": root["us"] if root else None,
+        "slowest": {k: slowest[k] for k in ("addr", "node", "cmd", "hop", "self_us")} if slowest else None,
+    }
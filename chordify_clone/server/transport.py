@@ -0,0 +1,288 @@
+# transport.py
+#
+# How a ChordNode reaches its peers. TcpTransport is the real protocol;
+# InMemoryNetwork hands messages straight to ChordServer._dispatch of servers
+# living in the same process, for simulations with hundreds of nodes.
+#
+# A transport's request(host, port, message_dict, timeout=None) returns the
+# decoded response (waiting at most timeout seconds, if it has timeouts), raises OSError when the peer cannot be reached and ValueError
+# when the peer answered something that is not JSON. UnixTransport speaks the
+# same framing to the worker processes of one node (see main.py --workers).
+#
+# Every server also listens on a Unix socket named after its host and port
+# (ipc_path), in a directory only its user can enter (private_ipc_dir), and
+# TcpTransport uses it for peers on the same host: no TCP handshake, no
+# loopback TCP stack per message. With several workers, peers use worker 0's,
+# which relays to the others.
+#
+# Over TCP, large frames may be compressed, see compression.py.
+
+import json
+import os
+import random
+import socket
+import stat
+import tempfile
+import threading
+import time
+from compression import encode_frame, decode_prefix, decode_payload
+
+# Largest read from a socket at a time
+RECV_SIZE = 256 * 1024
+
+# Hosts that are always this machine
+LOCAL_HOSTS = frozenset(("127.0.0.1", "localhost", "::1"))
+# Seconds a port whose Unix socket could not be reached is reached over TCP
+IPC_RETRY = 30.0
+
+def private_ipc_dir(ipc_dir=None):
+    """
+    The directory of the Unix sockets: ipc_dir, or chordify-<uid> in the
+    temp directory, created with mode 0700 if missing. A directory another
+    user owns, or that others may write to, is refused: whoever can write
+    there can pose as any node on this host.
+    """
+    path = ipc_dir or os.path.join(tempfile.gettempdir(), f"chordify-{os.getuid()}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o022:
+        raise PermissionError(f"{path} is not a directory of ours that only we can write to")
+    return path
+
+def ipc_path(ipc_dir, host, port, worker=0):
+    """The Unix socket worker `worker` of the node on `host:port` listens on."""
+    return os.path.join(ipc_dir, f"chordify-{host}-{port}-{worker}.sock")
+
+class TcpTransport:
+    """
+    Length-prefixed JSON over a new connection per request. With ipc_dir
+    set, a peer on one of local_hosts that listens on a Unix socket in
+    ipc_dir is reached through it; TCP is the fallback when it does not.
+    With a CompressionPolicy, large frames over TCP may be compressed.
+    With ring_secret, requests over TCP carry it ("ring_key"), so the
+    server counts them as internal (see admission.py).
+    """
+    def __init__(self, connect_timeout: float = 1.0, read_timeout: float = 5.0, metrics=None,
+                 ipc_dir: str = None, local_hosts=(), compression=None, ring_secret=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.metrics = metrics
+        self.ipc_dir = ipc_dir
+        self.local_hosts = LOCAL_HOSTS | set(local_hosts)
+        # (host, port) -> when its Unix socket last failed us
+        self._ipc_failed = {}
+        self.compression = compression
+        self.ring_secret = ring_secret
+        # Peers that told us they read compressed frames
+        self._compress_peers = set()
+
+    @staticmethod
+    def clock() -> float:
+        """What round trip times are measured with."""
+        return time.perf_counter()
+
+    def _connect(self, host, port):
+        """A connected socket, and whether it is a Unix socket."""
+        if self.ipc_dir is not None and host in self.local_hosts:
+            failed = self._ipc_failed.get((host, port))
+            if failed is None or time.monotonic() - failed > IPC_RETRY:
+                s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                s.settimeout(self.connect_timeout)
+                try:
+                    s.connect(ipc_path(self.ipc_dir, host, port))
+                    if self.metrics is not None:
+                        self.metrics.inc("peer_ipc_requests")
+                    return s, True
+                except OSError:
+                    # No socket (--no-ipc), or one left behind by a process that died
+                    s.close()
+                    self._ipc_failed[(host, port)] = time.monotonic()
+        return socket.create_connection((host, port), timeout=self.connect_timeout), False
+
+    def request(self, host, port, message_dict, timeout=None):
+        peer = (host, port)
+        s, local = self._connect(host, port)
+        if self.ring_secret is not None and not local:
+            message_dict = dict(message_dict, ring_key=self.ring_secret)
+        try:
+            s.settimeout(self.read_timeout if timeout is None else timeout)
+            # Bytes over a Unix socket cost no network, only the compression would cost
+            compression = None if local else self.compression
+            response, bytes_out, bytes_in, accepts = exchange(s, message_dict, compression,
+                                                              peer in self._compress_peers)
+        finally:
+            s.close()
+        if compression is not None:
+            if accepts:
+                self._compress_peers.add(peer)
+            else:
+                self._compress_peers.discard(peer)
+
+        if self.metrics is not None:
+            self.metrics.inc("peer_bytes_out", None, bytes_out)
+            self.metrics.inc("peer_bytes_in", None, bytes_in)
+        return response
+
+class UnixTransport:
+    """The same framing over a Unix domain socket, between processes of one host. Peers are socket paths."""
+    def __init__(self, timeout: float = 5.0):
+        self.timeout = timeout
+
+    def request(self, path, message_dict):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.settimeout(self.timeout)
+            s.connect(path)
+            return exchange(s, message_dict)[0]
+        finally:
+            s.close()
+
+def recv_exact(s, n):
+    """n bytes from s, or fewer if the peer closed the connection first."""
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = s.recv(min(n - len(buf), RECV_SIZE))
+        if not chunk:
+            break
+        buf += chunk
+    return bytes(buf)
+
+def exchange(s, message_dict, compression=None, compress=False):
+    """
+    Send one length-prefixed JSON request on a connected socket and read the
+    response. With a CompressionPolicy the peer may compress its response,
+    and with compress too (the peer said it reads compressed frames) so may
+    we. Returns (response, bytes sent, bytes received, whether the peer
+    reads compressed frames).
+    """
+    # 1) Convert message_dict to bytes and frame it: 8 bytes of length and flags, big-endian
+    data_bytes = json.dumps(message_dict).encode('utf-8')
+    prefix, payload = encode_frame(data_bytes, compression if compress else None, compression is not None)
+
+    # 2) Send the length and the data
+    s.sendall(prefix)
+    s.sendall(payload)
+
+    # 3) Read the length of the response (8 bytes)
+    response_length_bytes = recv_exact(s, 8)
+    if len(response_length_bytes) < 8:
+        return {}, 8 + len(payload), 0, False
+    response_length, compressed, accepts = decode_prefix(response_length_bytes)
+
+    # 4) Read the entire response, deserialize it and return
+    response_data = recv_exact(s, response_length)
+    response = json.loads(decode_payload(response_data, compressed).decode('utf-8'))
+    return response, 8 + len(payload), 8 + len(response_data), accepts
+
+class InMemoryNetwork:
+    """
+    A simulated network between ChordServers of the same process.
+    Messages are JSON encoded and decoded like on the wire, delayed by
+    latency +- jitter (seconds, per direction) and dropped with probability
+    `loss`. All randomness comes from `seed`.
+
+    Latency is not slept by default: it is added to a per-thread virtual
+    clock, which for synchronous calls is the latency of the critical path.
+    Pass real_time=True to actually sleep.
+
+    link_latency(src_host, dst_host), if given, is the one-way latency
+    between two hosts, e.g. from their racks or coordinates; messages
+    without a known sender (from clients) get `latency`.
+    """
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, loss: float = 0.0,
+                 seed: int = 0, real_time: bool = False, link_latency=None):
+        self.latency = latency
+        self.link_latency = link_latency
+        self.jitter = jitter
+        self.loss = loss
+        self.real_time = real_time
+        self._rng = random.Random(seed)
+        self._servers = {}
+        self._lock = threading.Lock()
+        self._clock = threading.local()
+        self.reset_stats()
+
+    def register(self, host, port, server):
+        self._servers[(host, port)] = server
+
+    def unregister(self, host, port):
+        self._servers.pop((host, port), None)
+
+    def transport(self, origin=None):
+        """A transport for the node on host `origin`."""
+        return InMemoryTransport(self, origin)
+
+    def reset_stats(self):
+        with self._lock:
+            self.messages = 0
+            self.bytes = 0
+            self.dropped = 0
+            self.by_cmd = {}
+            self.bytes_by_cmd = {}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "messages": self.messages,
+                "bytes": self.bytes,
+                "dropped": self.dropped,
+                "by_cmd": dict(self.by_cmd),
+                "bytes_by_cmd": dict(self.bytes_by_cmd),
+            }
+
+    def virtual_time(self) -> float:
+        """Simulated seconds spent in requests made by the calling thread."""
+        return getattr(self._clock, "elapsed", 0.0)
+
+    def reset_virtual_time(self):
+        self._clock.elapsed = 0.0
+
+    def _delay(self, origin=None, host=None):
+        latency = self.link_latency(origin, host) if self.link_latency and origin else self.latency
+        with self._lock:
+            delay = latency + (self._rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+            lost = self.loss and self._rng.random() < self.loss
+        return max(delay, 0.0), lost
+
+    def _advance(self, seconds):
+        if self.real_time:
+            time.sleep(seconds)
+        self._clock.elapsed = getattr(self._clock, "elapsed", 0.0) + seconds
+
+    def deliver(self, host, port, message_dict, origin=None):
+        data = json.dumps(message_dict)
+        cmd = message_dict.get("cmd")
+        delay, lost = self._delay(origin, host)
+        with self._lock:
+            self.messages += 1
+            self.bytes += len(data)
+            self.by_cmd[cmd] = self.by_cmd.get(cmd, 0) + 1
+            self.bytes_by_cmd[cmd] = self.bytes_by_cmd.get(cmd, 0) + len(data)
+            if lost:
+                self.dropped += 1
+        server = self._servers.get((host, port))
+        if server is None:
+            raise ConnectionRefusedError(f"{host}:{port} is not registered")
+        self._advance(delay)
+        if lost:
+            raise TimeoutError(f"message to {host}:{port} lost")
+
+        response = json.dumps(server._dispatch(json.loads(data)))
+        with self._lock:
+            self.bytes += len(response)
+            self.bytes_by_cmd[cmd] = self.bytes_by_cmd.get(cmd, 0) + len(response)
+        self._advance(delay)
+        return json.loads(response)
+
+class InMemoryTransport:
+    """Transport of one node on an InMemoryNetwork."""
+    def __init__(self, network: InMemoryNetwork, origin=None):
+        self.network = network
+        self.origin = origin
+
+    def clock(self) -> float:
+        # Round trips take simulated time, not wall time
+        return self.network.virtual_time()
+
+    def request(self, host, port, message_dict, timeout=None):
+        return self.network.deliver(host, port, message_dict, self.origin)
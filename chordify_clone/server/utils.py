@@ -1,44 +1,146 @@
 import hashlib
+import os
+from bisect import bisect_left, insort
 
-M = 8
+# Number of bits in the identifier space. Every node of a ring must use the
+# same value; it can be changed through CHORD_ID_BITS or set_id_bits().
+M = int(os.environ.get("CHORD_ID_BITS", 8))
+MAX_ID_BITS = 160  # SHA-1 gives us at most 160 bits
+RING_SIZE = 2**M
+ID_MASK = RING_SIZE - 1
 BUFF_SIZE = 1024
 
+def set_id_bits(bits: int):
+    """
+    Configure the size of the identifier space to 2^bits.
+    Must be called before any node is created.
+    """
+    global M, RING_SIZE, ID_MASK
+    if not 1 <= bits <= MAX_ID_BITS:
+        raise ValueError(f"id bits must be in [1, {MAX_ID_BITS}], got {bits}")
+    M = bits
+    RING_SIZE = 2**M
+    ID_MASK = RING_SIZE - 1
+
 def chord_hash(key: str) -> int:
     """
     Returns an integer in [0, 2^M).
-    Use SHA-1 or something similar for real usage.
+    We use SHA-1 and keep the last M bits of the digest.
+    """
+    return int.from_bytes(hashlib.sha1(key.encode()).digest(), byteorder='big') & ID_MASK
+
+def vnode_id(host: str, port: int, index: int = 0) -> int:
+    """
+    Identifier of the index-th virtual node of host:port.
+    Virtual node 0 keeps the plain host:port position.
+    """
+    if index == 0:
+        return chord_hash(f"{host}:{port}")
+    return chord_hash(f"{host}:{port}#{index}")
+
+def id_to_bytes(node_id: int) -> bytes:
+    """Fixed width big-endian encoding of an identifier."""
+    return node_id.to_bytes((M + 7) // 8, byteorder='big')
+
+def id_from_bytes(data: bytes) -> int:
+    return int.from_bytes(data, byteorder='big') & ID_MASK
+
+def to_id(value) -> int:
+    """
+    Normalize an identifier coming from the wire (int, bytes or a
+    decimal string such as a JSON object key) into an int in [0, 2^M).
     """
-    # For demonstration, we'll just use SHA-1 and take the last M bits
-    # but you could do a simpler approach for demonstration.
-    h = hashlib.sha1(key.encode()).hexdigest()
-    # Convert hex -> int, then mod 2^M
-    return int(h, 16) % (2**M)
+    if isinstance(value, int):
+        return value & ID_MASK
+    if isinstance(value, (bytes, bytearray)):
+        return id_from_bytes(value)
+    return int(value) & ID_MASK
 
 def in_interval(key_id: int, start_id: int, end_id: int, inclusive=False):
     """
     Check if key_id is in interval (start_id, end_id) on a circular ring.
     If inclusive=True, end boundary is included.
-    """
-    assert isinstance(key_id, int), f"key_id must be an int, got {type(key_id)}"
-    assert isinstance(start_id, int), f"start_id must be an int, got {type(start_id)}"
-    assert isinstance(end_id, int), f"end_id must be an int, got {type(end_id)}"
-    
-    start_id %= (2**M)
-    end_id %= (2**M)
-    key_id %= (2**M)
 
+    This is on the hot path of every lookup, so there are no checks here:
+    all ids must already be ints in [0, 2^M) (see to_id).
+    """
     if start_id < end_id:
         # Normal interval
         if inclusive:
             return start_id < key_id <= end_id
-        else:
-            return start_id < key_id < end_id
-    else:
-        # Interval wraps around the ring
-        if inclusive:
-            return not (end_id < key_id <= start_id)
-        else:
-            return not (end_id < key_id < start_id)
+        return start_id < key_id < end_id
+    # Interval wraps around the ring
+    if inclusive:
+        return not (end_id < key_id <= start_id)
+    return not (end_id < key_id < start_id)
+
+def in_interval_checked(key_id, start_id, end_id, inclusive=False):
+    """Same as in_interval but accepts any id representation."""
+    return in_interval(to_id(key_id), to_id(start_id), to_id(end_id), inclusive)
+
+def ring_distance(start_id: int, end_id: int) -> int:
+    """Clockwise distance from start_id to end_id."""
+    return (end_id - start_id) & ID_MASK
+
+class SortedRing:
+    """
+    Sorted view of ring members, used when the full membership is known
+    (virtual nodes, simulator, balance reports). Answers "who owns key_id"
+    with a binary search instead of walking successor pointers.
+    Members are (node_id, host, port) tuples.
+    """
+    def __init__(self, members=()):
+        self._ids = []
+        self._nodes = {}
+        for node_info in members:
+            self.add(node_info)
+
+    def add(self, node_info):
+        node_id = node_info[0]
+        if node_id not in self._nodes:
+            insort(self._ids, node_id)
+        self._nodes[node_id] = tuple(node_info)
+
+    def remove(self, node_id):
+        if self._nodes.pop(node_id, None) is not None:
+            self._ids.pop(bisect_left(self._ids, node_id))
+
+    def owner(self, key_id: int):
+        """The first node clockwise from key_id (inclusive)."""
+        if not self._ids:
+            return None
+        i = bisect_left(self._ids, key_id)
+        if i == len(self._ids):
+            i = 0
+        return self._nodes[self._ids[i]]
+
+    def predecessor(self, node_id: int):
+        """The first node strictly counter-clockwise from node_id."""
+        if not self._ids:
+            return None
+        i = bisect_left(self._ids, node_id) - 1
+        return self._nodes[self._ids[i]]
+
+    def successors(self, key_id: int, count: int):
+        """Up to `count` distinct nodes clockwise from key_id (inclusive)."""
+        if not self._ids:
+            return []
+        i = bisect_left(self._ids, key_id)
+        n = len(self._ids)
+        return [self._nodes[self._ids[(i + j) % n]] for j in range(min(count, n))]
+
+    def range_of(self, node_id: int):
+        """(predecessor_id, node_id], the part of the ring node_id is primary for."""
+        return self.predecessor(node_id)[0], node_id
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, node_id):
+        return node_id in self._nodes
+
+    def __iter__(self):
+        return (self._nodes[i] for i in self._ids)
 
 def _serialize_for_json(obj):
     if isinstance(obj, set):
@@ -0,0 +1,83 @@
+# vnode_balance.py
+#
+# Reports how evenly keys spread over physical servers as the number of
+# virtual nodes per server grows. Nothing needs to be running: ownership is
+# computed offline with the same hashing the servers use.
+#
+# Example:
+#   python vnode_balance.py --servers 10 --vnodes 1 2 4 8 16 32 --id-bits 32
+#   python vnode_balance.py --keys ../client/insert/*.txt
+
+import argparse
+import json
+import statistics
+import utils
+from utils import chord_hash, vnode_id, SortedRing, ring_distance
+
+def load_keys(paths, num_keys):
+    """Song titles from the experiment files, or synthetic ones if none are given."""
+    keys = []
+    for path in paths:
+        with open(path) as f:
+            keys.extend(line.strip() for line in f if line.strip())
+    if not keys:
+        keys = [f"song-{i}" for i in range(num_keys)]
+    return keys
+
+def build_ring(host, base_port, servers, vnodes):
+    ring = SortedRing()
+    for s in range(servers):
+        port = base_port + s
+        for i in range(vnodes):
+            ring.add((vnode_id(host, port, i), host, port))
+    return ring
+
+def balance_report(keys, host, base_port, servers, vnodes):
+    ring = build_ring(host, base_port, servers, vnodes)
+    per_server = {base_port + s: 0 for s in range(servers)}
+    for key in keys:
+        per_server[ring.owner(chord_hash(key))[2]] += 1
+
+    # Fraction of the identifier space each server is primary for
+    share = {port: 0 for port in per_server}
+    for node_id, _, port in ring:
+        pred_id, _ = ring.range_of(node_id)
+        share[port] += ring_distance(pred_id, node_id) or utils.RING_SIZE
+    share = {port: v / utils.RING_SIZE for port, v in share.items()}
+
+    counts = list(per_server.values())
+    mean = statistics.mean(counts)
+    return {
+        "vnodes": vnodes,
+        "positions": len(ring),
+        "max_over_mean": max(counts) / mean if mean else 0.0,
+        "min_over_mean": min(counts) / mean if mean else 0.0,
+        "cv": statistics.pstdev(counts) / mean if mean else 0.0,
+        "max_space_share": max(share.values()),
+        "keys_per_server": per_server,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Key distribution across servers vs. virtual nodes per server")
+    parser.add_argument("--servers", type=int, default=10)
+    parser.add_argument("--vnodes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--base-port", dest="base_port", type=int, default=5000)
+    parser.add_argument("--id-bits", dest="id_bits", type=int, default=utils.M)
+    parser.add_argument("--keys", type=str, nargs="*", default=[], help="Files with one key per line")
+    parser.add_argument("--num-keys", dest="num_keys", type=int, default=10000, help="Synthetic keys if no files are given")
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    args = parser.parse_args()
+
+    utils.set_id_bits(args.id_bits)
+    keys = load_keys(args.keys, args.num_keys)
+    reports = [balance_report(keys, args.host, args.base_port, args.servers, v) for v in args.vnodes]
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print(f"{len(keys)} keys, {args.servers} servers, M={utils.M}")
+        print(f"{'V':>5} {'positions':>10} {'max/mean':>9} {'min/mean':>9} {'cv':>7} {'max share':>10}")
+        for r in reports:
+            print(f"{r['vnodes']:>5} {r['positions']:>10} {r['max_over_mean']:>9.2f} "
+                  f"{r['min_over_mean']:>9.2f} {r['cv']:>7.3f} {r['max_space_share']:>10.3f}")
@@ -0,0 +1,147 @@
+# watch.py
+#
+# Change feeds (WATCH). A client keeps one connection open to any node, the
+# entry node; it registers the watch with the owners of the watched key or
+# range (see ChordNode.chord_watch), which push every change of their
+# primary range to it (WATCH_EVENT), and it streams them to the client.
+# Owners hold a watch under a lease the entry node renews while the client
+# stays connected, so watches of clients gone, or of nodes that failed,
+# expire on their own.
+
+import collections
+import queue
+import threading
+import time
+from utils import chord_hash, in_interval
+
+# Seconds an owner keeps a watch nobody renewed; entry nodes renew every third of it
+WATCH_LEASE = 60.0
+# Events per WATCH_EVENT message, and per frame to the client
+WATCH_BATCH = 100
+# Seconds between heartbeat frames on an idle stream, so a client gone is noticed
+WATCH_HEARTBEAT = 10.0
+# Events a stream holds for a client that reads them too slowly before it is dropped
+WATCH_QUEUE = 10000
+
+def overlaps(watch, start, end) -> bool:
+    """True if changes of key ids in (start, end] can match the watch."""
+    if watch.get("key") is not None:
+        return in_interval(chord_hash(watch["key"]), start, end, inclusive=True)
+    if watch.get("range") is None:
+        return True
+    low, high = watch["range"]
+    # Two arcs of the ring overlap iff one ends inside the other
+    return in_interval(high, start, end, inclusive=True) or in_interval(end, low, high, inclusive=True)
+
+class WatchTable:
+    """
+    Watches registered with an owner: id -> watch, a dict with the watched
+    "key" or key id "range" [start, end] (neither: the whole ring), and the
+    "subscriber" (node_id, host, port) events go to. Key watches are also
+    indexed by key, so a write only looks at the watches of its own key
+    and the range watches.
+    """
+    def __init__(self, lease: float = WATCH_LEASE):
+        self.lease = lease
+        # id -> (watch, expiry)
+        self._watches = {}
+        self._by_key = collections.defaultdict(set)
+        self._ranges = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._watches)
+
+    def add(self, watch):
+        """Register watch, or renew its lease."""
+        with self._lock:
+            self._watches[watch["id"]] = (watch, time.monotonic() + self.lease)
+            if watch.get("key") is not None:
+                self._by_key[watch["key"]].add(watch["id"])
+            else:
+                self._ranges.add(watch["id"])
+
+    def remove(self, watch_id):
+        with self._lock:
+            self._remove(watch_id)
+
+    def _remove(self, watch_id):
+        entry = self._watches.pop(watch_id, None)
+        if entry is None:
+            return
+        key = entry[0].get("key")
+        if key is None:
+            self._ranges.discard(watch_id)
+            return
+        ids = self._by_key[key]
+        ids.discard(watch_id)
+        if not ids:
+            del self._by_key[key]
+
+    def matching(self, key_id, key):
+        """Live watches a change of key (at key_id) must be pushed to; expired ones are dropped."""
+        now = time.monotonic()
+        found = []
+        with self._lock:
+            for watch_id in list(self._by_key.get(key, ())) + list(self._ranges):
+                watch, expiry = self._watches[watch_id]
+                if expiry < now:
+                    self._remove(watch_id)
+                elif watch.get("range") is None or in_interval(key_id, watch["range"][0], watch["range"][1], inclusive=True):
+                    found.append(watch)
+        return found
+
+    def intersecting(self, start, end):
+        """Live watches changes of (start, end] can match, to hand over with that range."""
+        now = time.monotonic()
+        with self._lock:
+            return [watch for watch, expiry in self._watches.values() if expiry >= now and overlaps(watch, start, end)]
+
+    def snapshot(self):
+        with self._lock:
+            return {"keys": sum(len(ids) for ids in self._by_key.values()), "ranges": len(self._ranges)}
+
+class WatchStreams:
+    """
+    Watches of the clients connected to this server: id -> queue of the
+    events owners pushed for it, drained by the connection streaming them.
+    A stream whose queue fills up is dropped: the owners are told it is
+    gone, and its connection closes once it sees it overflowed.
+    """
+    def __init__(self):
+        self._queues = {}
+        self._overflowed = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._queues)
+
+    def open(self, watch_id):
+        with self._lock:
+            return self._queues.setdefault(watch_id, queue.Queue(WATCH_QUEUE))
+
+    def close(self, watch_id):
+        with self._lock:
+            self._queues.pop(watch_id, None)
+            self._overflowed.discard(watch_id)
+
+    def overflowed(self, watch_id) -> bool:
+        with self._lock:
+            return watch_id in self._overflowed
+
+    def deliver(self, events):
+        """Queue events for their streams; returns the ids of the watches no longer streamed here."""
+        gone = set()
+        with self._lock:
+            for event in events:
+                q = self._queues.get(event["watch"])
+                if q is None:
+                    gone.add(event["watch"])
+                    continue
+                try:
+                    q.put_nowait(event)
+                except queue.Full:
+                    del self._queues[event["watch"]]
+                    self._overflowed.add(event["watch"])
+                    gone.add(event["watch"])
+        return sorted(gone)